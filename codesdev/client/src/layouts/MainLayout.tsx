@@ -1,4 +1,4 @@
-import { useCallback, useEffect, useMemo, useState } from "react";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import { useLocation, useNavigate, useParams } from "react-router-dom";
 import debounce from "lodash.debounce";
 import { Check, Loader2, AlertCircle } from "lucide-react";
@@ -13,6 +13,68 @@ import CommandPalette from "../components/CommandPallete";
 import { HardDrive, History } from "lucide-react";
 import VersionHistory from "../components/VersionHistory";
 
+// Flattens a tree into "folder/file.ext" -> content (what the execution sandbox sees) and id -> path
+const flattenFiles = (items: folderStructureData[]) => {
+    const files = new Map<string, string>();
+    const paths = new Map<number, string>();
+    const walk = (nodes: folderStructureData[], currentPath: string) => {
+        nodes.forEach(item => {
+            const itemPath = currentPath ? `${currentPath}/${item.name}` : item.name;
+            if (item.type === "file") {
+                files.set(itemPath, item.content || "");
+                paths.set(item.id, itemPath);
+            } else if (item.children) {
+                walk(item.children, itemPath);
+            }
+        });
+    };
+    walk(items, "");
+    return { files, paths };
+};
+
+// Every node by id as the server last saved it, with the folder it sits in
+type SavedNode = { name: string; type: "file" | "folder"; parent: number | null; content: string };
+const indexNodes = (items: folderStructureData[]) => {
+    const nodes = new Map<number, SavedNode>();
+    const walk = (list: folderStructureData[], parent: number | null) => {
+        list.forEach(item => {
+            nodes.set(item.id, { name: item.name, type: item.type, parent, content: item.content || "" });
+            if (item.children) walk(item.children, item.id);
+        });
+    };
+    walk(items, null);
+    return nodes;
+};
+
+// The PATCH operations that turn the saved tree into this one. Nodes are visited parents first so
+// new folders exist before anything goes into them, deletes come last so nodes moved out survive
+const diffTree = (saved: Map<number, SavedNode>, items: folderStructureData[]) => {
+    const ops: Record<string, unknown>[] = [];
+    const seen = new Set<number>();
+    const walk = (list: folderStructureData[], parent: number | null) => {
+        list.forEach(item => {
+            seen.add(item.id);
+            const before = saved.get(item.id);
+            const content = item.content || "";
+            if (!before) {
+                ops.push({ op: "upsert", id: item.id, name: item.name, type: item.type, parent,
+                           ...(item.type === "file" ? { content } : {}) });
+            } else {
+                if (before.parent !== parent) ops.push({ op: "move", id: item.id, parent });
+                if (before.name !== item.name) ops.push({ op: "rename", id: item.id, name: item.name });
+                if (item.type === "file" && before.content !== content) ops.push({ op: "upsert", id: item.id, content });
+            }
+            if (item.children) walk(item.children, item.id);
+        });
+    };
+    walk(items, null);
+    saved.forEach((node, id) => {
+        // Deleting a folder takes its children with it
+        if (!seen.has(id) && (node.parent === null || seen.has(node.parent))) ops.push({ op: "delete", id });
+    });
+    return ops;
+};
+
 export default function MainLayout() {
     const [currentUser, setCurrentUser] = useState<{ 
         username: string; 
@@ -41,6 +103,10 @@ export default function MainLayout() {
     const [isPublic, setIsPublic] = useState(false);
     const [isOwner, setIsOwner] = useState(false);
     const [unsavedChanges, setUnsavedChanges] = useState(false);
+    // Last state the server has, runs only upload what changed since
+    const savedFiles = useRef<Map<string, string>>(new Map());
+    const savedNodes = useRef<Map<number, SavedNode>>(new Map());
+    const savedRevision = useRef<number | null>(null);
     const [projectName, setProjectName] = useState<string>(
         location.state?.projectName || "Loading Project..."
     );
@@ -134,6 +200,9 @@ export default function MainLayout() {
                 
                 // Update live data
                 setData(result.file_tree);
+                savedFiles.current = flattenFiles(result.file_tree).files;
+                savedNodes.current = indexNodes(result.file_tree);
+                savedRevision.current = result.revision;
                 
                 // Exit Preview Mode
                 setPreviewData(null);
@@ -238,6 +307,9 @@ export default function MainLayout() {
                 if (res.ok) {
                     const project = await res.json();
                     setData(project.file_tree || []);
+                    savedFiles.current = flattenFiles(project.file_tree || []).files;
+                    savedNodes.current = indexNodes(project.file_tree || []);
+                    savedRevision.current = project.revision ?? null;
                     setProjectName(project.name);
                     setIsPublic(project.is_public);
                     setIsOwner(project.is_owner);
@@ -359,29 +431,48 @@ export default function MainLayout() {
 
             setIsSaving(true);
             try {
-                // Regular Live Save
-                const res = await fetch(`http://localhost:5001/api/projects/${projectId}`, {
-                    method: 'PUT',
-                    headers: { 'Content-Type': 'application/json', 'X-CSRF-TOKEN': getCSRF() },
-                    body: JSON.stringify({ file_tree: updatedTree }),
-                    credentials: 'include'
-                });
-    
-                if (res.ok) {
+                // Only what changed since the last save goes up, plus the automatic version (and the
+                // history it changes) when one is due, all in one request that the server applies together
+                const now = Date.now();
+                const snapshotDue = now - lastSnapshotTime > SNAPSHOT_INTERVAL;
+                const baseRevision = savedRevision.current;
+                const changes = baseRevision !== null ? diffTree(savedNodes.current, updatedTree) : null;
+                if (changes && changes.length === 0 && !snapshotDue) {
                     setUnsavedChanges(false);
+                    return;
                 }
 
-                // Automatic Versioning
-                const now = Date.now();
-                if (now - lastSnapshotTime > SNAPSHOT_INTERVAL) {
-                    await fetch(`http://localhost:5001/api/projects/${projectId}/version`, {
-                        method: "POST",
+                const extra: { op: string; data?: Record<string, unknown> }[] = [];
+                if (snapshotDue) {
+                    extra.push({ op: "version", data: { label: null } }); // Null label = "Auto-save"
+                    if (activeTab === "history") extra.push({ op: "history" });
+                }
+                const sendBatch = (save: { op: string; data: Record<string, unknown> }) =>
+                    fetch(`http://localhost:5001/api/projects/${projectId}/batch`, {
+                        method: 'POST',
                         headers: { 'Content-Type': 'application/json', 'X-CSRF-TOKEN': getCSRF() },
-                        body: JSON.stringify({ label: null }), // Null label = "Auto-save"
-                        credentials: "include"
+                        body: JSON.stringify({ ops: [save, ...extra] }),
+                        credentials: 'include'
                     });
-                    setLastSnapshotTime(now);
-                    if (activeTab === "history") fetchHistory();
+                const fullSave = { op: "update", data: { file_tree: updatedTree } };
+
+                let res = await sendBatch(changes
+                    ? { op: "patch", data: { base_revision: baseRevision, ops: changes } }
+                    : fullSave);
+                // The project moved on since our last save (another tab, a revert), so send the whole tree
+                if (res.status === 409 && changes) res = await sendBatch(fullSave);
+
+                if (res.ok) {
+                    const { results } = await res.json();
+                    savedFiles.current = flattenFiles(updatedTree).files;
+                    savedNodes.current = indexNodes(updatedTree);
+                    savedRevision.current = results[0].body.revision;
+                    setUnsavedChanges(false);
+
+                    if (snapshotDue) {
+                        setLastSnapshotTime(now);
+                        if (results[2]) setVersions(results[2].body);
+                    }
                 }
             } catch (err) {
                 console.error("Sync failed");
@@ -957,47 +1048,55 @@ export default function MainLayout() {
         setLogs(prev => [...prev, `> Running ${currentFile.name}...`]);
         setIsConsoleOpen(true);
 
-        // 3. Gather all files with relative ports. This is crucial for imports to work in the execution environment.
-        const allFiles: {name: string, content: string}[] = [];
-        
-        // Accepts a 'path' argument to track folders.
-        const collectFiles = (items: folderStructureData[], currentPath: string = "") => {
-            items.forEach(item => {
-                // Build the path: "utils" + "/" + "math.py"
-                const itemPath = currentPath ? `${currentPath}/${item.name}` : item.name;
-                
-                if (item.type === "file") {
-                    allFiles.push({
-                        name: itemPath, // Sends "utils/math.py" instead of just "math.py"
-                        content: item.content || ""
-                    });
-                } else if (item.children) {
-                    // Recursively dive into folders, passing the new path down
-                    collectFiles(item.children, itemPath);
-                }
-            });
-        };
-        
-        // Collect from the active data source
-        collectFiles(previewData || data);
+        // 3. Gather all files with relative paths. This is crucial for imports to work in the execution environment.
+        const { files, paths } = flattenFiles(previewData || data);
+        const entryFile = paths.get(currentFile.id) || currentFile.name;
+        const allFiles = Array.from(files, ([name, content]) => ({ name, content }));
+
+        // The server already has the saved project (and every version), so only send the files edited
+        // since the last save. An overlay can't remove files, unsaved deletes and renames send everything
+        const removed = Array.from(savedFiles.current.keys()).some(path => !files.has(path));
+        let body: Record<string, unknown> = { language, entry_file: entryFile, files: allFiles };
+        if (previewData && activePreviewId) {
+            body = { language, entry_file: entryFile, project_id: Number(projectId), version_id: activePreviewId };
+        } else if (savedRevision.current !== null && !removed) {
+            const dirty = allFiles.filter(file => savedFiles.current.get(file.name) !== file.content);
+            body = { language, entry_file: entryFile, project_id: Number(projectId), revision: savedRevision.current, files: dirty };
+        }
+
+        const execute = (payload: Record<string, unknown>) => fetch("http://localhost:5001/api/execute", {
+            method: "POST",
+            headers: { 
+                "Content-Type": "application/json",
+                "X-CSRF-TOKEN": getCSRF() 
+            },
+            body: JSON.stringify(payload),
+            credentials: "include"
+        });
 
         try {
             // Send the payload
-            const res = await fetch("http://localhost:5001/api/execute", {
-                method: "POST",
-                headers: { 
-                    "Content-Type": "application/json",
-                    "X-CSRF-TOKEN": getCSRF() 
-                },
-                body: JSON.stringify({
-                    language: language,
-                    entry_file: currentFile.name,  // The file to execute
-                    files: allFiles                // The context for imports
-                }),
-                credentials: "include"
-            });
+            let res = await execute(body);
+
+            // Saved in the meantime (another tab, a restore): fall back to sending everything
+            if (res.status === 409) {
+                res = await execute({ language, entry_file: entryFile, files: allFiles });
+            }
+
+            let result = await res.json();
 
-            const result = await res.json();
+            // Longer runs come back as a queued job, long-poll it until it finishes
+            if (res.status === 202) {
+                let job = result;
+                while (job.status !== "done" && job.status !== "failed") {
+                    const poll = await fetch(`http://localhost:5001/api/execute/jobs/${job.job_id}?wait=20`, {
+                        credentials: "include"
+                    });
+                    if (!poll.ok) throw new Error(`Polling job failed with ${poll.status}`);
+                    job = await poll.json();
+                }
+                result = job.result;
+            }
             
             if (result.output) {
                 setLogs(prev => [...prev, result.output.trimEnd()]);
@@ -1,169 +1,470 @@
 import os
-import docker
-import uuid
-from datetime import timedelta
-from flask import Flask, request, jsonify, make_response
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask import Flask, Blueprint, current_app, request, jsonify, Response, stream_with_context, send_file, url_for
 from flask_jwt_extended import (
-    JWTManager, create_access_token, set_access_cookies,
+    create_access_token, set_access_cookies,
     unset_jwt_cookies, jwt_required, get_jwt_identity, get_jwt
 )
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import select, String, Integer, DateTime, ForeignKey, Text, Boolean, func, delete, or_
-from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import select, update, tuple_, func, or_, text
 from dotenv import load_dotenv
 from datetime import datetime
-from typing import Optional, List
-import tempfile
-import shutil
-import tarfile
-import io
-
-# Load Environment Variables
-load_dotenv()
-
-# Define the Declarative Base
-class Base(DeclarativeBase):
-    pass
-
-# Initialize Flask App
-app = Flask(__name__)
-
-# Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-
-# JWT and Cookie Security Configuration
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
-app.config['JWT_TOKEN_LOCATION'] = ['cookies']
-app.config['JWT_ACCESS_COOKIE_PATH'] = '/'
-app.config['JWT_REFRESH_COOKIE_PATH'] = '/api/token/refresh'
-app.config['JWT_COOKIE_CSRF_PROTECT'] = True  # Enable CSRF protection
-app.config['JWT_COOKIE_SECURE'] = False       # Set to True in Production (HTTPS)
-app.config['JWT_COOKIE_SAMESITE'] = 'Lax'
-app.config['JWT_COOKIE_HTTPONLY'] = True   # Access token stays secure
-app.config['JWT_CSRF_CHECK_FORM'] = False # We use headers, not forms
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=2)
-app.config['JWT_CSRF_COOKIE_HTTPONLY'] = False # This allows document.cookie to see it
-app.config['JWT_ACCESS_CSRF_HEADER_NAME'] = "X-CSRF-TOKEN"
-app.config['JWT_CSRF_IN_COOKIES'] = True
-
-# Initialize Extensions
-db = SQLAlchemy(app, model_class=Base)
-migrate = Migrate(app, db)
-jwt = JWTManager(app)
-
-# Define all possible places your frontend might run
-allowed_origins = [
-    "http://localhost",           # Docker/Nginx (Port 80)
-    "http://localhost:5173",      # Vite Local Dev
-    "http://127.0.0.1",           # IP based access
-    "http://127.0.0.1:5173",
-    os.environ.get("CORS_ORIGIN") # Environment variable backup
-]
-
-# Configure CORS with the list
-CORS(app, supports_credentials=True, origins=allowed_origins, methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
-
-client = docker.from_env()
-
-LANGUAGE_CONFIG = {
-    "python": {
-        "image": "python:3.12-slim",
-        "command": ["sh", "-c", "echo \"$CODE\" > main.py && python main.py"],
-    },
-    "javascript": {
-        "image": "node:20-slim",
-        "command": ["sh", "-c", "echo \"$CODE\" > index.js && node index.js"],
-    },
-    "typescript": {
-        "image": "node:20-slim", # We use Node to run simple TS (via ts-node if installed, or just treating as JS)
-        "command": ["sh", "-c", "echo \"$CODE\" > index.js && node index.js"], 
-    },
-    "ruby": {
-        "image": "ruby:3.2-slim",
-        "command": ["sh", "-c", "echo \"$CODE\" > script.rb && ruby script.rb"],
-    },
-    "go": {
-        "image": "golang:1.22-alpine",
-        "command": ["sh", "-c", "echo \"$CODE\" > main.go && go run main.go"],
-    },
-    "c": {
-        "image": "gcc:13", # GCC image handles both C and C++
-        "command": ["sh", "-c", "echo \"$CODE\" > main.c && gcc main.c -o app && ./app"],
-    },
-    "cpp": {
-        "image": "gcc:13",
-        "command": ["sh", "-c", "echo \"$CODE\" > main.cpp && g++ main.cpp -o app && ./app"],
-    },
-    "java": {
-        "image": "eclipse-temurin:21-jdk",
-        "command": ["sh", "-c", "echo \"$CODE\" > Main.java && javac Main.java && java Main"],
-    }
-}
+import time
+import atexit
+import json
+import codecs
+import copy
+import queue
+import base64
+import hashlib
+import hmac
+import calendar
+import functools
+import click
+from contextlib import contextmanager
+from config import load_config
+from extensions import db, migrate, jwt, LazyDockerClient
+from models import User, Project, FileBlob, TokenBlocklist, Version
+from sandbox_pool import SandboxPool, SandboxPoolManager, PoolExhausted
+from execution_queue import ExecutionQueue, QueueFull, TERMINAL_STATES, make_backend
+from build_cache import BuildCache, has_artifacts
+from file_tree_ops import apply_ops, PatchError
+from project_storage import ProjectStorage, TreeError, MissingBlob, collect_hashes
+from project_archive import ARCHIVE_FORMATS, archive_name, export_archive, import_archive
+from version_history import VersionStore, VersionCompactor
+from revocation_cache import RevocationCache, MemoryRevocationBackend, BlocklistPurger
+from executors import BoundedExecutor, ExecutorBusy, ExecutorTimeout, process_pool, thread_pool
+from avatar_store import AvatarStore, LocalAvatarBackend, AvatarError
+from response_cache import ResponseCache
+from result_cache import ResultCache, ImageDigests
+from instrumentation import Metrics, Instrumentation
+from json_provider import make_json_provider
+from compression import ResponseCompressor, GzipRequestMiddleware
+from execution_payload import PayloadError, PayloadLimits, read_json_body, normalize_path, utf8_size, tar_stream, execution_key
+from runtimes import RUNTIMES, RuntimePrefetcher, RuntimeUnavailable, EntryPointError
+from resource_profiles import (
+    CapacityExceeded, OutputBudget, SANDBOX_UID, resolve_profile, container_limits, default_capacity
+)
+from docker_hosts import DockerHost, HostScheduler, parse_hosts, docker_client
 
-# Database Models
-class User(db.Model):
-    __tablename__ = 'users'
+class Services:
+    # Runtime objects owned by one app instance (one per worker process under gunicorn)
+    def __init__(self, app):
+        # Instrumentation (per-route latency, SQL per request, execution phases, served on /metrics)
+        self.metrics = None
+        self.instrumentation = None
+        if app.config['METRICS_ENABLED']:
+            self.metrics = Metrics()
+            self.instrumentation = Instrumentation(
+                self.metrics,
+                log_sample_rate=app.config['METRICS_LOG_SAMPLE_RATE'],
+                slow_request_seconds=app.config['METRICS_SLOW_REQUEST_MS'] / 1000
+            )
 
-    id: Mapped[int] = mapped_column(primary_key=True)
-    username: Mapped[str] = mapped_column(String(80), unique=True, nullable=False)
-    email: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
-    password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
-    avatar_id: Mapped[Optional[str]] = mapped_column(String(50), default="default")
-    avatar_url: Mapped[Optional[str]] = mapped_column(Text)
-    
-    # Explicit 2.0 relationship
-    projects: Mapped[List["Project"]] = relationship(back_populates="owner", cascade="all, delete-orphan")
-
-class Project(db.Model):
-    __tablename__ = 'projects'
-
-    id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(100), nullable=False)
-    file_tree: Mapped[dict] = mapped_column(JSONB, nullable=False, default=list)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    is_public: Mapped[bool] = mapped_column(Boolean, default=False)
-    owner: Mapped["User"] = relationship(back_populates="projects")
-    versions: Mapped[List["Version"]] = relationship(back_populates="project", cascade="all, delete-orphan")
-
-class TokenBlocklist(db.Model):
-    __tablename__ = 'token_blocklist'
-    id: Mapped[int] = mapped_column(primary_key=True)
-    jti: Mapped[str] = mapped_column(String(36), nullable=False, index=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
-
-class Version(db.Model):
-    __tablename__ = 'versions'
-    id: Mapped[int] = mapped_column(primary_key=True)
-    project_id: Mapped[int] = mapped_column(ForeignKey('projects.id'), nullable=False)
-    file_tree_snapshot: Mapped[dict] = mapped_column(JSONB, nullable=False)
-    label: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, default=None) 
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
-    project: Mapped["Project"] = relationship(back_populates="versions")
+        # Bounded Executors: password KDFs and Docker daemon calls each get their own capped pool
+        self.kdf_executor = BoundedExecutor(
+            "password hashing",
+            process_pool if app.config['KDF_POOL'] == 'process' else thread_pool("kdf"),
+            max_workers=app.config['KDF_WORKERS'],
+            max_pending=app.config['KDF_MAX_PENDING'],
+            timeout=app.config['KDF_TIMEOUT']
+        )
+        self.docker_executor = BoundedExecutor(
+            "Docker",
+            thread_pool("docker-io"),
+            max_workers=app.config['DOCKER_IO_WORKERS'],
+            max_pending=app.config['DOCKER_IO_MAX_PENDING'],
+            timeout=app.config['DOCKER_IO_TIMEOUT']
+        )
+        atexit.register(self.kdf_executor.shutdown)
+        atexit.register(self.docker_executor.shutdown)
+
+        self.build_cache = None
+        if app.config['BUILD_CACHE_ENABLED']:
+            self.build_cache = BuildCache(app.config['BUILD_CACHE_DIR'], app.config['BUILD_CACHE_MAX_BYTES'])
+
+        # Execution Result Cache (clean runs of unchanged code are answered without a sandbox)
+        self.result_cache = None
+        if app.config['EXEC_RESULT_CACHE_ENABLED']:
+            self.result_cache = ResultCache(
+                max_entries=app.config['EXEC_RESULT_CACHE_MAX_ENTRIES'],
+                max_bytes=app.config['EXEC_RESULT_CACHE_MAX_BYTES'],
+                ttl=app.config['EXEC_RESULT_CACHE_TTL']
+            )
+            # Tags resolve on the first host, hosts that build an image themselves get their own ids but the same contents
+            self.image_digests = ImageDigests(
+                lambda image: docker_call(self.host_scheduler.primary().client.images.get, image).id,
+                ttl=app.config['EXEC_IMAGE_DIGEST_TTL']
+            )
+
+        # Execution Resource Profiles (config defaults, then each runtime's own limits)
+        defaults = {
+            "run_timeout": app.config['EXEC_TIMEOUT'],
+            "compile_timeout": app.config['EXEC_COMPILE_TIMEOUT'],
+            "output_bytes": app.config['EXEC_OUTPUT_MAX_BYTES'],
+        }
+        self.resource_profiles = {
+            language: resolve_profile(defaults, runtime.resources)
+            for language, runtime in RUNTIMES.items()
+        }
+
+        # Execution Hosts (runs are placed on one of the configured Docker daemons, each with its own
+        # warm sandbox pools, runtime prefetch and share of cores, see docker_hosts.py)
+        factory = app.config['DOCKER_CLIENT_FACTORY'] or docker_client
+        hosts = []
+        for name, base_url, cpus in parse_hosts(app.config['EXEC_DOCKER_HOSTS']):
+            # One Docker client per host and worker, connected on first use
+            host = DockerHost(
+                name, LazyDockerClient(functools.partial(factory, base_url)),
+                app.config['EXEC_CPU_CAPACITY'] or default_capacity(cpus or app.config['EXEC_HOST_CPUS']),
+                base_url=base_url
+            )
+            # Warm Sandbox Pool (one pool per language, containers carry that language's limits)
+            if app.config['EXEC_POOL_ENABLED']:
+                host.pools = SandboxPoolManager(
+                    host.client,
+                    {
+                        language: {"image": runtime.image, "container_options": container_limits(self.resource_profiles[language])}
+                        for language, runtime in RUNTIMES.items()
+                    },
+                    maintain_interval=app.config['EXEC_POOL_MAINTAIN_INTERVAL'],
+                    min_size=app.config['EXEC_POOL_MIN_SIZE'],
+                    max_size=app.config['EXEC_POOL_MAX_SIZE'],
+                    idle_ttl=app.config['EXEC_POOL_IDLE_TTL'],
+                    max_uses=app.config['EXEC_POOL_MAX_USES'],
+                    acquire_timeout=app.config['EXEC_POOL_ACQUIRE_TIMEOUT']
+                )
+            # Runtime Prefetch (images pulled or built and toolchains verified once per worker and host, see gunicorn.conf.py)
+            if app.config['RUNTIME_PREFETCH']:
+                host.prefetcher = RuntimePrefetcher(host.client, RUNTIMES, functools.partial(verify_runtime, host),
+                                                    retry_after=app.config['EXEC_HOST_COOLDOWN'])
+            hosts.append(host)
+        self.host_scheduler = HostScheduler(
+            hosts,
+            {language: runtime.image for language, runtime in RUNTIMES.items()},
+            placement=app.config['EXEC_PLACEMENT'],
+            acquire_timeout=app.config['EXEC_ADMISSION_TIMEOUT'],
+            failure_threshold=app.config['EXEC_HOST_FAILURE_THRESHOLD'],
+            cooldown=app.config['EXEC_HOST_COOLDOWN'],
+            health_interval=app.config['EXEC_HOST_HEALTH_INTERVAL'],
+            drain_dir=app.config['EXEC_HOST_DRAIN_DIR'],
+            ignore_errors=(PoolExhausted, RuntimeUnavailable, ExecutorBusy)
+        )
+        atexit.register(self.host_scheduler.shutdown)
+
+        # Execution Job Queue (workers start on first submit)
+        # Polls land on any gunicorn worker, an in-process queue would only know its own jobs
+        if app.config['EXEC_QUEUE_BACKEND'] == 'memory' and int(os.getenv('WEB_CONCURRENCY', 1)) > 1:
+            raise RuntimeError("EXEC_QUEUE_BACKEND=memory needs a single worker process, use sqlite with WEB_CONCURRENCY > 1")
+        self.execution_queue = ExecutionQueue(
+            make_backend(app.config['EXEC_QUEUE_BACKEND'], app.config['EXEC_QUEUE_SQLITE_PATH']),
+            runner=lambda payload: run_execution_job(app, payload),
+            workers=app.config['EXEC_WORKERS'],
+            max_depth=app.config['EXEC_QUEUE_MAX_DEPTH'],
+            max_per_user=app.config['EXEC_MAX_JOBS_PER_USER'],
+            result_ttl=app.config['EXEC_JOB_RESULT_TTL'],
+            lease=app.config['EXEC_JOB_LEASE']
+        )
+        atexit.register(self.execution_queue.shutdown)
+
+        # Avatar Store (custom avatars as content addressed WebP files instead of base64 in users)
+        self.avatar_store = AvatarStore(
+            LocalAvatarBackend(app.config['AVATAR_DIR']),
+            size=app.config['AVATAR_SIZE'],
+            max_bytes=app.config['AVATAR_MAX_BYTES']
+        )
+
+        # Project Storage (file_tree / file_tree_snapshot hold skeletons, contents live in file_blobs)
+        self.storage = ProjectStorage(db, FileBlob, compress_min_bytes=app.config['BLOB_COMPRESS_MIN_BYTES'])
+
+        # Public Project Response Cache (serialized GET bodies for projects anyone can open)
+        self.project_cache = None
+        if app.config['PROJECT_CACHE_ENABLED']:
+            self.project_cache = ResponseCache(
+                max_entries=app.config['PROJECT_CACHE_MAX_ENTRIES'],
+                max_bytes=app.config['PROJECT_CACHE_MAX_BYTES']
+            )
+
+        # Stored Project File Index (runs by project_id skip the skeleton walk and blob fetch)
+        self.project_file_index = None
+        if app.config['EXEC_FILE_INDEX_ENABLED']:
+            self.project_file_index = ResponseCache(
+                max_entries=app.config['EXEC_FILE_INDEX_MAX_ENTRIES'],
+                max_bytes=app.config['EXEC_FILE_INDEX_MAX_BYTES']
+            )
+
+        # Version History (delta versions with periodic keyframes, cleanup runs in the background)
+        self.version_store = VersionStore(
+            db, Version,
+            keyframe_interval=app.config['VERSION_KEYFRAME_INTERVAL'],
+            cache_size=app.config['VERSION_CACHE_SIZE']
+        )
+        self.version_compactor = VersionCompactor(
+            app, self.version_store,
+            interval=app.config['VERSION_COMPACTION_INTERVAL'],
+            retention_hours=app.config['VERSION_RETENTION_HOURS']
+        )
+
+        # JWT Revocation Cache (the blocklist lookup runs on every authenticated request)
+        self.revocation_cache = None
+        if app.config['REVOCATION_CACHE_ENABLED']:
+            self.revocation_cache = RevocationCache(
+                MemoryRevocationBackend(app.config['REVOCATION_CACHE_MAX_SIZE']),
+                max_ttl=app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+                negative_ttl=app.config['REVOCATION_CACHE_NEGATIVE_TTL']
+            )
+        self.blocklist_purger = BlocklistPurger(
+            app, db, TokenBlocklist,
+            max_token_lifetime=app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+            interval=app.config['BLOCKLIST_PURGE_INTERVAL']
+        )
+
+        if self.metrics is not None:
+            self.metrics.collector(lambda: execution_gauges(self))
+
+    def start_background(self):
+        # Called once per serving process (gunicorn's post_worker_init, the dev server), never from a
+        # request, so a freshly booted or recycled worker doesn't wait for traffic to start its upkeep
+        self.host_scheduler.start()
+        self.version_compactor.start()
+        self.blocklist_purger.start()
+
+def services():
+    return current_app.extensions['codesdev']
+
+# Per-app services, resolved through the current app the same way current_app is
+storage = LocalProxy(lambda: services().storage)
+avatar_store = LocalProxy(lambda: services().avatar_store)
+project_cache = LocalProxy(lambda: services().project_cache)
+project_file_index = LocalProxy(lambda: services().project_file_index)
+version_store = LocalProxy(lambda: services().version_store)
+version_compactor = LocalProxy(lambda: services().version_compactor)
+execution_queue = LocalProxy(lambda: services().execution_queue)
+blocklist_purger = LocalProxy(lambda: services().blocklist_purger)
+host_scheduler = LocalProxy(lambda: services().host_scheduler)
+build_cache = LocalProxy(lambda: services().build_cache)
+result_cache = LocalProxy(lambda: services().result_cache)
+revocation_cache = LocalProxy(lambda: services().revocation_cache)
+
+api = Blueprint('api', __name__, cli_group=None)
+
+def create_app(test_config=None):
+    # Load Environment Variables
+    load_dotenv()
+
+    # Initialize Flask App
+    app = Flask(__name__)
+    load_config(app)
+    if test_config:
+        app.config.update(test_config)
+
+    # Serialization and Compression (file trees make most payloads large and very compressible)
+    app.json = make_json_provider(app.config['JSON_PROVIDER'])(app)
+    app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, app.config['REQUEST_MAX_DECOMPRESSED_BYTES'],
+                                         app.config['REQUEST_MAX_COMPRESSED_BYTES'])
+    if app.config['COMPRESSION_ENABLED']:
+        app.after_request(ResponseCompressor(app.config['COMPRESSION_MIN_BYTES']))
+
+    # Initialize Extensions
+    db.init_app(app)
+    migrate.init_app(app, db)
+    jwt.init_app(app)
+
+    # Configure CORS with the list
+    CORS(app, supports_credentials=True, origins=app.config['CORS_ALLOWED_ORIGINS'],
+         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"], expose_headers=["X-Next-Cursor"])
+
+    app.extensions['codesdev'] = Services(app)
+    if app.extensions['codesdev'].instrumentation is not None:
+        app.extensions['codesdev'].instrumentation.init_app(app)
+    app.register_blueprint(api)
+    return app
+
+def verify_runtime(host, runtime):
+    # Run the version command in a pooled sandbox when there is a pool, which also leaves a warm
+    # sandbox behind with the toolchain already paged in
+    argv = runtime.version.render({})
+    if host.pools is None:
+        return 0, host.client.containers.run(runtime.image, argv, remove=True, network_disabled=True, stderr=True)
+    pool = host.pools.get(runtime.name)
+    sandbox = pool.acquire()
+    try:
+        exit_code, output = sandbox.container.exec_run(argv, workdir="/app")
+    finally:
+        pool.release(sandbox)
+    return exit_code, output
+
+def execution_gauges(services):
+    # Point-in-time state of the execution subsystems, read when /metrics is scraped
+    queue = services.execution_queue.snapshot()
+    scheduler = services.host_scheduler
+    hosts = scheduler.hosts.values()
+    families = [
+        ("execution_queue_depth", "gauge", "Jobs waiting to run", {(): queue['depth']}),
+        ("execution_queue_running", "gauge", "Jobs running", {(): queue['running']}),
+        ("execution_cpu_in_use", "gauge", "Cores reserved by running sandboxes",
+         {(("host", host.name),): round(host.admission.in_use, 3) for host in hosts}),
+        ("execution_cpu_capacity", "gauge", "Cores this worker may reserve",
+         {(("host", host.name),): host.capacity for host in hosts}),
+        ("execution_host_up", "gauge", "Host takes new runs (healthy, not draining, circuit not open)",
+         {(("host", host.name),): int(host.healthy and not host.draining
+                                      and host.circuit(scheduler.failure_threshold) != "open") for host in hosts}),
+    ]
+    pools = {(host.name, name): pool for host in hosts if host.pools is not None
+             for name, pool in host.pools.snapshot().items()}
+    if pools:
+        families.append(("sandbox_pool_idle", "gauge", "Warm sandboxes ready",
+                         {(("host", host), ("language", name)): pool['idle'] for (host, name), pool in pools.items()}))
+        families.append(("sandbox_pool_in_use", "gauge", "Sandboxes running code",
+                         {(("host", host), ("language", name)): pool['in_use'] for (host, name), pool in pools.items()}))
+    return families
+
+def observe(name, value, **labels):
+    # The execution timing points, only a None check when metrics are disabled
+    metrics = services().metrics
+    if metrics is not None:
+        metrics.observe(name, value, **labels)
+
+def observe_run(language, outcome, files=None):
+    metrics = services().metrics
+    if metrics is None:
+        return
+    metrics.inc("execution_runs_total", language=language, outcome=outcome)
+    if files is not None:
+        metrics.observe("execution_payload_files", len(files), language=language)
+        metrics.observe("execution_payload_bytes", sum(utf8_size(file['content']) for file in files), language=language)
+
+def run_execution_job(app, payload):
+    # Queue workers run outside any request, give them the app context execute_files expects
+    with app.app_context():
+        return execute_files(payload)
+
+@api.cli.command('prefetch-runtimes')
+def prefetch_runtimes():
+    # Pull or build and verify every runtime image on every host now, e.g. right after a deploy
+    for host in host_scheduler.hosts.values():
+        if host.prefetcher is None:
+            host.prefetcher = RuntimePrefetcher(host.client, RUNTIMES, functools.partial(verify_runtime, host))
+        host.prefetcher.prefetch()
+        for name, status in host.prefetcher.snapshot().items():
+            print(f"{host.name:12} {name:12} {status['status']:8} {status['image']}" + (f"  {status['error']}" if status['error'] else ""))
+
+@api.cli.command('drain-host')
+@click.argument('name')
+@click.option('--undo', is_flag=True, help="Put the host back into rotation")
+def drain_host(name, undo):
+    # Every worker notices on its next health check of the host (EXEC_HOST_DRAIN_DIR must be set)
+    drain_dir = current_app.config['EXEC_HOST_DRAIN_DIR']
+    if not drain_dir:
+        raise click.ClickException("EXEC_HOST_DRAIN_DIR is not set")
+    if name not in host_scheduler.hosts:
+        raise click.ClickException(f"Unknown host '{name}', configured: {', '.join(host_scheduler.hosts)}")
+    marker = os.path.join(drain_dir, name)
+    if undo:
+        if os.path.exists(marker):
+            os.remove(marker)
+        print(f"{name} is back in rotation")
+    else:
+        os.makedirs(drain_dir, exist_ok=True)
+        open(marker, 'a').close()
+        print(f"{name} is draining, running jobs finish there and new ones go elsewhere")
+
+@api.cli.command('compact-versions')
+def compact_versions():
+    deleted = version_compactor.run_once()
+    print(f"Removed {deleted} expired autosaves")
+
+@api.cli.command('purge-blobs')
+def purge_blobs():
+    # Drop blobs no project or version references anymore, skipping recent ones that an in-flight save may still claim.
+    # put_blobs touches created_at on every blob a save reuses, so an old blob being claimed again counts as recent
+    result = db.session.execute(text("""
+        WITH referenced AS (
+            SELECT jsonb_path_query(file_tree, '$.**.blob') #>> '{}' AS hash FROM projects
+            UNION
+            SELECT jsonb_path_query(file_tree_snapshot, '$.**.blob') #>> '{}' AS hash FROM versions
+        )
+        DELETE FROM file_blobs
+        WHERE created_at < now() - interval '1 hour'
+          AND hash NOT IN (SELECT hash FROM referenced WHERE hash IS NOT NULL)
+    """))
+    db.session.commit()
+    print(f"Purged {result.rowcount} unreferenced blobs")
+
+@api.cli.command('purge-avatars')
+def purge_avatars():
+    # Drop avatar files no user points at anymore (replaced uploads, failed registrations)
+    deleted = avatar_store.purge(lambda: set(db.session.scalars(
+        select(User.avatar_file).where(User.avatar_file.isnot(None)).distinct()
+    )))
+    print(f"Purged {deleted} unreferenced avatar files")
+
+@api.cli.command('purge-token-blocklist')
+def purge_token_blocklist():
+    deleted = blocklist_purger.run_once()
+    print(f"Removed {deleted} expired blocklist entries")
+
+# Offloaded Work
+def hash_password(password):
+    return services().kdf_executor.run(generate_password_hash, password)
+
+def verify_password(password_hash, password):
+    return services().kdf_executor.run(check_password_hash, password_hash, password)
+
+def docker_call(fn, *args, **kwargs):
+    # Short daemon API calls (create, copy, remove...), a wedged daemon fails the call instead of the thread
+    return services().docker_executor.run(fn, *args, **kwargs)
+
+@api.errorhandler(ExecutorBusy)
+def executor_busy(error):
+    response = jsonify({"msg": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+@api.errorhandler(ExecutorTimeout)
+def executor_timeout(error):
+    return jsonify({"msg": str(error)}), 503
+
+@api.errorhandler(MissingBlob)
+def missing_blob(error):
+    # Failing the load keeps a client from autosaving the lost files back as empty ones
+    current_app.logger.error("Stored tree references missing blobs: %s", ", ".join(error.hashes))
+    return jsonify({"msg": "Some file contents could not be loaded"}), 500
+
+def load_token_revoked(jti):
+    return db.session.scalar(select(TokenBlocklist.id).filter_by(jti=jti).limit(1)) is not None
 
 # JWT Revocation Check
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
     jti = jwt_payload["jti"]
-    token = db.session.scalar(select(TokenBlocklist).filter_by(jti=jti))
-    return token is not None
+    if services().revocation_cache is None:
+        return load_token_revoked(jti)
+    return revocation_cache.is_revoked(jti, jwt_payload.get("exp"), load_token_revoked)
 
 # Auth Routes
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     
+    if not all(isinstance(data.get(key), str) and data[key] for key in ('username', 'email', 'password')):
+        return jsonify({"msg": "Registration failed: username, email and password are required"}), 400
+
     if db.session.scalar(select(User).filter_by(email=data['email'])):
         return jsonify({"msg": "Registration failed: User already exists"}), 400
     
-    hashed_pw = generate_password_hash(data['password'])
+    # Custom uploads arrive as a base64 data URL, only the stored file name goes in the row. The
+    # image is validated here but only written once nothing else can fail the request
+    avatar = None
+    if data.get('avatar_url'):
+        try:
+            avatar = avatar_store.prepare(data['avatar_url'])
+        except AvatarError as e:
+            return jsonify({"msg": f"Registration failed: {e}"}), 400
+
+    hashed_pw = hash_password(data['password'])
     
     # Extract avatar data from the request
     new_user = User(
@@ -171,19 +472,19 @@ def register():
         email=data['email'],
         password_hash=hashed_pw,
         avatar_id=data.get('avatar_id', 'default'),
-        avatar_url=data.get('avatar_url') # Base64 string from custom upload
+        avatar_file=avatar_store.put(*avatar) if avatar else None
     )
     
     db.session.add(new_user)
     db.session.commit()
     return jsonify({"msg": "User initialized successfully"}), 201
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     user = db.session.scalar(select(User).filter_by(email=data['email']))
     
-    if user and check_password_hash(user.password_hash, data['password']):
+    if user and verify_password(user.password_hash, data['password']):
         access_token = create_access_token(identity=str(user.id))
         response = jsonify({"msg": "Authentication successful", "username": user.username})
         # Sets the HTTP-only cookie in the user's browser
@@ -192,42 +493,170 @@ def login():
     
     return jsonify({"msg": "Invalid credentials"}), 401
 
-@app.route('/api/logout', methods=['POST'])
+@api.route('/api/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()["jti"]
+    token = get_jwt()
+    jti = token["jti"]
     db.session.add(TokenBlocklist(jti=jti))
     db.session.commit()
-    
+    if services().revocation_cache is not None:
+        revocation_cache.revoke(jti, token.get("exp"))
+
     response = jsonify({"msg": "Session terminated"})
     unset_jwt_cookies(response)
     return response, 200
 
+# Project Listing Helpers
+PROJECT_LIST_FIELDS = {
+    "id": Project.id,
+    "name": Project.name,
+    "created_at": Project.created_at,
+    "updated_at": Project.updated_at,
+    "is_public": Project.is_public,
+    "revision": Project.revision,
+    "file_count": Project.file_count,
+    "total_bytes": Project.total_bytes,
+    "file_tree": Project.file_tree,
+}
+PROJECT_LIST_DEFAULT_FIELDS = ("id", "name", "created_at", "updated_at", "is_public", "file_count", "total_bytes")
+
+def encode_cursor(created_at, project_id):
+    raw = f"{created_at.isoformat()}|{project_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        created_at, project_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(project_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def refresh_project_stats(project):
+    project.file_count, project.total_bytes = storage.tree_stats(project.file_tree)
+    project.updated_at = datetime.utcnow()
+
+def write_project_tree(project, skeleton):
+    # Replaces the whole tree with the revision bumped in SQL. Concurrent writers queue on the row lock
+    # and each get their own number, a PATCH conditioned on the old revision then misses and gets a 409.
+    # A Python-side += would send a literal and let two different trees share one revision
+    file_count, total_bytes = storage.tree_stats(skeleton)
+    revision = db.session.scalar(
+        update(Project)
+        .where(Project.id == project.id)
+        .values(
+            file_tree=skeleton,
+            revision=Project.revision + 1,
+            file_count=file_count,
+            total_bytes=total_bytes,
+            updated_at=datetime.utcnow()
+        )
+        .returning(Project.revision)
+        .execution_options(synchronize_session=False)
+    )
+    # Later operations in a batch see what was just written
+    db.session.refresh(project)
+    return revision
+
 # Persistence Routes
-@app.route('/api/projects', methods=['GET'])
+@api.route('/api/projects', methods=['GET'])
 @jwt_required()
 def get_projects():
     current_user_id = int(get_jwt_identity())
-    user_projects = db.session.scalars(select(Project).filter_by(user_id=current_user_id)).all()
-    return jsonify([{
-        "id": p.id, 
-        "name": p.name, 
-        "file_tree": p.file_tree,
-        "created_at": p.created_at.isoformat() + 'Z'
-    } for p in user_projects]), 200
-
-@app.route('/api/projects/<int:project_id>', methods=['GET'])
+
+    # Field Projection: metadata by default, file_tree only when explicitly asked for
+    requested = request.args.get('fields')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(PROJECT_LIST_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in PROJECT_LIST_FIELDS]
+    if unknown:
+        return jsonify({"msg": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    columns = [Project.id, Project.created_at] + [PROJECT_LIST_FIELDS[f] for f in fields if f not in ('id', 'created_at')]
+    stmt = select(*columns).where(Project.user_id == current_user_id).order_by(Project.created_at.desc(), Project.id.desc())
+
+    # Keyset Pagination on (created_at, id), only when the client asks for a page size
+    limit = request.args.get('limit')
+    if limit is not None:
+        # A bad limit must not fall back to the whole, unpaginated list
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({"msg": "limit must be an integer"}), 400
+        if limit < 1:
+            return jsonify({"msg": "limit must be positive"}), 400
+        limit = min(limit, 100)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_created, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"msg": "Invalid cursor"}), 400
+        stmt = stmt.where(tuple_(Project.created_at, Project.id) < tuple_(cursor_created, cursor_id))
+    if limit:
+        stmt = stmt.limit(limit + 1)
+
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:-1]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    file_trees = storage.load_trees([row.file_tree for row in rows]) if 'file_tree' in fields else None
+    projects = []
+    for i, row in enumerate(rows):
+        item = {}
+        for field in fields:
+            value = file_trees[i] if field == 'file_tree' else getattr(row, field)
+            if isinstance(value, datetime):
+                value = value.isoformat() + 'Z'
+            item[field] = value
+        projects.append(item)
+
+    # The body stays a plain list for existing clients, the next page cursor travels in a header
+    response = jsonify(projects)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+# HTTP Caching Helpers
+def cache_headers(response, etag, immutable=False):
+    # Responses depend on the session cookie, so only the browser may keep them
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def not_modified(etag):
+    # Weak comparison, compressed responses carry the weak form of the same ETag
+    return request.if_none_match.contains_weak(etag)
+
+def project_etag(row, is_owner):
+    # Revision moves on every tree write, the rest covers renames, sharing and who is asking
+    fingerprint = f"{row.name}|{row.updated_at}|{row.is_public}|{is_owner}"
+    return f"p{row.id}-r{row.revision}-{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]}"
+
+def invalidate_project_cache(project_id):
+    if services().project_cache is not None:
+        project_cache.invalidate((project_id, True), (project_id, False))
+
+@api.route('/api/projects/<int:project_id>', methods=['GET'])
 @jwt_required(optional=True)
 def get_single_project(project_id):
     current_user_id = get_jwt_identity()
     
-    project = db.session.get(Project, project_id)
+    # Metadata first, the tree is only loaded when the client doesn't already have this revision
+    project = db.session.execute(
+        select(Project.id, Project.user_id, Project.name, Project.created_at, Project.updated_at,
+               Project.is_public, Project.revision).where(Project.id == project_id)
+    ).first()
     
     if not project:
         return jsonify({"msg": "Project not found"}), 404
     
-    print(f"DEBUG CHECK: Token User={current_user_id} (Type: {type(current_user_id)}) vs Project Owner={project.user_id}", flush=True)
-
     # Permission Logic
     is_owner = False
     if current_user_id and int(current_user_id) == project.user_id:
@@ -235,17 +664,31 @@ def get_single_project(project_id):
 
     if not is_owner and not project.is_public:
         return jsonify({"msg": "Unauthorized"}), 403
-    
-    return jsonify({
-        "id": project.id,
-        "name": project.name,
-        "file_tree": project.file_tree,
-        "created_at": project.created_at.isoformat() + 'Z' if project.created_at else None,
-        "is_public": project.is_public,
-        "is_owner": is_owner
-    }), 200
 
-@app.route('/api/projects', methods=['POST'])
+    etag = project_etag(project, is_owner)
+    if not_modified(etag):
+        return cache_headers(Response(status=304), etag)
+
+    # Hot public projects (opened by every would-be forker) skip the blob fetch and serialization
+    cacheable = project.is_public and services().project_cache is not None
+    body = project_cache.get((project.id, is_owner), etag) if cacheable else None
+    if body is None:
+        file_tree = db.session.scalar(select(Project.file_tree).where(Project.id == project_id))
+        body = jsonify({
+            "id": project.id,
+            "name": project.name,
+            "file_tree": storage.load_tree(file_tree),
+            "created_at": project.created_at.isoformat() + 'Z' if project.created_at else None,
+            "is_public": project.is_public,
+            "is_owner": is_owner,
+            "revision": project.revision
+        }).get_data()
+        if cacheable:
+            project_cache.put((project.id, is_owner), etag, body)
+
+    return cache_headers(Response(body, status=200, mimetype='application/json'), etag)
+
+@api.route('/api/projects', methods=['POST'])
 @jwt_required()
 def create_project():
     current_user_id = int(get_jwt_identity())
@@ -261,7 +704,108 @@ def create_project():
     db.session.commit()
     return jsonify({"id": new_project.id, "name": new_project.name, "created_at": new_project.created_at.isoformat() + 'Z'}), 201
 
-@app.route('/api/me', methods=['GET'])
+# Project Archive Routes
+@api.route('/api/projects/<int:project_id>/export', methods=['GET'])
+@jwt_required(optional=True)
+def export_project(project_id):
+    current_user_id = get_jwt_identity()
+    fmt = request.args.get('format', 'tar.gz')
+    if fmt not in ARCHIVE_FORMATS:
+        return jsonify({"msg": f"Unknown format, expected one of {', '.join(ARCHIVE_FORMATS)}"}), 400
+
+    project = db.session.execute(
+        select(Project.user_id, Project.name, Project.is_public, Project.file_tree, Project.created_at,
+               Project.updated_at).where(Project.id == project_id)
+    ).first()
+    if not project:
+        return jsonify({"msg": "Project not found"}), 404
+    if not (current_user_id and int(current_user_id) == project.user_id) and not project.is_public:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    # Everything goes under one folder named after the project, contents are read a batch at a time
+    # while the archive is written out
+    name = archive_name(project.name)
+    modified = project.updated_at or project.created_at or datetime.utcnow()
+    entries = ((f"{name}/{path}", content) for path, content in
+               storage.iter_tree(project.file_tree, current_app.config['PROJECT_EXPORT_BATCH_FILES']))
+    response = Response(stream_with_context(export_archive(entries, fmt, calendar.timegm(modified.utctimetuple()))),
+                        mimetype=ARCHIVE_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api.route('/api/projects/import', methods=['POST'])
+@jwt_required()
+def import_project():
+    current_user_id = int(get_jwt_identity())
+    limits = PayloadLimits(
+        current_app.config['PROJECT_IMPORT_MAX_FILES'],
+        current_app.config['PROJECT_IMPORT_MAX_FILE_BYTES'],
+        current_app.config['PROJECT_IMPORT_MAX_TOTAL_BYTES']
+    )
+
+    # The archive is either the raw body (curl --data-binary @src.tar.gz) or a multipart "file" field
+    request.max_content_length = current_app.config['PROJECT_IMPORT_MAX_UPLOAD_BYTES']
+    try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({"msg": "No archive in the 'file' field"}), 400
+            stream = upload.stream
+        else:
+            stream = request.stream
+        name = request.values.get('name')
+
+        # Contents are written to file_blobs batch by batch as the archive is read, all in the one
+        # transaction that creates the project
+        archive = import_archive(
+            stream, limits, storage.put_blobs,
+            spool_bytes=current_app.config['PROJECT_IMPORT_SPOOL_BYTES'],
+            batch_bytes=current_app.config['PROJECT_IMPORT_BLOB_BATCH_BYTES']
+        )
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return jsonify({"msg": f"Archive exceeds {request.max_content_length} bytes"}), 413
+    except PayloadError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), e.status
+
+    folder = archive.unwrap()
+    project = Project(name=(name or folder or 'imported-project')[:100], user_id=current_user_id, file_tree=archive.tree)
+    refresh_project_stats(project)
+    db.session.add(project)
+    db.session.commit()
+    return jsonify({
+        "id": project.id,
+        "name": project.name,
+        "created_at": project.created_at.isoformat() + 'Z',
+        "file_count": project.file_count,
+        "total_bytes": project.total_bytes,
+        "skipped": archive.skipped,
+        "skipped_count": archive.skipped_count
+    }), 201
+
+# Avatar Routes
+def avatar_url_for(user):
+    if not user.avatar_file:
+        return None
+    base_url = current_app.config['AVATAR_BASE_URL']
+    if base_url:
+        return f"{base_url.rstrip('/')}/{user.avatar_file}"
+    return url_for('api.get_avatar', name=user.avatar_file, _external=True)
+
+@api.route('/api/avatars/<name>', methods=['GET'])
+def get_avatar(name):
+    # File names are content hashes, so a URL's bytes never change and can be cached for good
+    if not avatar_store.valid_name(name) or not os.path.exists(avatar_store.path(name)):
+        return jsonify({"msg": "Avatar not found"}), 404
+    response = send_file(avatar_store.path(name), mimetype='image/webp', etag=name.split('.')[0],
+                         max_age=31536000, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@api.route('/api/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     user_id = int(get_jwt_identity())
@@ -274,10 +818,10 @@ def get_current_user():
         "username": user.username,
         "email": user.email,
         "avatar_id": user.avatar_id,
-        "avatar_url": user.avatar_url
+        "avatar_url": avatar_url_for(user)
     }), 200
 
-@app.route('/api/projects/<int:project_id>', methods=['PUT'])
+@api.route('/api/projects/<int:project_id>', methods=['PUT'])
 @jwt_required()
 def update_project(project_id):
     current_user_id = int(get_jwt_identity())
@@ -290,19 +834,98 @@ def update_project(project_id):
         # effectively hiding it and preventing edits (returns 404 or 403)
         return jsonify({"msg": "Project not found or unauthorized"}), 404
     
-    data = request.get_json()
-    
+    body, status = apply_project_update(project, request.get_json(silent=True) or {})
+    if status >= 400:
+        return jsonify(body), status
+    db.session.commit()
+    invalidate_project_cache(project.id)
+    return jsonify(body), status
+
+def apply_project_update(project, data):
+    # Project operations take the already loaded, owned project and leave committing to the caller,
+    # so the routes and the batch endpoint share them. Bad input is a 4xx result, never an exception
+    if 'name' in data and (not isinstance(data['name'], str) or not data['name'].strip()):
+        return {"msg": "name must be a non-empty string"}, 400
+
     if 'file_tree' in data:
-        project.file_tree = data['file_tree']
-        flag_modified(project, "file_tree")
-    
+        try:
+            skeleton = storage.store_tree(data['file_tree'])
+        except TreeError as e:
+            return {"msg": str(e)}, 400
+        write_project_tree(project, skeleton)
+
     if 'name' in data:
         project.name = data['name']
-        
+        project.updated_at = datetime.utcnow()
+
+    return {"msg": "Persistence updated", "revision": project.revision}, 200
+
+@api.route('/api/projects/<int:project_id>', methods=['PATCH'])
+@jwt_required()
+def patch_project(project_id):
+    current_user_id = int(get_jwt_identity())
+    project = db.session.scalar(
+        select(Project).where(Project.id == project_id, Project.user_id == current_user_id)
+    )
+    
+    if not project:
+        return jsonify({"msg": "Project not found or unauthorized"}), 404
+    
+    body, status = apply_project_patch(project, request.get_json(silent=True) or {})
+    if status >= 400:
+        db.session.rollback()
+        return jsonify(body), status
+
     db.session.commit()
-    return jsonify({"msg": "Persistence updated"}), 200
+    invalidate_project_cache(project_id)
+    return jsonify(body), status
+
+def apply_project_patch(project, data):
+    base_revision = data.get('base_revision')
+    ops = data.get('ops')
+
+    if not isinstance(base_revision, int) or not isinstance(ops, list):
+        return {"msg": "base_revision and ops are required"}, 400
+
+    # Optimistic Concurrency: the client must be editing the revision we have
+    if base_revision != project.revision:
+        return {"msg": "Revision conflict", "revision": project.revision}, 409
 
-@app.route('/api/projects/<int:project_id>', methods=['DELETE'])
+    try:
+        file_tree = apply_ops(copy.deepcopy(project.file_tree or []), ops)
+    except PatchError as e:
+        return {"msg": f"Invalid patch: {str(e)}"}, 400
+
+    # Ops run against the skeleton, any content they set is moved out into blobs here. Untouched
+    # files keep the blobs the project already had
+    try:
+        file_tree = storage.store_tree(file_tree, collect_hashes(project.file_tree))
+    except TreeError as e:
+        return {"msg": f"Invalid patch: {str(e)}"}, 400
+    file_count, total_bytes = storage.tree_stats(file_tree)
+
+    # Conditional write so a concurrent save between our read and this update loses cleanly
+    result = db.session.execute(
+        update(Project)
+        .where(Project.id == project.id, Project.revision == base_revision)
+        .values(
+            file_tree=file_tree,
+            revision=base_revision + 1,
+            file_count=file_count,
+            total_bytes=total_bytes,
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        current = db.session.scalar(select(Project.revision).where(Project.id == project.id))
+        return {"msg": "Revision conflict", "revision": current}, 409
+
+    # Later operations in a batch (a version of the current tree, say) see what was just written
+    db.session.refresh(project)
+    return {"msg": "Patch applied", "revision": base_revision + 1}, 200
+
+@api.route('/api/projects/<int:project_id>', methods=['DELETE'])
 @jwt_required()
 def delete_project(project_id):
     current_user_id = int(get_jwt_identity())
@@ -314,9 +937,10 @@ def delete_project(project_id):
     
     db.session.delete(project)
     db.session.commit()
+    invalidate_project_cache(project_id)
     return jsonify({"msg": "Project deleted"}), 200
 
-@app.route('/api/user/update', methods=['PUT'])
+@api.route('/api/user/update', methods=['PUT'])
 @jwt_required()
 def update_user_profile():
     current_user_id = int(get_jwt_identity())
@@ -329,19 +953,31 @@ def update_user_profile():
     
     # Avatar logic
     if 'avatar_id' in data: user.avatar_id = data['avatar_id']
-    if 'avatar_url' in data: user.avatar_url = data['avatar_url']
+    # A new upload is a data URL, echoing back the current avatar URL leaves it alone. It's written
+    # after the password check, the replaced file is left for purge-avatars (others may share it)
+    avatar = None
+    if 'avatar_url' in data and data['avatar_url'] != avatar_url_for(user):
+        try:
+            avatar = avatar_store.prepare(data['avatar_url']) if data['avatar_url'] else None
+        except AvatarError as e:
+            return jsonify({"msg": str(e)}), 400
+        if avatar is None:
+            user.avatar_file = None
 
     # Password update logic
     if data.get('new_password'):
-        if not data.get('old_password') or not check_password_hash(user.password_hash, data.get('old_password')):
+        if not data.get('old_password') or not verify_password(user.password_hash, data.get('old_password')):
             return jsonify({"msg": "Current password required to set a new one"}), 400
         
-        user.password_hash = generate_password_hash(data['new_password'])
+        user.password_hash = hash_password(data['new_password'])
+
+    if avatar is not None:
+        user.avatar_file = avatar_store.put(*avatar)
 
     db.session.commit()
     return jsonify({"msg": "Profile updated successfully"}), 200
 
-@app.route('/api/projects/<int:project_id>/version', methods=['POST'])
+@api.route('/api/projects/<int:project_id>/version', methods=['POST'])
 @jwt_required()
 def save_version(project_id):
     current_user_id = int(get_jwt_identity())
@@ -353,50 +989,51 @@ def save_version(project_id):
     if not project:
         return jsonify({"msg": "Project not found"}), 404
 
-    data = request.get_json()
+    body, status = apply_version_save(project, request.get_json(silent=True) or {})
+    if status >= 400:
+        return jsonify(body), status
+    db.session.commit()
+
+    # The Cleanup of expired autosaves happens in the background compactor
+    version_compactor.start()
     
+    return jsonify(body), status
+
+def apply_version_save(project, data):
     # Handle the Label
     # If the frontend sends an empty string, we force it to None
     raw_label = data.get('label')
+    if raw_label is not None and not isinstance(raw_label, str):
+        return {"msg": "label must be a string or null"}, 400
     version_label = raw_label if raw_label and raw_label.strip() != "" else None
 
-    new_version = Version(
-        project_id=project.id,
-        file_tree_snapshot=data.get('file_tree', project.file_tree),
-        label=version_label
-    )
-    db.session.add(new_version)
-
-    # The Cleanup
-    # We use func.now() for database-level time consistency
-    cutoff = datetime.utcnow() - timedelta(hours=24)
-    
-    cleanup_stmt = (
-        delete(Version)
-        .where(Version.project_id == project_id)
-        .where(Version.label == None)  # Targets only actual autosaves
-        .where(Version.created_at < cutoff)
-    )
-    
-    db.session.execute(cleanup_stmt)
-    
-    # Commit both the New Save and the Cleanup in one transaction
-    db.session.commit()
-    
-    return jsonify({"msg": "Checkpoint created", "id": new_version.id}), 201
+    try:
+        skeleton = storage.store_tree(data['file_tree']) if 'file_tree' in data else project.file_tree
+    except TreeError as e:
+        return {"msg": str(e)}, 400
+    new_version = version_store.create(project.id, skeleton, label=version_label)
+    return {"msg": "Checkpoint created", "id": new_version.id}, 201
 
-@app.route('/api/versions/<int:version_id>/revert', methods=['POST'])
+@api.route('/api/versions/<int:version_id>/revert', methods=['POST'])
 @jwt_required()
 def revert_to_version(version_id):
+    current_user_id = int(get_jwt_identity())
     version = Version.query.get_or_404(version_id)
-    project = Project.query.get(version.project_id)
-    
+
+    # Ensure the version's project belongs to the user
+    project = db.session.scalar(
+    select(Project).where(Project.id == version.project_id, Project.user_id == current_user_id)
+    )
+    if not project:
+        return jsonify({"msg": "Project not found"}), 404
+
     # Overwrite live project state with the snapshot
-    project.file_tree = version.file_tree_snapshot
+    write_project_tree(project, version_store.snapshot(version))
     db.session.commit()
-    return jsonify({"msg": "Project reverted", "file_tree": project.file_tree}), 200
+    invalidate_project_cache(project.id)
+    return jsonify({"msg": "Project reverted", "file_tree": storage.load_tree(project.file_tree), "revision": project.revision}), 200
 
-@app.route('/api/projects/<int:project_id>/history', methods=['GET'])
+@api.route('/api/projects/<int:project_id>/history', methods=['GET'])
 @jwt_required()
 def get_project_history(project_id):
     current_user_id = int(get_jwt_identity())
@@ -408,15 +1045,26 @@ def get_project_history(project_id):
     if not project:
         return jsonify({"msg": "Project not found"}), 404
     
-    versions = Version.query.filter_by(project_id=project_id).order_by(Version.created_at.desc()).all()
-    
-    return jsonify([{
+    # History only changes when a version is added or compacted away, both move count or max id
+    count, newest = db.session.execute(
+        select(func.count(Version.id), func.max(Version.id)).where(Version.project_id == project_id)
+    ).one()
+    etag = f"h{project_id}-{count}-{newest or 0}"
+    if not_modified(etag):
+        return cache_headers(Response(status=304), etag)
+
+    body, _ = project_history(project)
+    return cache_headers(jsonify(body), etag)
+
+def project_history(project, data=None):
+    versions = Version.query.filter_by(project_id=project.id).order_by(Version.created_at.desc(), Version.id.desc()).all()
+    return [{
         "id": v.id,
         "label": v.label,
         "created_at": v.created_at.isoformat() + 'Z'
-    } for v in versions]), 200
+    } for v in versions], 200
 
-@app.route('/api/versions/<int:version_id>', methods=['GET'])
+@api.route('/api/versions/<int:version_id>', methods=['GET'])
 @jwt_required()
 def get_version_details(version_id):
     current_user_id = int(get_jwt_identity())
@@ -426,14 +1074,19 @@ def get_version_details(version_id):
     if project.user_id != current_user_id:
         return jsonify({"msg": "Unauthorized"}), 403
 
-    return jsonify({
+    # Versions never change once written, the browser can keep them for good
+    etag = f"v{version.id}"
+    if not_modified(etag):
+        return cache_headers(Response(status=304), etag, immutable=True)
+
+    return cache_headers(jsonify({
         "id": version.id,
         "label": version.label,
-        "file_tree_snapshot": version.file_tree_snapshot,
+        "file_tree_snapshot": storage.load_tree(version_store.snapshot(version)),
         "created_at": version.created_at.isoformat()
-    }), 200
+    }), etag, immutable=True)
 
-@app.route('/api/projects/<int:project_id>/share', methods=['PUT'])
+@api.route('/api/projects/<int:project_id>/share', methods=['PUT'])
 @jwt_required()
 def toggle_project_visibility(project_id):
     current_user_id = int(get_jwt_identity())
@@ -446,13 +1099,77 @@ def toggle_project_visibility(project_id):
     if not project:
         return jsonify({"msg": "Project not found"}), 404
         
-    data = request.get_json()
-    project.is_public = data.get('is_public', False)
+    body, status = apply_visibility(project, request.get_json(silent=True) or {})
+    if status >= 400:
+        return jsonify(body), status
     db.session.commit()
+    invalidate_project_cache(project.id)
     
-    return jsonify({"msg": "Visibility updated", "is_public": project.is_public}), 200
+    return jsonify(body), status
 
-@app.route('/api/projects/<int:project_id>/fork', methods=['POST'])
+def apply_visibility(project, data):
+    if not isinstance(data.get('is_public', False), bool):
+        return {"msg": "is_public must be true or false"}, 400
+    project.is_public = data.get('is_public', False)
+    return {"msg": "Visibility updated", "is_public": project.is_public}, 200
+
+# Batched project operations, in order: (handler, changes the project, adds a version)
+BATCH_OPERATIONS = {
+    "update": (apply_project_update, True, False),
+    "patch": (apply_project_patch, True, False),
+    "version": (apply_version_save, False, True),
+    "history": (project_history, False, False),
+    "share": (apply_visibility, True, False),
+}
+
+@api.route('/api/projects/<int:project_id>/batch', methods=['POST'])
+@jwt_required()
+def batch_project_operations(project_id):
+    # One autosave cycle (save, checkpoint, refresh history) in a single request: the token is
+    # checked and the project loaded once, and every operation commits together or not at all
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"msg": "ops must be a non-empty list"}), 400
+    if len(ops) > current_app.config['BATCH_MAX_OPS']:
+        return jsonify({"msg": f"At most {current_app.config['BATCH_MAX_OPS']} operations per batch"}), 400
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+            return jsonify({"msg": f"Unknown operation at index {index}, expected one of {', '.join(BATCH_OPERATIONS)}"}), 400
+        if not isinstance(op.get('data', {}), dict):
+            return jsonify({"msg": f"data must be an object at index {index}"}), 400
+
+    project = db.session.scalar(
+        select(Project).where(Project.id == project_id, Project.user_id == current_user_id)
+    )
+    if not project:
+        return jsonify({"msg": "Project not found"}), 404
+
+    results = []
+    for index, op in enumerate(ops):
+        handler = BATCH_OPERATIONS[op['op']][0]
+        try:
+            body, status = handler(project, op.get('data') or {})
+            # Flushed per operation so a database error is blamed on the operation that caused it
+            if status < 400:
+                db.session.flush()
+        except Exception as e:
+            current_app.logger.exception("Batch operation %s failed", op['op'])
+            body, status = {"msg": f"Operation failed: {e.__class__.__name__}"}, 500
+        results.append({"op": op['op'], "status": status, "body": body})
+        if status >= 400:
+            db.session.rollback()
+            return jsonify({"msg": "Batch rolled back", "failed": index, "results": results}), status
+
+    db.session.commit()
+    if any(BATCH_OPERATIONS[op['op']][1] for op in ops):
+        invalidate_project_cache(project_id)
+    if any(BATCH_OPERATIONS[op['op']][2] for op in ops):
+        version_compactor.start()
+    return jsonify({"results": results}), 200
+
+@api.route('/api/projects/<int:project_id>/fork', methods=['POST'])
 @jwt_required()
 def fork_project(project_id):
     current_user_id = int(get_jwt_identity())
@@ -477,8 +1194,10 @@ def fork_project(project_id):
     forked_project = Project(
         name=new_name,
         user_id=current_user_id,            # Assign to the person clicking "Fork"
-        file_tree=source_project.file_tree, # Copy the file structure
-        is_public=False                     # Reset to Private
+        file_tree=source_project.file_tree, # Copy the file structure, blobs are shared
+        is_public=False,                    # Reset to Private
+        file_count=source_project.file_count,
+        total_bytes=source_project.total_bytes
     )
     
     db.session.add(forked_project)
@@ -490,96 +1209,558 @@ def fork_project(project_id):
         "name": forked_project.name
     }), 201
 
-@app.route('/api/execute', methods=['POST'])
-@jwt_required()
-def execute_code_route():
-    data = request.get_json()
-    
+def execute_limits():
+    return PayloadLimits(
+        current_app.config['EXEC_MAX_FILES'],
+        current_app.config['EXEC_MAX_FILE_BYTES'],
+        current_app.config['EXEC_MAX_TOTAL_BYTES']
+    )
+
+def read_execute_request():
+    # File names come back normalized and the upload limits are enforced while the body is read
+    limits = execute_limits()
+    try:
+        data = read_json_body(request, limits)
+        source, error = load_execution_source(data, int(get_jwt_identity()))
+        if error:
+            return None, error
+        base = stored_files(source) if source else {}
+        payload, error = parse_execute_request(data, base)
+        if error or not source:
+            return payload, error
+        # The limits cover what actually lands in the sandbox, not just the uploaded overlay
+        limits.check(merge_files(base, payload['files']))
+    except PayloadError as e:
+        return None, ({"error": str(e)}, e.status)
+
+    # Only the overlay travels through the queue, workers rebuild the rest from the file index
+    payload['source'] = source
+    return payload, None
+
+def load_execution_source(data, user_id):
+    # A run can name a stored project (its current revision, or one of its versions) instead of
+    # uploading the whole tree, the request's files are then just the unsaved ones on top
+    project_id = data.get('project_id')
+    if project_id is None:
+        return None, None
+    if type(project_id) is not int:
+        return None, ({"error": "'project_id' must be an integer"}, 400)
+
+    project = db.session.execute(
+        select(Project.user_id, Project.is_public, Project.revision).where(Project.id == project_id)
+    ).first()
+    if not project:
+        return None, ({"error": "Project not found"}, 404)
+    is_owner = user_id == project.user_id
+    if not is_owner and not project.is_public:
+        return None, ({"error": "Unauthorized"}, 403)
+
+    version_id = data.get('version_id')
+    if version_id is not None:
+        if type(version_id) is not int:
+            return None, ({"error": "'version_id' must be an integer"}, 400)
+        # History is only visible to the owner, same as GET /api/versions/<id>
+        if not is_owner:
+            return None, ({"error": "Unauthorized"}, 403)
+        if db.session.scalar(select(Version.id).where(Version.id == version_id, Version.project_id == project_id)) is None:
+            return None, ({"error": "Version not found"}, 404)
+        return {"project_id": project_id, "version_id": version_id}, None
+
+    # The overlay was computed against a revision, on top of any other it could silently drop edits
+    revision = data.get('revision')
+    if revision is not None and revision != project.revision:
+        return None, ({"error": "The project has changed since it was loaded", "revision": project.revision}, 409)
+    return {"project_id": project_id, "revision": project.revision}, None
+
+def stored_files(source):
+    # {path: content} of the stored state a run builds on. Project entries are keyed by a hash of the
+    # stored skeleton rather than the revision, so a write that somehow reused a revision still misses.
+    # The skeleton only holds blob hashes, reading it is cheap next to loading the contents. Versions
+    # never change, they need no check
+    cacheable = services().project_file_index is not None
+    if 'version_id' in source:
+        key, fingerprint = ("version", source['version_id']), 0
+        files = project_file_index.get(key, fingerprint) if cacheable else None
+        if files is not None:
+            return files
+        version = db.session.get(Version, source['version_id'])
+        if version is None:
+            raise PayloadError("Version not found", 404)
+        skeleton = version_store.snapshot(version)
+    else:
+        row = db.session.execute(
+            select(Project.revision, Project.file_tree).where(Project.id == source['project_id'])
+        ).first()
+        if row is None or row.revision != source['revision']:
+            raise PayloadError("The project has changed since this run was submitted", 409)
+        skeleton = row.file_tree
+        key = ("project", source['project_id'])
+        fingerprint = hashlib.sha256(json.dumps(skeleton, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+        files = project_file_index.get(key, fingerprint) if cacheable else None
+        if files is not None:
+            return files
+
+    # Names the sandbox can't hold (absolute, "..") are left out rather than failing the run
+    files, size = {}, 0
+    for name, content in storage.load_files(skeleton).items():
+        path = normalize_path(name)
+        if path is not None and path not in files:
+            files[path] = content
+            size += len(path) + utf8_size(content)
+    if cacheable:
+        project_file_index.put(key, fingerprint, files, size=size)
+    return files
+
+def merge_files(base, overlay):
+    merged = dict(base)
+    merged.update((file['name'], file['content']) for file in overlay)
+    return merged
+
+def execution_files(payload):
+    # Stored files with the request's own files on top, as the list tar_stream takes
+    if 'source' not in payload:
+        return payload['files']
+    merged = merge_files(stored_files(payload['source']), payload['files'])
+    return [{"name": name, "content": content} for name, content in merged.items()]
+
+def parse_execute_request(data, base=None):
+    data = data or {}
+    base = base or {}
     language = data.get('language')
     entry_file = data.get('entry_file')
-    files = data.get('files')
+    files = data.get('files') or []
     
-    if not language or not entry_file or not files:
-        return jsonify({"error": "Missing required fields"}), 400
-        
-    config = LANGUAGE_CONFIG.get(language)
-    if not config:
-        return jsonify({"error": f"Language '{language}' is not supported."}), 400
+    if not (files or base) or not (language or entry_file):
+        return None, ({"error": "Missing required fields"}, 400)
+
+    # Without a language the entry file's extension decides
+    runtime = RUNTIMES.for_file(entry_file) if not language else RUNTIMES.runtimes.get(language)
+    if runtime is None:
+        return None, ({"error": f"Language '{language or entry_file}' is not supported."}, 400)
 
-    container = None
     try:
-        # Create an In-Memory tar Archive of the project files
-        file_obj = io.BytesIO()
-        with tarfile.open(fileobj=file_obj, mode='w') as tar:
-            for file in files:
-                # Skip files trying to escape root
-                if '..' in file['name'] or file['name'].startswith('/'):
-                    continue
-                
-                # Create a tar info object
-                info = tarfile.TarInfo(name=file['name'])
-                file_content = (file['content'] or "").encode('utf-8')
-                info.size = len(file_content)
-                
-                # Add file to tar
-                tar.addfile(info, io.BytesIO(file_content))
-        
-        file_obj.seek(0) # Reset pointer to beginning of stream
-
-        # Define Command based on language
-        run_cmd = config['command']
-        if language == "python":
-            run_cmd = f"python {entry_file}"
-        elif language in ["javascript", "typescript"]:
-            run_cmd = f"node {entry_file}"
-        elif language == "ruby":
-            run_cmd = f"ruby {entry_file}"
-        elif language == "go":
-            run_cmd = f"go run {entry_file}"
-        elif language in ["c", "cpp"]:
-            compiler = "gcc" if language == "c" else "g++"
-            run_cmd = f"{compiler} {entry_file} -o app && ./app"
-        elif language == "java":
-            class_name = entry_file.replace(".java", "")
-            run_cmd = f"javac {entry_file} && java {class_name}"
-
-        # Create the Container (Stopped state)
-        container = client.containers.create(
-            image=config['image'],
-            command=["sh", "-c", run_cmd],
-            working_dir="/app",
-            mem_limit="128m",
-            network_disabled=True,
-            tty=False
-        )
+        if entry_file:
+            entry_file = normalize_path(entry_file)
+            if entry_file is None:
+                raise EntryPointError("Invalid entry file path")
+        entry_file = runtime.resolve_entry(entry_file, set(base).union(file['name'] for file in files))
+    except EntryPointError as e:
+        return None, ({"error": str(e)}, 400)
 
-        # Copy the TAR archive into the container, this works even inside Docker-in-Docker
-        container.put_archive("/app", file_obj)
+    return {"language": runtime.name, "entry_file": entry_file, "files": files}, None
 
-        # Start the container
-        container.start()
+def execute_files(payload):
+    language = payload['language']
+    entry_file = payload['entry_file']
+    runtime = RUNTIMES[language]
+    profile = services().resource_profiles[language]
 
-        # Wait for result
-        try:
-            result = container.wait(timeout=5)
-            exit_code = result.get('StatusCode', 1)
-        except Exception:
-            container.kill()
-            return jsonify({"output": "Error: Execution Timed Out (Limit: 5s)", "exit_code": 124})
+    try:
+        files = execution_files(payload)
+        result_key, result = lookup_result(payload, files)
+        if result is not None:
+            observe_run(language, "cached")
+            return {**result, "cached": True}, 200
+
+        build_key, cached_build = lookup_build(runtime, entry_file, files)
+        phases = runtime.phases(entry_file, cached=cached_build is not None)
+        budget = OutputBudget(profile['output_bytes'])
+
+        with execution_sandbox(language, profile) as lease:
+            output = bytearray()
+            for channel, data in run_phases(lease, phases, profile, files, budget, build_key, cached_build, language):
+                if channel == "exit":
+                    phase, exit_code, timed_out = data
+                else:
+                    output += data
 
-        # Get Logs
-        logs = container.logs().decode('utf-8')
-        return jsonify({"output": logs, "exit_code": exit_code})
+        observe_run(language, "timeout" if timed_out else "ok" if exit_code == 0 else "failed", files)
+        if timed_out:
+            return {"output": f"Error: {timeout_message(phase, profile)}", "exit_code": 124, "cached": False}, 200
+        result = {"output": output.decode('utf-8', errors='replace'), "exit_code": exit_code, "truncated": budget.truncated}
+        # Only clean exits are remembered, a failure may well be transient
+        if result_key and exit_code == 0:
+            result_cache.put(result_key, result)
+        return {**result, "cached": False}, 200
 
     except Exception as e:
-        return jsonify({"error": f"Execution failed: {str(e)}"}), 500
-        
-    finally:
-        if container:
+        return execution_error(e)
+
+def execution_error(e):
+    # (body, status) for a run that failed before producing a result, shared by the job and stream paths
+    if isinstance(e, PayloadError):
+        return {"error": str(e)}, e.status
+    if isinstance(e, PoolExhausted):
+        return {"error": "All execution sandboxes are busy, please try again"}, 503
+    if isinstance(e, (CapacityExceeded, RuntimeUnavailable)):
+        return {"error": str(e)}, 503
+    if isinstance(e, (ExecutorBusy, ExecutorTimeout)):
+        return {"error": f"Docker daemon unavailable: {str(e)}"}, 503
+    return {"error": f"Execution failed: {str(e)}"}, 500
+
+def queue_full_response(error):
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@api.route('/api/execute', methods=['POST'])
+@jwt_required()
+def execute_code_route():
+    current_user_id = int(get_jwt_identity())
+    payload, error = read_execute_request()
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Reruns of unchanged code are answered before queueing, on a miss the key rides along to the worker
+    if services().result_cache is not None:
+        try:
+            key, result = lookup_result(payload, execution_files(payload))
+        except PayloadError as e:
+            return jsonify({"error": str(e)}), e.status
+        if result is not None:
+            return jsonify({**result, "cached": True}), 200
+        payload['result_key'] = key
+
+    # Quick runs are answered inline. Anything slower gets a 202 with the job after EXEC_SYNC_WAIT, the
+    # client long-polls /api/execute/jobs/<id> so runs never hold request threads that saves need
+    execution_queue.start()
+    try:
+        job = execution_queue.submit(current_user_id, payload)
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    finished = execution_queue.wait(job.id, current_app.config['EXEC_SYNC_WAIT'])
+    if finished is None or finished.status not in TERMINAL_STATES:
+        return jsonify((finished or job).to_dict()), 202
+
+    return jsonify(finished.result), finished.status_code
+
+@api.route('/api/execute/jobs', methods=['POST'])
+@jwt_required()
+def submit_execution_job():
+    current_user_id = int(get_jwt_identity())
+    payload, error = read_execute_request()
+    if error:
+        return jsonify(error[0]), error[1]
+
+    execution_queue.start()
+    try:
+        job = execution_queue.submit(current_user_id, payload)
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    return jsonify(job.to_dict()), 202
+
+@api.route('/api/execute/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_execution_job(job_id):
+    current_user_id = int(get_jwt_identity())
+
+    # Optional long-poll: hold the request until the job finishes or the wait runs out
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['EXEC_MAX_POLL_WAIT'])
+    job = execution_queue.wait(job_id, wait) if wait > 0 else execution_queue.get(job_id)
+
+    if not job or job.user_id != current_user_id:
+        return jsonify({"msg": "Job not found"}), 404
+
+    return jsonify(job.to_dict()), 200
+
+@api.route('/api/execute/queue', methods=['GET'])
+@jwt_required()
+def get_queue_stats():
+    return jsonify(execution_queue.snapshot()), 200
+
+def lookup_build(runtime, entry_file, files):
+    if services().build_cache is None or not runtime.compiled:
+        return None, None
+    key = execution_key(runtime.name, runtime.image, entry_file, files)
+    return key, build_cache.get(key)
+
+def lookup_result(payload, files):
+    # (key, result) for the result cache. A run looked up before it was queued isn't looked up again,
+    # and without a resolvable image id there is no key, so nothing is served or stored
+    if services().result_cache is None:
+        return None, None
+    if 'result_key' in payload:
+        return payload['result_key'], None
+    runtime = RUNTIMES[payload['language']]
+    image_id = services().image_digests.get(runtime.image)
+    if image_id is None:
+        return None, None
+    key = execution_key(runtime.name, image_id, payload['entry_file'], files)
+    return key, result_cache.get(key)
+
+def store_build(container, key):
+    # Harvest the build dir before the container is removed or reset
+    try:
+        archive = docker_call(lambda: b"".join(container.get_archive("/app/build")[0]))
+    except Exception:
+        return
+    if has_artifacts(archive):
+        build_cache.put(key, archive)
+
+# Seconds of clock skew allowed between timeout(1) in the container and our clock when telling a timeout apart
+TIMEOUT_TOLERANCE = 0.25
+
+def timeout_message(phase, profile):
+    label = "Compilation" if phase == "compile" else "Execution"
+    return f"{label} Timed Out (Limit: {profile[phase + '_timeout']}s)"
+
+@contextmanager
+def execution_sandbox(language, profile):
+    # Reserve the profile's cores on a host first so no host is ever oversubscribed, then take a warm
+    # sandbox from that host's pool for the language or create a one-off container with the same limits
+    started = time.monotonic()
+    with host_scheduler.place(language, profile['cpus']) as host:
+        if host.prefetcher is not None:
+            host.prefetcher.wait(language, current_app.config['RUNTIME_READY_TIMEOUT'])
+        observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="admission")
+        started = time.monotonic()
+        if host.pools is None:
+            container = docker_call(
+                host.client.containers.create,
+                image=RUNTIMES[language].image,
+                command=SandboxPool.IDLE_COMMAND,
+                working_dir="/app",
+                network_disabled=True,
+                tty=False,
+                **container_limits(profile)
+            )
             try:
-                container.remove(force=True)
-            except: pass
+                docker_call(container.start)
+                observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="sandbox")
+                yield {"container": container, "reusable": False}
+            finally:
+                started = time.monotonic()
+                try:
+                    docker_call(container.remove, v=True, force=True)
+                except Exception: pass
+                observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="release")
+            return
+
+        # Lazily start the pool maintainer so importing the app never spawns containers
+        host.pools.start()
+        pool = host.pools.get(language)
+        sandbox = pool.acquire()
+        observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="sandbox")
+        lease = {"container": sandbox.container, "reusable": False}
+        try:
+            yield lease
+        finally:
+            # Finished runs (even failing ones) are reset and reused, only timeouts get a fresh sandbox
+            started = time.monotonic()
+            pool.release(sandbox, recycle=not lease["reusable"])
+            observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="release")
+
+def run_phases(lease, phases, profile, files, budget, build_key=None, cached_build=None, language=None):
+    # Yields ("stdout" | "stderr", bytes) within the output budget, then ("exit", (phase, exit_code, timed_out)).
+    # Each phase is its own exec, bounded inside the container since exec has no timeout of its own,
+    # and a compile that fails or times out skips the run
+    # Stream the TAR archive into the container, this works even inside Docker-in-Docker
+    container = lease["container"]
+    started = time.monotonic()
+    docker_call(container.put_archive, "/app", tar_stream(files, SANDBOX_UID))
+    if cached_build:
+        docker_call(container.put_archive, "/app", cached_build)
+    observe("execution_phase_seconds", time.monotonic() - started, language=language, phase="upload")
+
+    api = container.client.api
+    for phase, argv in phases:
+        limit = profile[f"{phase}_timeout"]
+        exec_id = docker_call(
+            api.exec_create,
+            container.id,
+            ["timeout", "-s", "KILL", str(limit), *argv],
+            workdir="/app"
+        )['Id']
+        started = time.monotonic()
+        for stdout, stderr in docker_call(api.exec_start, exec_id, stream=True, demux=True):
+            for channel, chunk in (("stdout", stdout), ("stderr", stderr)):
+                chunk = budget.take(chunk)
+                if chunk:
+                    yield channel, chunk
+        exit_code = docker_call(api.exec_inspect, exec_id).get('ExitCode')
+        observe("execution_phase_seconds", time.monotonic() - started, language=language, phase=phase)
+
+        # timeout -s KILL exits 137 like any other SIGKILL (an OOM kill, say). It was the timeout only if
+        # the phase also lasted the limit, the host clock starts a little before the one in the container
+        if exit_code == 137 and time.monotonic() - started >= limit - TIMEOUT_TOLERANCE:
+            yield "exit", (phase, 124, True)
+            return
+        if phase == "compile":
+            if exit_code != 0:
+                lease["reusable"] = True
+                yield "exit", (phase, exit_code, False)
+                return
+            if build_key and not cached_build:
+                store_build(container, build_key)
+
+    lease["reusable"] = True
+    yield "exit", (phase, exit_code, False)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_execution(payload):
+    # Yields (event, data): stdout/stderr chunks as they arrive, the exit event last
+    language = payload['language']
+    runtime = RUNTIMES[language]
+    profile = services().resource_profiles[language]
+    files = execution_files(payload)
+    build_key, cached_build = lookup_build(runtime, payload['entry_file'], files)
+    phases = runtime.phases(payload['entry_file'], cached=cached_build is not None)
+    budget = OutputBudget(profile['output_bytes'])
+    decoders = {
+        "stdout": codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        "stderr": codecs.getincrementaldecoder('utf-8')(errors='replace'),
+    }
+
+    with execution_sandbox(language, profile) as lease:
+        for channel, data in run_phases(lease, phases, profile, files, budget, build_key, cached_build, language):
+            if channel == "exit":
+                phase, exit_code, timed_out = data
+                continue
+            # Output past the byte cap is drained silently, the run still finishes normally
+            text = decoders[channel].decode(data)
+            if text:
+                yield channel, {"chunk": text}
+    for channel, decoder in decoders.items():
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield channel, {"chunk": text}
+    if budget.truncated:
+        yield "truncated", {"limit_bytes": budget.max_bytes}
+
+    observe_run(language, "timeout" if timed_out else "ok" if exit_code == 0 else "failed", files)
+    if timed_out:
+        yield "exit", {"exit_code": 124, "timed_out": True, "phase": phase, "msg": timeout_message(phase, profile)}
+    else:
+        yield "exit", {"exit_code": exit_code, "timed_out": False, "phase": phase}
+
+def run_stream_job(app, send, payload):
+    # Queue worker side of a streamed run, every event is handed to the waiting response as it comes.
+    # The job keeps the exit (or error) event as its result, so it can be polled like any other
+    with app.app_context():
+        try:
+            for event, data in stream_execution(payload):
+                send((event, data))
+            result, status_code = data, 200
+        except Exception as e:
+            result, status_code = execution_error(e)
+            send(("error", result))
+        send(None)
+        return result, status_code
+
+def stream_job_events(job, events):
+    # Request side: relays what the worker sends. A job that ends without a word from the worker
+    # (expired, its process shutting down) ends the stream with the job's own result
+    yield sse_event("queued", {"job_id": job.id})
+    while True:
+        try:
+            item = events.get(timeout=execution_queue.poll_interval)
+        except queue.Empty:
+            current = execution_queue.get(job.id)
+            if current is None or (current.status in TERMINAL_STATES and events.empty()):
+                yield sse_event("error", current.result if current else {"error": "Execution job was lost"})
+                return
+            continue
+        if item is None:
+            return
+        yield sse_event(*item)
+
+@api.route('/api/execute/stream', methods=['POST'])
+@jwt_required()
+def stream_execute_route():
+    current_user_id = int(get_jwt_identity())
+    payload, error = read_execute_request()
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Streamed runs are admitted like any other job (same depth and per-user caps, same workers),
+    # the job is pinned to this process so its worker can hand the output straight to this response
+    events = queue.Queue()
+    execution_queue.start()
+    try:
+        job = execution_queue.submit(current_user_id, payload,
+                                     runner=functools.partial(run_stream_job, current_app._get_current_object(), events.put))
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    # Server-Sent Events: queued (with the job id), stdout/stderr chunks, the exit or error event always comes last
+    response = Response(stream_with_context(stream_job_events(job, events)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+@api.route('/api/projects/cache', methods=['GET'])
+@jwt_required()
+def get_project_cache_stats():
+    if services().project_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **project_cache.snapshot()}), 200
+
+@api.route('/api/execute/cache', methods=['GET'])
+@jwt_required()
+def get_build_cache_stats():
+    if services().build_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **build_cache.snapshot()}), 200
+
+@api.route('/api/execute/results', methods=['GET'])
+@jwt_required()
+def get_result_cache_stats():
+    if services().result_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **result_cache.snapshot()}), 200
+
+@api.route('/api/execute/pool', methods=['GET'])
+@jwt_required()
+def get_pool_stats():
+    hosts = host_scheduler.hosts.values()
+    if not any(host.pools is not None for host in hosts):
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, "hosts": {host.name: host.pools.snapshot() for host in hosts}}), 200
+
+@api.route('/api/execute/capacity', methods=['GET'])
+@jwt_required()
+def get_capacity_stats():
+    return jsonify({"admission": host_scheduler.admission_snapshot(), "profiles": services().resource_profiles}), 200
+
+@api.route('/api/execute/hosts', methods=['GET'])
+@jwt_required()
+def get_host_stats():
+    return jsonify(host_scheduler.snapshot()), 200
+
+@api.route('/api/execute/runtimes', methods=['GET'])
+@jwt_required()
+def get_runtime_stats():
+    hosts = host_scheduler.hosts.values()
+    if not any(host.prefetcher is not None for host in hosts):
+        return jsonify({"prefetch": False, "runtimes": {name: {"image": runtime.image} for name, runtime in RUNTIMES.items()}}), 200
+    return jsonify({"prefetch": True, "hosts": {host.name: host.prefetcher.snapshot() for host in hosts}}), 200
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus scrape endpoint, only served behind the METRICS_TOKEN bearer token. Host names, Docker
+    # URLs and error strings are in there, without a token the endpoint stays off
+    token = current_app.config['METRICS_TOKEN']
+    if services().metrics is None or not token:
+        return jsonify({"msg": "Metrics are disabled"}), 404
+    provided = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(provided, f"Bearer {token}".encode('utf-8')):
+        return jsonify({"msg": "Unauthorized"}), 401
+    return Response(services().metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/executors', methods=['GET'])
+@jwt_required()
+def get_executor_stats():
+    return jsonify({
+        "kdf": services().kdf_executor.snapshot(),
+        "docker": services().docker_executor.snapshot(),
+    }), 200
 
             
 if __name__ == '__main__':
+    app = create_app()
+    app.extensions['codesdev'].start_background()
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ALLOWED_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.webp$")
+
+
+class AvatarError(Exception):
+    pass
+
+
+def decode_data_url(value):
+    # The client sends custom avatars as data URLs ("data:image/png;base64,...")
+    if not isinstance(value, str) or not value:
+        raise AvatarError("Avatar must be a base64 encoded image")
+    if value.startswith("data:"):
+        header, _, value = value.partition(",")
+        if ";base64" not in header:
+            raise AvatarError("Avatar must be a base64 encoded image")
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise AvatarError("Avatar is not valid base64")
+
+
+def process_avatar(raw, size, max_pixels):
+    # Decode, validate and normalize to a size x size WebP, whatever the upload looked like
+    try:
+        with Image.open(io.BytesIO(raw)) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise AvatarError("Avatar must be a PNG, JPEG, GIF or WebP image")
+            if image.width * image.height > max_pixels:
+                raise AvatarError("Avatar dimensions are too large")
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            image = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, format="WEBP", quality=85, method=4)
+            return out.getvalue()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise AvatarError("Avatar is not a readable image")
+
+
+class LocalAvatarBackend:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def put(self, name, data):
+        # Write then rename so a concurrent reader never serves half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+
+    def get(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def touch(self, name):
+        # False when the file is gone (purged), the caller writes it again
+        try:
+            os.utime(self.path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def entries(self):
+        # (name, mtime) of every file in the store, finished or not
+        with os.scandir(self.root) as it:
+            return [(entry.name, entry.stat().st_mtime) for entry in it if entry.is_file()]
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+class AvatarStore:
+    # Avatars are content addressed: the filename is the hash of the processed image, so a
+    # stored file never changes and can be cached forever under its URL
+    def __init__(self, backend, size=256, max_bytes=2 * 1024 * 1024, max_pixels=4096 * 4096):
+        self.backend = backend
+        self.size = size
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+
+    def prepare(self, data_url):
+        # Validates and processes an upload without storing it, (name, data) for put()
+        raw = decode_data_url(data_url)
+        if len(raw) > self.max_bytes:
+            raise AvatarError(f"Avatar exceeds {self.max_bytes // 1024} KB")
+        data = process_avatar(raw, self.size, self.max_pixels)
+        return f"{hashlib.sha256(data).hexdigest()}.webp", data
+
+    def put(self, name, data):
+        # An existing file is touched instead of skipped, purge() leaves recent files alone
+        if not self.backend.touch(name):
+            self.backend.put(name, data)
+        return name
+
+    def save(self, data_url):
+        return self.put(*self.prepare(data_url))
+
+    def purge(self, load_referenced, grace_seconds=3600):
+        # Deletes files no user references. Files are shared by every user with the same image, so a
+        # replaced avatar can only go once nothing points at it. Recent files are skipped, their row
+        # may not be committed yet, as are leftovers of interrupted writes until they're that old.
+        # The directory is listed before load_referenced() reads the names in use, so a row committed
+        # in between is still seen
+        cutoff = time.time() - grace_seconds
+        entries = self.backend.entries()
+        referenced = load_referenced()
+        deleted = 0
+        for name, mtime in entries:
+            if mtime >= cutoff or name in referenced:
+                continue
+            if NAME_PATTERN.match(name) or name.endswith(".tmp"):
+                self.backend.delete(name)
+                deleted += 1
+        return deleted
+
+    def valid_name(self, name):
+        return bool(NAME_PATTERN.match(name or ""))
+
+    def path(self, name):
+        return self.backend.path(name)
@@ -0,0 +1,176 @@
+# Query plan review for the ownership scoped routes.
+#
+# Seeds a scratch Postgres database with a realistic volume of users, projects, versions and
+# blocklist rows, drives every persistence route through the test client while recording the
+# SQL it emits, then EXPLAINs each statement and fails when any of them sequentially scans a
+# large table. Run it against a throwaway database, the tables are dropped and recreated:
+#
+#   DATABASE_URL=postgresql://.../codesdev_explain python bench/explain_queries.py --reset
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+
+from app import create_app, services
+from extensions import db
+
+# Tables big enough in production that a sequential scan on a request path is a bug
+CHECKED_TABLES = {"users", "projects", "versions", "token_blocklist", "file_blobs"}
+SKIPPED_PREFIXES = ("INSERT", "SELECT PG_", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+EMAIL = "explain@codesdev.local"
+PASSWORD = "explain-harness"
+
+
+def seed(users, projects_per_user, versions_per_project, blocklist_rows):
+    # Bulk seeding in SQL, going through the ORM would take minutes at this volume
+    session = db.session
+    session.execute(text("""
+        INSERT INTO users (username, email, password_hash, avatar_id)
+        SELECT 'seed' || g, 'seed' || g || '@codesdev.local', 'x', 'default' FROM generate_series(1, :n) g
+    """), {"n": users})
+    session.execute(text("""
+        INSERT INTO projects (name, file_tree, user_id, created_at, is_public, revision, file_count, total_bytes, updated_at)
+        SELECT 'project-' || g, '[]'::jsonb, u.id,
+               now() - (random() * interval '365 days'), g % 10 = 0, 0, 0, 0, now()
+        FROM users u CROSS JOIN generate_series(1, :n) g
+    """), {"n": projects_per_user})
+    # One in fifty versions is an expired autosave, so compaction deletes a small slice
+    session.execute(text("""
+        INSERT INTO versions (project_id, file_tree_snapshot, label, created_at, base_id, depth)
+        SELECT p.id, '[]'::jsonb,
+               CASE WHEN g % 5 = 0 THEN 'checkpoint-' || g END,
+               CASE WHEN g % 50 = 1 THEN now() - interval '30 days' ELSE now() - (random() * interval '12 hours') END,
+               NULL, 0
+        FROM projects p CROSS JOIN generate_series(1, :n) g
+    """), {"n": versions_per_project})
+    session.execute(text("""
+        INSERT INTO token_blocklist (jti, created_at)
+        SELECT md5(g::text), CASE WHEN g % 100 = 0 THEN now() - interval '30 days' ELSE now() - (random() * interval '1 hour') END
+        FROM generate_series(1, :n) g
+    """), {"n": blocklist_rows})
+    session.commit()
+    for table in sorted(CHECKED_TABLES):
+        session.execute(text(f"ANALYZE {table}"))
+    session.commit()
+
+
+def exercise(app):
+    # Every route that reads or writes project state, in the order a user would hit them
+    client = app.test_client()
+    client.post('/api/register', json={"username": "explain", "email": EMAIL, "password": PASSWORD})
+    client.post('/api/login', json={"email": EMAIL, "password": PASSWORD})
+    client.environ_base['HTTP_X_CSRF_TOKEN'] = client.get_cookie('csrf_access_token').value
+
+    project_ids = [client.post('/api/projects', json={"name": f"explain-{i}"}).get_json()['id'] for i in range(30)]
+    pid = project_ids[0]
+    tree = [{"id": 1, "name": "main.py", "type": "file", "parent": None, "content": "print('hi')"}]
+
+    client.get('/api/me')
+    first = client.get('/api/projects?limit=10')
+    client.get(f"/api/projects?limit=10&cursor={first.headers['X-Next-Cursor']}")
+    client.get('/api/projects')
+    client.get(f'/api/projects/{pid}')
+    revision = client.put(f'/api/projects/{pid}', json={"file_tree": tree}).get_json()['revision']
+    client.patch(f'/api/projects/{pid}', json={
+        "base_revision": revision, "ops": [{"op": "upsert", "id": 1, "content": "print('hello')"}]
+    })
+    for label in (None, None, "checkpoint"):
+        client.post(f'/api/projects/{pid}/version', json={"label": label})
+    history = client.get(f'/api/projects/{pid}/history').get_json()
+    client.get(f"/api/versions/{history[-1]['id']}")
+    client.post(f"/api/versions/{history[-1]['id']}/revert")
+    client.put(f'/api/projects/{pid}/share', json={"is_public": True})
+    client.post(f'/api/projects/{pid}/fork')
+    client.delete(f'/api/projects/{project_ids[-1]}')
+
+    # Background jobs
+    with app.app_context():
+        services().version_compactor.run_once()
+        services().blocklist_purger.run_once()
+
+    client.post('/api/logout')
+    client.get('/api/projects')
+
+
+def scanned_tables(plan, found=None):
+    found = set() if found is None else found
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scanned_tables(child, found)
+    return found
+
+
+def index_names(plan, found=None):
+    found = set() if found is None else found
+    if plan.get("Index Name"):
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        index_names(child, found)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN every query the persistence routes run")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables before seeding")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--projects-per-user", type=int, default=10)
+    parser.add_argument("--versions-per-project", type=int, default=20)
+    parser.add_argument("--blocklist-rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Without the revocation cache every request runs the blocklist lookup, so it gets reviewed too
+    app = create_app({"REVOCATION_CACHE_ENABLED": False})
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit("The query plan review needs a PostgreSQL DATABASE_URL")
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        elif db.session.scalar(text("SELECT COUNT(*) FROM users")):
+            sys.exit("The database is not empty, point DATABASE_URL at a scratch database or pass --reset")
+        print("Seeding...")
+        seed(args.users, args.projects_per_user, args.versions_per_project, args.blocklist_rows)
+        engine = db.engine
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.lstrip().upper().startswith(SKIPPED_PREFIXES):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        exercise(app)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    failures = 0
+    seen = set()
+    with app.app_context():
+        connection = db.session.connection()
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            # Plain EXPLAIN plans UPDATE and DELETE statements without running them
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()[0]["Plan"]
+            seq_scans = scanned_tables(plan)
+            detail = f"SEQ SCAN on {', '.join(sorted(seq_scans))}" if seq_scans else (
+                ", ".join(sorted(index_names(plan))) or plan["Node Type"]
+            )
+            print(f"{'FAIL' if seq_scans else 'ok  '}  {' '.join(statement.split())[:120]}")
+            print(f"      {detail}")
+            failures += bool(seq_scans)
+        db.session.rollback()
+
+    print(f"\n{len(seen)} statements reviewed, {failures} sequentially scan a large table")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# In-process stand-in for the docker SDK client, covering exactly the calls the server makes.
+#
+# Every daemon call sleeps for a configurable latency (plus jitter) instead of touching Docker, so
+# benchmarks exercise the real pooling, queueing, admission and placement code with predictable costs:
+#
+#   create_app({"DOCKER_CLIENT_FACTORY": lambda base_url: FakeDockerClient(latencies={"exec": 0.2})})
+#
+# Several hosts are several fakes told apart by base_url, and setting down on one makes every call
+# to it fail like an unreachable daemon:
+#
+#   fakes = {"fake://a": FakeDockerClient(name="a"), "fake://b": FakeDockerClient(name="b")}
+#   create_app({"EXEC_DOCKER_HOSTS": "a=fake://a@4,b=fake://b@8", "DOCKER_CLIENT_FACTORY": fakes.get})
+import hashlib
+import io
+import itertools
+import random
+import tarfile
+import threading
+import time
+
+# Seconds per call, roughly what a local daemon takes for a small slim image
+DEFAULT_LATENCIES = {
+    "create": 0.08,        # containers.create
+    "start": 0.05,         # container.start
+    "remove": 0.04,        # container.remove(force=True)
+    "reload": 0.002,       # container.reload, pool health checks
+    "exec_run": 0.03,      # container.exec_run, pool resets and toolchain checks
+    "put_archive": 0.01,   # plus put_archive_per_mb for the archive itself
+    "put_archive_per_mb": 0.02,
+    "get_archive": 0.01,
+    "exec_create": 0.003,
+    "exec": 0.05,          # the program itself, compile and run phases alike
+    "exec_inspect": 0.002,
+    "image": 0.001,        # images.get
+    "pull": 2.0,
+    "build": 10.0,
+}
+
+
+class FakeAPI:
+    def __init__(self, daemon):
+        self.daemon = daemon
+        self._execs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def exec_create(self, container_id, cmd, workdir=None, **kwargs):
+        self.daemon.wait("exec_create")
+        with self._lock:
+            exec_id = f"exec-{next(self._ids)}"
+            self._execs[exec_id] = cmd
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id, stream=False, demux=False, **kwargs):
+        self.daemon.wait("exec")
+        chunks = [(self.daemon.output, None)]
+        if stream:
+            return iter(chunks)
+        return self.daemon.output
+
+    def exec_inspect(self, exec_id):
+        self.daemon.wait("exec_inspect")
+        with self._lock:
+            self._execs.pop(exec_id, None)
+        return {"ExitCode": self.daemon.exit_code, "Running": False}
+
+
+class FakeContainer:
+    def __init__(self, daemon, image, **options):
+        self.daemon = daemon
+        self.id = f"{daemon.name}-{next(daemon.container_ids):06d}"
+        self.image = image
+        self.options = options
+        self.status = "created"
+        self.client = daemon  # container.client.api like the real SDK
+
+    def start(self):
+        self.daemon.wait("start")
+        self.status = "running"
+
+    def reload(self):
+        self.daemon.wait("reload")
+
+    def remove(self, v=False, force=False):
+        self.daemon.wait("remove")
+        self.status = "removed"
+        self.daemon.forget(self)
+
+    def exec_run(self, cmd, workdir=None, **kwargs):
+        self.daemon.wait("exec_run")
+        return self.daemon.exit_code, self.daemon.output
+
+    def put_archive(self, path, data):
+        # Drain the generator like the daemon would, the transfer cost scales with its size
+        size = len(data) if isinstance(data, (bytes, bytearray)) else sum(len(chunk) for chunk in data)
+        self.daemon.wait("put_archive", extra=self.daemon.latencies["put_archive_per_mb"] * size / (1024 * 1024))
+        with self.daemon.lock:
+            self.daemon.stats["archive_bytes"] += size
+        return True
+
+    def get_archive(self, path):
+        self.daemon.wait("get_archive")
+        return iter([self.daemon.build_archive]), {"name": path.rsplit("/", 1)[-1]}
+
+
+class FakeContainers:
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def create(self, image, command=None, **options):
+        self.daemon.wait("create")
+        container = FakeContainer(self.daemon, image, command=command, **options)
+        self.daemon.track(container)
+        return container
+
+    def run(self, image, command=None, remove=False, **options):
+        self.create(image, command, **options).start()
+        self.daemon.wait("exec")
+        return self.daemon.output
+
+    def list(self, all=False, filters=None):
+        with self.daemon.lock:
+            return list(self.daemon.containers_by_id.values())
+
+
+class FakeImage:
+    def __init__(self, name):
+        self.id = "sha256:" + hashlib.sha256(name.encode("utf-8")).hexdigest()
+        self.tags = [name]
+
+
+class FakeImages:
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def get(self, name):
+        self.daemon.wait("image")
+        return FakeImage(name)
+
+    def pull(self, name, **kwargs):
+        self.daemon.wait("pull")
+        return FakeImage(name)
+
+    def build(self, tag=None, **kwargs):
+        self.daemon.wait("build")
+        return FakeImage(tag), []
+
+
+def fake_build_archive():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        data = b"\x7fELF fake build output"
+        info = tarfile.TarInfo("build/app")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeDockerClient:
+    # One fake daemon. Latencies override DEFAULT_LATENCIES, jitter spreads each call by up to
+    # that fraction either way
+    def __init__(self, latencies=None, jitter=0.2, output=b"hello from the sandbox\n", exit_code=0,
+                 name="fake", seed=None):
+        self.name = name
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.jitter = jitter
+        self.output = output
+        self.exit_code = exit_code
+        self.down = False
+        self.build_archive = fake_build_archive()
+        self.containers_by_id = {}
+        self.container_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "seconds": 0.0, "archive_bytes": 0, "containers_created": 0}
+        self._random = random.Random(seed)
+
+        self.api = FakeAPI(self)
+        self.containers = FakeContainers(self)
+        self.images = FakeImages(self)
+
+    def wait(self, call, extra=0.0):
+        if self.down:
+            raise ConnectionError(f"Cannot connect to the fake Docker daemon '{self.name}'")
+        delay = self.latencies[call] + extra
+        if self.jitter and delay:
+            with self.lock:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["seconds"] += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def track(self, container):
+        with self.lock:
+            self.containers_by_id[container.id] = container
+            self.stats["containers_created"] += 1
+
+    def forget(self, container):
+        with self.lock:
+            self.containers_by_id.pop(container.id, None)
+
+    def ping(self):
+        if self.down:
+            raise ConnectionError(f"Cannot connect to the fake Docker daemon '{self.name}'")
+        return True
@@ -0,0 +1,70 @@
+# Minimal load generator for comparing serving modes, e.g.
+#   python app.py                                        (dev server)
+#   gunicorn -c gunicorn.conf.py "app:create_app()"      (production)
+#   python bench/loadtest.py --url http://localhost:5001/api/projects --cookie "access_token_cookie=..."
+import argparse
+import statistics
+import threading
+import time
+import urllib.request
+from urllib.error import HTTPError, URLError
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def worker(url, headers, deadline, latencies, errors, lock):
+    while time.monotonic() < deadline:
+        request = urllib.request.Request(url, headers=headers)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+            ok = True
+        except (HTTPError, URLError, OSError):
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent GET load against one endpoint")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--cookie", help="Cookie header, for endpoints behind @jwt_required")
+    args = parser.parse_args()
+
+    headers = {"Cookie": args.cookie} if args.cookie else {}
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(args.url, headers, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f"requests: {len(latencies)}  errors: {errors[0]}  concurrency: {args.concurrency}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        ms = [value * 1000 for value in latencies]
+        print(f"latency ms: mean {statistics.mean(ms):.1f}  p50 {percentile(ms, 50):.1f}  "
+              f"p95 {percentile(ms, 95):.1f}  p99 {percentile(ms, 99):.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+# Traffic replay benchmark: the real app, a seeded database and fake Docker daemons.
+#
+# Seeds synthetic users and projects with deep file trees, then runs virtual users in threads
+# through the Flask test client. Each one replays what an open editor sends, one tick standing
+# for the 2 seconds between autosaves: a patch of the edited file every tick (batched with a version
+# save every so many ticks, as the editor does), and every so many ticks a history and preview
+# load, a public project open, a fork and a run. Runs go to bench/fake_docker.py with the
+# configured latencies, so the pool, queue, admission and host placement code is real and only
+# the daemons are not. Reports throughput, p50/p95/p99 per operation and memory, and exits 1
+# when a result is worse than the stored baseline by more than the tolerance.
+#
+#   DATABASE_URL=postgresql://.../codesdev_bench python bench/replay.py --reset --users 20 --duration 60
+#   python bench/replay.py --reset --save-baseline bench/baselines/replay.json
+#   python bench/replay.py --reset --baseline bench/baselines/replay.json --tolerance 0.25
+#   python bench/replay.py --reset --hosts 3 --outage fake1@10   # one of three hosts dies 10s in
+#
+# Without DATABASE_URL a SQLite file stands in for Postgres, good enough to catch regressions in
+# the Python paths but not for absolute numbers. Baselines only compare runs on the same machine
+# with the same options.
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "codesdev-bench.sqlite"))
+os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("CORS_ORIGIN", "http://localhost")
+
+from flask_jwt_extended import create_access_token, get_csrf_token
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+from app import create_app, services, refresh_project_stats
+from extensions import db
+from fake_docker import FakeDockerClient
+from loadtest import percentile
+from models import User, Project
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    # Only for the SQLite stand-in, Postgres keeps real JSONB columns
+    return "JSON"
+
+
+WORDS = ["def", "return", "import", "class", "self", "for", "in", "if", "else", "print", "value", "items",
+         "const", "function", "let", "while", "result", "data", "node"]
+
+
+def source_file(rng, size):
+    lines, total = [], 0
+    while total < size:
+        line = "    " * rng.randint(0, 3) + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 10)))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def deep_tree(rng, depth, fanout, files_per_folder, file_bytes, ids=None, parent=None):
+    # fanout folders per level down to depth, files_per_folder source files in every folder
+    ids = ids if ids is not None else iter(range(1, 10 ** 9))
+    nodes = []
+    for index in range(files_per_folder):
+        name = "main.py" if parent is None and index == 0 else f"mod_{next(ids)}.py"
+        nodes.append({"id": next(ids), "name": name, "type": "file", "parent": parent,
+                      "content": source_file(rng, rng.randint(file_bytes // 2, file_bytes * 3 // 2))})
+    if depth > 0:
+        for _ in range(fanout):
+            folder_id = next(ids)
+            nodes.append({"id": folder_id, "name": f"pkg_{folder_id}", "type": "folder", "parent": parent,
+                          "children": deep_tree(rng, depth - 1, fanout, files_per_folder, file_bytes, ids, folder_id)})
+    return nodes
+
+
+def file_nodes(tree):
+    stack, found = [tree], []
+    while stack:
+        for node in stack.pop():
+            if node["type"] == "file":
+                found.append(node)
+            elif node.get("children"):
+                stack.append(node["children"])
+    return found
+
+
+def seed(app, args, rng):
+    # Users each get projects_per_user projects, one in four of them public
+    seeded = []
+    with app.app_context():
+        for u in range(args.users):
+            user = User(username=f"bench{u}", email=f"bench{u}@codesdev.local", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            projects = []
+            for p in range(args.projects_per_user):
+                tree = deep_tree(rng, args.depth, args.fanout, args.files_per_folder, args.file_bytes)
+                project = Project(name=f"bench-{u}-{p}", user_id=user.id, is_public=(u + p) % 4 == 0, revision=1,
+                                  file_tree=services().storage.store_tree(tree))
+                refresh_project_stats(project)
+                db.session.add(project)
+                db.session.flush()
+                projects.append((project.id, tree, project.is_public))
+            seeded.append((user.id, projects))
+        db.session.commit()
+    return seeded
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            if ok:
+                self.samples.setdefault(name, []).append(seconds)
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, app, user_id, project, public_ids, recorder, args, seed):
+        self.client = app.test_client()
+        with app.app_context():
+            token = create_access_token(identity=str(user_id))
+            csrf = get_csrf_token(token)
+        self.client.set_cookie("access_token_cookie", token)
+        self.client.environ_base["HTTP_X_CSRF_TOKEN"] = csrf
+
+        self.project_id, self.tree, _ = project
+        self.files = file_nodes(self.tree)
+        self.revision = 1
+        self.public_ids = public_ids
+        self.recorder = recorder
+        self.args = args
+        self.rng = random.Random(seed)
+
+    def call(self, name, method, url, **kwargs):
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        response.get_data()
+        self.recorder.record(name, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    def tick(self, n):
+        args = self.args
+        # An edit to one file, then the debounced autosave. The editor sends a patch of what changed
+        # and a due version as one batch, falling back to the whole tree when the revision moved on.
+        # --separate-requests replays the older full tree PUT and version POST
+        node = self.rng.choice(self.files)
+        node["content"] += f"\nprint({n})"
+        version_due = n % args.version_every == 0
+        if args.separate_requests:
+            response = self.call("autosave", "PUT", f"/api/projects/{self.project_id}", json={"file_tree": self.tree})
+            if response.status_code == 200:
+                self.revision = response.get_json()["revision"]
+            if version_due:
+                self.call("version", "POST", f"/api/projects/{self.project_id}/version", json={"label": None})
+        else:
+            name = "autosave+version" if version_due else "autosave"
+            extra = [{"op": "version", "data": {"label": None}}] if version_due else []
+            patch = {"base_revision": self.revision,
+                     "ops": [{"op": "upsert", "id": node["id"], "content": node["content"]}]}
+            response = self.call(name, "POST", f"/api/projects/{self.project_id}/batch",
+                                 json={"ops": [{"op": "patch", "data": patch}] + extra})
+            if response.status_code == 409:
+                response = self.call(name, "POST", f"/api/projects/{self.project_id}/batch",
+                                     json={"ops": [{"op": "update", "data": {"file_tree": self.tree}}] + extra})
+            if response.status_code == 200:
+                self.revision = response.get_json()["results"][0]["body"]["revision"]
+
+        if n % args.history_every == 0:
+            history = self.call("history", "GET", f"/api/projects/{self.project_id}/history").get_json() or []
+            if history:
+                self.call("preview", "GET", f"/api/versions/{history[0]['id']}")
+        if n % args.public_every == 0 and self.public_ids:
+            self.call("open_public", "GET", f"/api/projects/{self.rng.choice(self.public_ids)}")
+        if n % args.fork_every == 0 and self.public_ids:
+            self.call("fork", "POST", f"/api/projects/{self.rng.choice(self.public_ids)}/fork")
+        if n % args.execute_every == 0:
+            # What the editor sends since runs read stored state: the saved revision plus no overlay
+            response = self.call("execute", "POST", "/api/execute", json={
+                "project_id": self.project_id, "revision": self.revision, "entry_file": "main.py", "files": []
+            })
+            # Slower runs come back as a 202 job, long-polled like the editor does
+            if response.status_code == 202:
+                job = response.get_json()
+                while job["status"] not in ("done", "failed"):
+                    response = self.call("execute_poll", "GET", f"/api/execute/jobs/{job['job_id']}?wait=20")
+                    if response.status_code != 200:
+                        break
+                    job = response.get_json()
+
+    def run(self, deadline):
+        n = 0
+        while time.monotonic() < deadline:
+            n += 1
+            started = time.monotonic()
+            self.tick(n)
+            # --pace 1 keeps the real 2s between autosaves, 0 replays as fast as the server allows
+            pause = self.args.tick_seconds * self.args.pace - (time.monotonic() - started)
+            if pause > 0:
+                time.sleep(pause)
+
+
+def summarize(recorder, elapsed, peak_rss_mb, traced_peak_mb):
+    ops = {}
+    for name, samples in sorted(recorder.samples.items()):
+        ms = [value * 1000 for value in samples]
+        ops[name] = {
+            "count": len(ms),
+            "errors": recorder.errors.get(name, 0),
+            "per_second": round(len(ms) / elapsed, 2),
+            "mean": round(statistics.mean(ms), 2),
+            "p50": round(percentile(ms, 50), 2),
+            "p95": round(percentile(ms, 95), 2),
+            "p99": round(percentile(ms, 99), 2),
+        }
+    for name, errors in recorder.errors.items():
+        ops.setdefault(name, {"count": 0, "errors": errors})
+    total = sum(op["count"] for op in ops.values())
+    return {
+        "elapsed": round(elapsed, 2),
+        "throughput": round(total / elapsed, 2),
+        "errors": sum(recorder.errors.values()),
+        "peak_rss_mb": peak_rss_mb,
+        "traced_peak_mb": traced_peak_mb,
+        "ops": ops,
+    }
+
+
+def compare(result, baseline, tolerance):
+    # Lower throughput, higher latency or more memory than the baseline allows are regressions
+    failures = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        failures.append(f"throughput {result['throughput']} req/s < baseline {baseline['throughput']}")
+    if baseline.get("peak_rss_mb") and result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        failures.append(f"peak RSS {result['peak_rss_mb']} MB > baseline {baseline['peak_rss_mb']}")
+    for name, op in result["ops"].items():
+        base = baseline["ops"].get(name)
+        if not base or "p95" not in base or "p95" not in op:
+            continue
+        for stat in ("p50", "p95", "p99"):
+            if op[stat] > base[stat] * (1 + tolerance):
+                failures.append(f"{name} {stat} {op[stat]} ms > baseline {base[stat]}")
+    return failures
+
+
+def print_report(result, fakes):
+    print(f"\n{'operation':16} {'count':>7} {'errors':>6} {'req/s':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, op in result["ops"].items():
+        if not op["count"]:
+            print(f"{name:16} {0:>7} {op['errors']:>6}")
+            continue
+        print(f"{name:16} {op['count']:>7} {op['errors']:>6} {op['per_second']:>8} {op['mean']:>8} "
+              f"{op['p50']:>8} {op['p95']:>8} {op['p99']:>8}")
+    print(f"\nthroughput {result['throughput']} req/s over {result['elapsed']}s, {result['errors']} errors")
+    print(f"peak RSS {result['peak_rss_mb']} MB" + (f", traced Python peak {result['traced_peak_mb']} MB"
+                                                    if result["traced_peak_mb"] is not None else ""))
+    for name, host in result["hosts"].items():
+        print(f"host {name}: {host['placed']} runs placed, {host['failures']} failures, circuit {host['circuit']}"
+              + ("" if host["healthy"] else ", unhealthy"))
+    for fake in fakes.values():
+        print(f"fake docker {fake.name}: {fake.stats['calls']} calls, {fake.stats['containers_created']} containers, "
+              f"{fake.stats['archive_bytes']:,} archive bytes" + (" (down)" if fake.down else ""))
+
+
+def parse_latencies(spec):
+    # "exec=0.2,create=0.1" -> {"exec": 0.2, "create": 0.1}
+    latencies = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, value = part.partition("=")
+        latencies[name.strip()] = float(value)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay editor traffic against the app with a fake Docker daemon")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables before seeding")
+    parser.add_argument("--users", type=int, default=8, help="Virtual users, one thread each")
+    parser.add_argument("--projects-per-user", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=3, help="Folder nesting depth of each tree")
+    parser.add_argument("--fanout", type=int, default=2, help="Sub folders per folder")
+    parser.add_argument("--files-per-folder", type=int, default=3)
+    parser.add_argument("--file-bytes", type=int, default=2048, help="Average file size")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of replay")
+    parser.add_argument("--tick-seconds", type=float, default=2.0, help="Editor time between autosaves")
+    parser.add_argument("--pace", type=float, default=0.0, help="1 replays in real time, 0 as fast as possible")
+    parser.add_argument("--version-every", type=int, default=5, help="Ticks between version saves")
+    parser.add_argument("--history-every", type=int, default=5, help="Ticks between history and preview loads")
+    parser.add_argument("--public-every", type=int, default=3, help="Ticks between public project opens")
+    parser.add_argument("--fork-every", type=int, default=20, help="Ticks between forks")
+    parser.add_argument("--execute-every", type=int, default=4, help="Ticks between runs")
+    parser.add_argument("--separate-requests", action="store_true",
+                        help="Autosave with a PUT and a version POST instead of one batch request")
+    parser.add_argument("--docker-latency", default="", help="Overrides like exec=0.2,create=0.1 (seconds)")
+    parser.add_argument("--docker-jitter", type=float, default=0.2)
+    parser.add_argument("--hosts", type=int, default=1, help="Fake Docker hosts runs are spread over")
+    parser.add_argument("--host-cpus", type=float, default=4.0, help="Cores of each fake host")
+    parser.add_argument("--placement", default="least_loaded", help="least_loaded or capacity")
+    parser.add_argument("--outage", action="append", default=[],
+                        help="NAME@SECONDS takes that fake host down that far into the replay, repeatable")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations (slower)")
+    parser.add_argument("--baseline", help="Fail when worse than this stored result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    parser.add_argument("--save-baseline", help="Write this run's result as the new baseline")
+    args = parser.parse_args()
+
+    latencies = parse_latencies(args.docker_latency)
+    fakes = {f"fake://{i}": FakeDockerClient(latencies=latencies, jitter=args.docker_jitter, name=f"fake{i}",
+                                             seed=args.seed + i)
+             for i in range(args.hosts)}
+    config = {
+        "EXEC_DOCKER_HOSTS": ",".join(f"{fake.name}={url}@{args.host_cpus}" for url, fake in fakes.items()),
+        "EXEC_PLACEMENT": args.placement,
+        "EXEC_HOST_HEALTH_INTERVAL": 1,
+        "DOCKER_CLIENT_FACTORY": fakes.get,
+        "RUNTIME_PREFETCH": False,
+        "METRICS_LOG_SAMPLE_RATE": 0.0,
+        "METRICS_SLOW_REQUEST_MS": 10 ** 9,
+    }
+    if os.environ["DATABASE_URL"].startswith("sqlite"):
+        # Writers queue on SQLite's file lock instead of failing straight away
+        config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30, "check_same_thread": False}}
+    app = create_app(config)
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        elif db.session.query(User).count():
+            sys.exit("The database is not empty, point DATABASE_URL at a scratch database or pass --reset")
+
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.users} users x {args.projects_per_user} projects...")
+    seeded = seed(app, args, rng)
+    public_ids = [pid for _, projects in seeded for pid, _, public in projects if public]
+    files = len(file_nodes(seeded[0][1][0][1]))
+    print(f"{files} files per project, {len(public_ids)} public projects")
+
+    recorder = Recorder()
+    users = [VirtualUser(app, user_id, projects[0], public_ids, recorder, args, args.seed + i)
+             for i, (user_id, projects) in enumerate(seeded)]
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=user.run, args=(deadline,)) for user in users]
+    outages = []
+    for spec in args.outage:
+        name, _, at = spec.partition("@")
+        fake = next((fake for fake in fakes.values() if fake.name == name), None)
+        if fake is None:
+            sys.exit(f"--outage names an unknown host '{name}'")
+        outages.append(threading.Timer(float(at or 0), setattr, (fake, "down", True)))
+    for timer in outages:
+        timer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for timer in outages:
+        timer.cancel()
+    elapsed = time.monotonic() - started
+
+    traced_peak_mb = None
+    if args.tracemalloc:
+        traced_peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = round(peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    if not recorder.samples:
+        sys.exit("No request completed, see the errors above")
+    result = summarize(recorder, elapsed, peak_rss_mb, traced_peak_mb)
+    with app.app_context():
+        hosts = services().host_scheduler.snapshot()["hosts"]
+    result["hosts"] = {name: {key: host[key] for key in ("placed", "failures", "trips", "circuit", "healthy")}
+                       for name, host in hosts.items()}
+    result["options"] = {key: value for key, value in vars(args).items()
+                         if key not in ("baseline", "save_baseline", "reset", "tolerance")}
+    print_report(result, fakes)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("options") != result["options"]:
+            print("\nwarning: the baseline was recorded with different options")
+        failures = compare(result, baseline, args.tolerance)
+        print(f"\n{len(failures)} regression(s) beyond {args.tolerance:.0%} of {args.baseline}")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Serialization and compression benchmark for project payloads.
+#
+# Builds synthetic file trees of roughly 1 MB and 10 MB of source text and reports, per JSON
+# provider, how long serializing a GET /api/projects/<id> body takes, then how many bytes each
+# negotiated encoding puts on the wire and what compressing costs.
+#
+#   python bench/serialization.py [--sizes 1,10] [--repeat 5]
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from compression import available_encoders
+from json_provider import JSON_PROVIDERS, orjson
+
+WORDS = ["def", "return", "import", "class", "self", "for", "in", "if", "else", "print", "value", "items",
+         "const", "function", "=>", "let", "while", "{", "}", "(", ")", "result", "data", "node", "é", "→"]
+
+
+def synthetic_tree(target_bytes, seed=7):
+    # Folders of source-like files, roughly what a student project looks like only bigger
+    rng = random.Random(seed)
+    tree, size, next_id = [], 0, 1
+    while size < target_bytes:
+        folder = {"id": next_id, "name": f"pkg_{next_id}", "type": "folder", "parent": None, "children": []}
+        next_id += 1
+        for _ in range(rng.randint(3, 12)):
+            lines = []
+            for _ in range(rng.randint(20, 400)):
+                indent = "    " * rng.randint(0, 3)
+                lines.append(indent + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))))
+            content = "\n".join(lines)
+            name = "".join(rng.choice(string.ascii_lowercase) for _ in range(8)) + ".py"
+            folder["children"].append({"id": next_id, "name": name, "type": "file", "parent": folder["id"],
+                                       "content": content})
+            next_id += 1
+            size += len(content.encode("utf-8"))
+        tree.append(folder)
+    return tree
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON provider and response compression benchmark")
+    parser.add_argument("--sizes", default="1,10", help="Tree sizes in MB, comma separated")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    providers = [name for name in JSON_PROVIDERS if name != "orjson" or orjson is not None]
+    encoders = available_encoders({"gzip": 4, "br": 4, "zstd": 3})
+
+    for size_mb in [float(size) for size in args.sizes.split(",")]:
+        tree = synthetic_tree(int(size_mb * 1024 * 1024))
+        payload = {"id": 1, "name": "bench", "file_tree": tree, "created_at": "2026-01-01T00:00:00Z",
+                   "is_public": True, "is_owner": False, "revision": 1}
+        print(f"\n== {size_mb:g} MB of source text")
+
+        body = None
+        for name in providers:
+            app = Flask(__name__)
+            app.json = JSON_PROVIDERS[name](app)
+            with app.app_context():
+                response, ms = timed(lambda: app.json.response(payload), args.repeat)
+                _, parse_ms = timed(lambda: app.json.loads(response.get_data()), args.repeat)
+            print(f"  json {name:8} serialize {ms:8.1f} ms   parse {parse_ms:8.1f} ms   {len(response.get_data()):>11,} bytes")
+            body = response.get_data()
+
+        print(f"  wire identity  {len(body):>11,} bytes")
+        for name, encode in encoders.items():
+            compressed, ms = timed(lambda: encode(body), args.repeat)
+            ratio = len(body) / len(compressed)
+            print(f"  wire {name:8}  {len(compressed):>11,} bytes   {ratio:5.1f}x smaller   compress {ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
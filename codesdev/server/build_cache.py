@@ -0,0 +1,107 @@
+import fcntl
+import io
+import os
+import tarfile
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def has_artifacts(archive):
+    # An empty build dir (failed compile) is not worth caching
+    try:
+        with tarfile.open(fileobj=io.BytesIO(archive), mode='r') as tar:
+            return any(member.isfile() for member in tar.getmembers())
+    except tarfile.TarError:
+        return False
+
+
+class BuildCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.tar")
+
+    def _load(self):
+        # Rebuild the LRU order from disk. Every worker writes to the same directory, so this runs
+        # after each store too: each file's mtime (bumped on every hit) is the shared LRU order, and
+        # evicting from a fresh scan keeps the whole directory, not each worker's share, under max_bytes
+        with open(os.path.join(self.root, ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            found = []
+            for name in os.listdir(self.root):
+                if not name.endswith(".tar"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except OSError:
+                    continue  # Evicted by another worker while we listed
+                found.append((stat.st_mtime, name[:-4], stat.st_size))
+            with self._lock:
+                self._entries.clear()
+                self._total = 0
+                for _, key, size in sorted(found):
+                    self._entries[key] = size
+                    self._total += size
+                self._evict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+
+        try:
+            path = self._path(key)
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, 0)
+                self._total -= size
+            return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+
+        # Write then rename so readers never see a half written artifact
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self.stats["stores"] += 1
+        self._load()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data.update({"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes})
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 3) if lookups else None
+        return data
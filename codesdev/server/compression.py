@@ -0,0 +1,196 @@
+import gzip
+import io
+import json
+import zlib
+
+from flask import request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_encoders(levels):
+    # Server preference order, zstd and brotli only when their modules are installed
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = lambda data: _zstd(data, levels["zstd"])
+    if brotli is not None:
+        encoders["br"] = lambda data: _brotli(data, levels["br"])
+    encoders["gzip"] = lambda data: _gzip(data, levels["gzip"])
+    return encoders
+
+
+def negotiate(accept_encodings, encoders):
+    # Highest client quality wins, ties go to the server's preference order
+    best, best_quality = None, 0
+    for name in encoders:
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+class ResponseCompressor:
+    def __init__(self, min_bytes=1024, levels=None):
+        self.min_bytes = min_bytes
+        self.encoders = available_encoders({"gzip": 4, "br": 4, "zstd": 3, **(levels or {})})
+
+    def __call__(self, response):
+        response.vary.add("Accept-Encoding")
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+
+        encoding = negotiate(request.accept_encodings, self.encoders)
+        if encoding is None:
+            return response
+
+        compressed = self.encoders[encoding](data)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        # The compressed bytes are a different representation of the same resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+class _JSONBody:
+    # Errors raised mid-read surface through Flask, the ones refused up front straight from the
+    # middleware, both as the JSON every other API error uses
+    def get_body(self, environ=None, scope=None):
+        return json.dumps({"msg": self.description})
+
+    def get_headers(self, environ=None, scope=None):
+        return [("Content-Type", "application/json")]
+
+
+class InvalidRequestBody(_JSONBody, BadRequest):
+    pass
+
+
+class RequestBodyTooLarge(_JSONBody, RequestEntityTooLarge):
+    pass
+
+
+class GunzipStream(io.RawIOBase):
+    # Inflates a gzip request body as the app reads it, so the streaming parsers (execution uploads,
+    # archive imports) keep working on compressed bodies. Both sides are capped: max_compressed bytes
+    # read off the wire and max_bytes handed to the app, a few KB of gzip can otherwise expand to gigabytes
+    def __init__(self, raw, length, max_compressed, max_bytes, chunk_size=64 * 1024):
+        self.raw = raw
+        self.remaining = length  # None reads to the end of a server-terminated stream
+        self.max_compressed = max_compressed
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.read_compressed = 0
+        self.produced = 0
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._tail = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        size = self.chunk_size if self.remaining is None else min(self.chunk_size, self.remaining)
+        chunk = self.raw.read(size) if size else b""
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        self.read_compressed += len(chunk)
+        if self.read_compressed > self.max_compressed:
+            raise RequestBodyTooLarge(f"Compressed request body exceeds {self.max_compressed} bytes")
+        return chunk
+
+    def readinto(self, buffer):
+        if not len(buffer):
+            return 0
+        while not self._done:
+            if self._tail:
+                data, self._tail = self._tail, b""
+            else:
+                data = self._next_chunk()
+                if not data:
+                    if not self._inflater.eof:
+                        raise InvalidRequestBody("Request body is truncated gzip")
+                    self._done = True
+                    break
+            try:
+                out = self._inflater.decompress(data, len(buffer))
+            except zlib.error:
+                raise InvalidRequestBody("Request body is not valid gzip")
+            self._tail = self._inflater.unconsumed_tail
+            if self._inflater.eof:
+                # Anything after the gzip member is ignored, as it always was
+                self._done = True
+            if out:
+                self.produced += len(out)
+                if self.produced > self.max_bytes:
+                    raise RequestBodyTooLarge(f"Decompressed request body exceeds {self.max_bytes} bytes")
+                buffer[:len(out)] = out
+                return len(out)
+        return 0
+
+
+class GzipRequestMiddleware:
+    # Accepts Content-Encoding: gzip request bodies (large PUT /api/projects saves, /api/execute)
+    # and hands the app a plain body, so no route has to know about it
+    def __init__(self, wsgi_app, max_bytes, max_compressed_bytes):
+        self.wsgi_app = wsgi_app
+        self.max_bytes = max_bytes
+        self.max_compressed_bytes = max_compressed_bytes
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_CONTENT_ENCODING", "").strip().lower() != "gzip":
+            return self.wsgi_app(environ, start_response)
+
+        # Checked before anything is read, this runs ahead of auth so any client can reach it
+        header = (environ.get("CONTENT_LENGTH") or "").strip()
+        if header:
+            if not header.isdigit():
+                return InvalidRequestBody("Invalid Content-Length header")(environ, start_response)
+            length = int(header)
+            if length > self.max_compressed_bytes:
+                error = RequestBodyTooLarge(f"Compressed request body exceeds {self.max_compressed_bytes} bytes")
+                return error(environ, start_response)
+        elif environ.get("wsgi.input_terminated"):
+            length = None
+        else:
+            return InvalidRequestBody("Compressed request bodies need a Content-Length")(environ, start_response)
+
+        environ["wsgi.input"] = GunzipStream(environ["wsgi.input"], length, self.max_compressed_bytes, self.max_bytes)
+        # The inflated length isn't known up front, werkzeug reads a terminated stream to its end
+        environ["wsgi.input_terminated"] = True
+        environ.pop("CONTENT_LENGTH", None)
+        del environ["HTTP_CONTENT_ENCODING"]
+        return self.wsgi_app(environ, start_response)
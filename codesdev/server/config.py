@@ -0,0 +1,171 @@
+import os
+import tempfile
+from datetime import timedelta
+
+def load_config(app):
+    # Configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+
+    # JWT and Cookie Security Configuration
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
+    app.config['JWT_TOKEN_LOCATION'] = ['cookies']
+    app.config['JWT_ACCESS_COOKIE_PATH'] = '/'
+    app.config['JWT_REFRESH_COOKIE_PATH'] = '/api/token/refresh'
+    app.config['JWT_COOKIE_CSRF_PROTECT'] = True  # Enable CSRF protection
+    app.config['JWT_COOKIE_SECURE'] = False       # Set to True in Production (HTTPS)
+    app.config['JWT_COOKIE_SAMESITE'] = 'Lax'
+    app.config['JWT_COOKIE_HTTPONLY'] = True   # Access token stays secure
+    app.config['JWT_CSRF_CHECK_FORM'] = False # We use headers, not forms
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=2)
+    app.config['JWT_CSRF_COOKIE_HTTPONLY'] = False # This allows document.cookie to see it
+    app.config['JWT_ACCESS_CSRF_HEADER_NAME'] = "X-CSRF-TOKEN"
+    app.config['JWT_CSRF_IN_COOKIES'] = True
+
+    # Docker Client (a callable taking a host's base_url and returning a docker client, None connects
+    # with docker.from_env or the url). Only settable through create_app(test_config), e.g. by the benchmarks' fake daemons
+    app.config['DOCKER_CLIENT_FACTORY'] = None
+
+    # Serialization and Compression Configuration
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson')                       # orjson | default
+    app.config['COMPRESSION_ENABLED'] = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESSION_MIN_BYTES'] = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))       # Smaller bodies go out as is
+    app.config['REQUEST_MAX_DECOMPRESSED_BYTES'] = int(os.getenv('REQUEST_MAX_DECOMPRESSED_BYTES', 32 * 1024 * 1024))
+    app.config['REQUEST_MAX_COMPRESSED_BYTES'] = int(os.getenv('REQUEST_MAX_COMPRESSED_BYTES', 8 * 1024 * 1024))  # gzip bodies are refused past this before auth
+
+    # Token Revocation Cache Configuration
+    # Logouts are seen instantly by the worker that handled them, other workers notice within the negative TTL
+    app.config['REVOCATION_CACHE_ENABLED'] = os.getenv('REVOCATION_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['REVOCATION_CACHE_MAX_SIZE'] = int(os.getenv('REVOCATION_CACHE_MAX_SIZE', 10000))
+    app.config['REVOCATION_CACHE_NEGATIVE_TTL'] = int(os.getenv('REVOCATION_CACHE_NEGATIVE_TTL', 30))
+    app.config['BLOCKLIST_PURGE_INTERVAL'] = int(os.getenv('BLOCKLIST_PURGE_INTERVAL', 3600))
+
+    # Avatar Store Configuration
+    app.config['AVATAR_DIR'] = os.getenv('AVATAR_DIR', os.path.join(app.instance_path, 'avatars'))  # Must be persistent storage, the image sets a volume
+    app.config['AVATAR_BASE_URL'] = os.getenv('AVATAR_BASE_URL')                      # e.g. served straight by nginx/CDN, defaults to /api/avatars
+    app.config['AVATAR_SIZE'] = int(os.getenv('AVATAR_SIZE', 256))                   # Stored avatars are AVATAR_SIZE x AVATAR_SIZE WebP
+    app.config['AVATAR_MAX_BYTES'] = int(os.getenv('AVATAR_MAX_BYTES', 2 * 1024 * 1024))
+
+    # Public Project Response Cache Configuration
+    app.config['PROJECT_CACHE_ENABLED'] = os.getenv('PROJECT_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['PROJECT_CACHE_MAX_ENTRIES'] = int(os.getenv('PROJECT_CACHE_MAX_ENTRIES', 512))
+    app.config['PROJECT_CACHE_MAX_BYTES'] = int(os.getenv('PROJECT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    # Version History Configuration
+    app.config['VERSION_KEYFRAME_INTERVAL'] = int(os.getenv('VERSION_KEYFRAME_INTERVAL', 20))       # Max deltas between full snapshots
+    app.config['VERSION_CACHE_SIZE'] = int(os.getenv('VERSION_CACHE_SIZE', 256))                    # Reconstructed versions kept in memory
+    app.config['VERSION_COMPACTION_INTERVAL'] = int(os.getenv('VERSION_COMPACTION_INTERVAL', 600))  # Seconds between autosave cleanups
+    app.config['VERSION_RETENTION_HOURS'] = int(os.getenv('VERSION_RETENTION_HOURS', 24))          # Unlabeled autosaves older than this are dropped
+
+    # Project Storage Configuration
+    app.config['BLOB_COMPRESS_MIN_BYTES'] = int(os.getenv('BLOB_COMPRESS_MIN_BYTES', 1024))  # 0 disables compression
+
+    # Batched Project Operations (POST /api/projects/<id>/batch)
+    app.config['BATCH_MAX_OPS'] = int(os.getenv('BATCH_MAX_OPS', 10))
+
+    # Project Archives (export streams a tar.gz or zip of a project, import creates a project from one)
+    app.config['PROJECT_EXPORT_BATCH_FILES'] = int(os.getenv('PROJECT_EXPORT_BATCH_FILES', 200))                    # File contents fetched per query while an export streams
+    app.config['PROJECT_IMPORT_MAX_UPLOAD_BYTES'] = int(os.getenv('PROJECT_IMPORT_MAX_UPLOAD_BYTES', 32 * 1024 * 1024))  # The archive as uploaded
+    app.config['PROJECT_IMPORT_MAX_FILES'] = int(os.getenv('PROJECT_IMPORT_MAX_FILES', 2000))
+    app.config['PROJECT_IMPORT_MAX_FILE_BYTES'] = int(os.getenv('PROJECT_IMPORT_MAX_FILE_BYTES', 1024 * 1024))     # Bigger files are skipped, not refused
+    app.config['PROJECT_IMPORT_MAX_TOTAL_BYTES'] = int(os.getenv('PROJECT_IMPORT_MAX_TOTAL_BYTES', 64 * 1024 * 1024))  # Uncompressed, skipped entries count too, stops archive bombs
+    app.config['PROJECT_IMPORT_SPOOL_BYTES'] = int(os.getenv('PROJECT_IMPORT_SPOOL_BYTES', 8 * 1024 * 1024))       # Zip uploads are buffered in memory up to this, then on disk
+    app.config['PROJECT_IMPORT_BLOB_BATCH_BYTES'] = int(os.getenv('PROJECT_IMPORT_BLOB_BATCH_BYTES', 4 * 1024 * 1024))  # Contents written to file_blobs per insert
+
+    # Execution Sandbox Pool Configuration
+    app.config['EXEC_POOL_ENABLED'] = os.getenv('EXEC_POOL_ENABLED', 'true').lower() == 'true'
+    app.config['EXEC_POOL_MIN_SIZE'] = int(os.getenv('EXEC_POOL_MIN_SIZE', 1))
+    app.config['EXEC_POOL_MAX_SIZE'] = int(os.getenv('EXEC_POOL_MAX_SIZE', 4))
+    app.config['EXEC_POOL_IDLE_TTL'] = int(os.getenv('EXEC_POOL_IDLE_TTL', 300))          # Seconds before an idle sandbox is evicted
+    app.config['EXEC_POOL_MAX_USES'] = int(os.getenv('EXEC_POOL_MAX_USES', 50))           # Runs before a sandbox is recycled
+    app.config['EXEC_POOL_ACQUIRE_TIMEOUT'] = int(os.getenv('EXEC_POOL_ACQUIRE_TIMEOUT', 10))
+    app.config['EXEC_POOL_MAINTAIN_INTERVAL'] = int(os.getenv('EXEC_POOL_MAINTAIN_INTERVAL', 30))
+
+    # Execution Resource Profiles (defaults, a runtime's own "resources" in runtimes.py take precedence)
+    app.config['EXEC_TIMEOUT'] = int(os.getenv('EXEC_TIMEOUT', 5))                        # Run phase, seconds
+    app.config['EXEC_COMPILE_TIMEOUT'] = int(os.getenv('EXEC_COMPILE_TIMEOUT', 10))       # Compile phase, seconds
+    app.config['EXEC_OUTPUT_MAX_BYTES'] = int(os.getenv('EXEC_OUTPUT_MAX_BYTES', 1024 * 1024))  # stdout + stderr kept or streamed per run
+    app.config['EXEC_HOST_CPUS'] = float(os.getenv('EXEC_HOST_CPUS', os.cpu_count() or 1))     # Cores sandboxes may use on a host that doesn't give its own
+    app.config['EXEC_CPU_CAPACITY'] = float(os.getenv('EXEC_CPU_CAPACITY', 0))            # Per worker process and host, 0 splits the host's cores between gunicorn workers
+    app.config['EXEC_ADMISSION_TIMEOUT'] = int(os.getenv('EXEC_ADMISSION_TIMEOUT', 10))   # Seconds a run waits for free cores before a 503
+
+    # Execution Hosts (comma separated name=base_url[@cpus], e.g. "a=unix:///var/run/docker.sock@8,b=tcp://10.0.0.2:2375@16".
+    # Empty runs everything on the one daemon from the environment, like DOCKER_HOST)
+    app.config['EXEC_DOCKER_HOSTS'] = os.getenv('EXEC_DOCKER_HOSTS', '')
+    app.config['EXEC_PLACEMENT'] = os.getenv('EXEC_PLACEMENT', 'least_loaded')                 # least_loaded (lowest share of cores in use) or capacity (most free cores)
+    app.config['EXEC_HOST_HEALTH_INTERVAL'] = int(os.getenv('EXEC_HOST_HEALTH_INTERVAL', 10))  # Seconds between pings of each daemon
+    app.config['EXEC_HOST_FAILURE_THRESHOLD'] = int(os.getenv('EXEC_HOST_FAILURE_THRESHOLD', 3))  # Daemon errors in a row before a host's circuit opens
+    app.config['EXEC_HOST_COOLDOWN'] = int(os.getenv('EXEC_HOST_COOLDOWN', 30))                # Seconds an open circuit waits before a trial run
+    app.config['EXEC_HOST_DRAIN_DIR'] = os.getenv('EXEC_HOST_DRAIN_DIR', '')                   # A file named after a host in here drains it (flask drain-host)
+
+    # Instrumentation (Prometheus text on /metrics, JSON request logs for slow and sampled requests)
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')                                     # Bearer token for /metrics, unset keeps the endpoint off
+    app.config['METRICS_LOG_SAMPLE_RATE'] = float(os.getenv('METRICS_LOG_SAMPLE_RATE', 0.01))    # Share of ordinary requests logged
+    app.config['METRICS_SLOW_REQUEST_MS'] = int(os.getenv('METRICS_SLOW_REQUEST_MS', 1000))      # Requests at least this slow are always logged
+
+    # Execution Upload Limits (checked while the request body is streamed in)
+    app.config['EXEC_MAX_FILES'] = int(os.getenv('EXEC_MAX_FILES', 500))
+    app.config['EXEC_MAX_FILE_BYTES'] = int(os.getenv('EXEC_MAX_FILE_BYTES', 1024 * 1024))
+    app.config['EXEC_MAX_TOTAL_BYTES'] = int(os.getenv('EXEC_MAX_TOTAL_BYTES', 8 * 1024 * 1024))  # All file contents of one run
+
+    # Stored Project File Index (flattened path -> content per project revision or version, for runs by project_id)
+    app.config['EXEC_FILE_INDEX_ENABLED'] = os.getenv('EXEC_FILE_INDEX_ENABLED', 'true').lower() == 'true'
+    app.config['EXEC_FILE_INDEX_MAX_ENTRIES'] = int(os.getenv('EXEC_FILE_INDEX_MAX_ENTRIES', 128))
+    app.config['EXEC_FILE_INDEX_MAX_BYTES'] = int(os.getenv('EXEC_FILE_INDEX_MAX_BYTES', 128 * 1024 * 1024))
+
+    # Language Runtime Configuration (images are pulled or built and verified when a worker boots)
+    app.config['RUNTIME_PREFETCH'] = os.getenv('RUNTIME_PREFETCH', 'true').lower() == 'true'
+    app.config['RUNTIME_READY_TIMEOUT'] = int(os.getenv('RUNTIME_READY_TIMEOUT', 30))  # Seconds a run waits on a runtime still being prepared
+
+    # Build Artifact Cache Configuration (compiled languages only)
+    app.config['BUILD_CACHE_ENABLED'] = os.getenv('BUILD_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['BUILD_CACHE_DIR'] = os.getenv('BUILD_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'codesdev-build-cache'))
+    app.config['BUILD_CACHE_MAX_BYTES'] = int(os.getenv('BUILD_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # For the whole directory, shared by every worker
+
+    # Execution Result Cache (opt-in: only for deployments whose runs are deterministic, e.g. teaching demos)
+    app.config['EXEC_RESULT_CACHE_ENABLED'] = os.getenv('EXEC_RESULT_CACHE_ENABLED', 'false').lower() == 'true'
+    app.config['EXEC_RESULT_CACHE_TTL'] = int(os.getenv('EXEC_RESULT_CACHE_TTL', 600))            # Seconds a result is served
+    app.config['EXEC_RESULT_CACHE_MAX_ENTRIES'] = int(os.getenv('EXEC_RESULT_CACHE_MAX_ENTRIES', 1024))
+    app.config['EXEC_RESULT_CACHE_MAX_BYTES'] = int(os.getenv('EXEC_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['EXEC_IMAGE_DIGEST_TTL'] = int(os.getenv('EXEC_IMAGE_DIGEST_TTL', 60))             # Seconds before an image tag is resolved again
+
+    # Execution Job Queue Configuration
+    app.config['EXEC_QUEUE_BACKEND'] = os.getenv('EXEC_QUEUE_BACKEND', 'sqlite')    # sqlite | memory (single process only)
+    app.config['EXEC_QUEUE_SQLITE_PATH'] = os.getenv('EXEC_QUEUE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'codesdev-jobs.sqlite'))  # Shared by every worker on the host
+    app.config['EXEC_WORKERS'] = int(os.getenv('EXEC_WORKERS', 4))
+    app.config['EXEC_QUEUE_MAX_DEPTH'] = int(os.getenv('EXEC_QUEUE_MAX_DEPTH', 64))
+    app.config['EXEC_MAX_JOBS_PER_USER'] = int(os.getenv('EXEC_MAX_JOBS_PER_USER', 2))
+    app.config['EXEC_JOB_RESULT_TTL'] = int(os.getenv('EXEC_JOB_RESULT_TTL', 300))     # Seconds finished jobs stay pollable
+    app.config['EXEC_JOB_LEASE'] = int(os.getenv('EXEC_JOB_LEASE', 30))               # Seconds before a running job whose worker stopped renewing it is failed
+    app.config['EXEC_SYNC_WAIT'] = float(os.getenv('EXEC_SYNC_WAIT', 2))         # Seconds /api/execute holds a request thread before answering 202 with the job id
+    app.config['EXEC_MAX_POLL_WAIT'] = float(os.getenv('EXEC_MAX_POLL_WAIT', 25))  # Upper bound for ?wait= long-polling
+
+    # Bounded Executors, expensive work runs off the request threads with its own concurrency cap
+    app.config['KDF_POOL'] = os.getenv('KDF_POOL', 'process')                 # process | thread
+    app.config['KDF_WORKERS'] = int(os.getenv('KDF_WORKERS', 2))               # Password hashes computed at once, per worker process
+    app.config['KDF_MAX_PENDING'] = int(os.getenv('KDF_MAX_PENDING', 32))      # Logins waiting beyond that before new ones get a 503
+    app.config['KDF_TIMEOUT'] = int(os.getenv('KDF_TIMEOUT', 10))
+    app.config['DOCKER_IO_WORKERS'] = int(os.getenv('DOCKER_IO_WORKERS', 16))  # Concurrent Docker daemon API calls
+    app.config['DOCKER_IO_MAX_PENDING'] = int(os.getenv('DOCKER_IO_MAX_PENDING', 64))
+    app.config['DOCKER_IO_TIMEOUT'] = int(os.getenv('DOCKER_IO_TIMEOUT', 30))  # Seconds before a daemon call is given up on
+
+    # Database Connection Pool (per worker process)
+    if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('postgresql'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            "pool_size": int(os.getenv('DB_POOL_SIZE', 10)),
+            "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 5)),
+            "pool_timeout": int(os.getenv('DB_POOL_TIMEOUT', 10)),     # Seconds to wait for a free connection
+            "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),   # Reconnect before idle connections get dropped
+            "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        }
+
+    # Define all possible places your frontend might run
+    app.config['CORS_ALLOWED_ORIGINS'] = [
+        "http://localhost",           # Docker/Nginx (Port 80)
+        "http://localhost:5173",      # Vite Local Dev
+        "http://127.0.0.1",           # IP based access
+        "http://127.0.0.1:5173",
+        os.environ.get("CORS_ORIGIN") # Environment variable backup
+    ]
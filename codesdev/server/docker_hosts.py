@@ -0,0 +1,293 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import docker
+
+from resource_profiles import CpuAdmission, CapacityExceeded
+from runtimes import RuntimeUnavailable
+
+PLACEMENTS = ("least_loaded", "capacity")
+
+
+class NoHostAvailable(CapacityExceeded):
+    pass
+
+
+def parse_hosts(spec):
+    # "name=base_url@cpus,..." -> [(name, base_url, cpus or None)]. The @cpus suffix is optional and
+    # an empty spec is the single daemon docker.from_env() finds (DOCKER_HOST, the default socket)
+    hosts = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, base_url = item.partition("=")
+        if not sep or not name.strip() or not base_url.strip():
+            raise ValueError(f"Execution hosts are name=base_url[@cpus], got '{item}'")
+        cpus = None
+        head, at, tail = base_url.rpartition("@")
+        if at:
+            try:
+                cpus = float(tail)
+                base_url = head
+            except ValueError:
+                pass  # An @ that belongs to the url, e.g. ssh://user@host
+        hosts.append((name.strip(), base_url.strip(), cpus))
+    if len({name for name, _, _ in hosts}) != len(hosts):
+        raise ValueError("Execution host names must be unique")
+    return hosts or [("local", None, None)]
+
+
+def docker_client(base_url=None):
+    return docker.DockerClient(base_url=base_url) if base_url else docker.from_env()
+
+
+class DockerHost:
+    # One Docker daemon runs can be placed on. pools and prefetcher are that daemon's own,
+    # admission is set by the scheduler so every host shares its condition
+    def __init__(self, name, client, capacity, base_url=None, pools=None, prefetcher=None):
+        self.name = name
+        self.client = client
+        self.capacity = capacity
+        self.base_url = base_url
+        self.pools = pools
+        self.prefetcher = prefetcher
+        self.admission = None
+
+        self.healthy = True    # Until a health check says otherwise
+        self.draining = False
+        self.failures = 0      # Consecutive, reset by any run that gets through
+        self.open_until = 0.0  # The circuit stays open until then, after that one trial run is let through
+        self.probing = False
+        self.last_error = None
+        self.images = set()    # Runtime images the last health check found, what we go by when nothing is prefetched
+        self.stats = {"placed": 0, "failures": 0, "trips": 0, "health_failures": 0}
+
+    def runtime_state(self, language, image):
+        if self.prefetcher is not None:
+            return self.prefetcher.state(language)
+        return "ready" if image in self.images else "pending"
+
+    def circuit(self, threshold, now=None):
+        if self.failures < threshold:
+            return "closed"
+        return "open" if (now or time.monotonic()) < self.open_until or self.probing else "half-open"
+
+    def snapshot(self, threshold):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "circuit": self.circuit(threshold),
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "admission": self.admission.snapshot(),
+            **self.stats,
+        }
+
+
+class HostScheduler:
+    # Places each run on one of several Docker daemons. Hosts that failed their last health check,
+    # are draining, have an open circuit or couldn't prepare the language's runtime are skipped. Of the
+    # rest, hosts where the runtime is ready come first, then the placement policy decides:
+    #   least_loaded  lowest share of the host's cores in use
+    #   capacity      most free cores, so bigger hosts take proportionally more
+    # When every eligible host is full the run waits for cores on any of them, up to acquire_timeout.
+    # Daemon errors during a run count against the host, failure_threshold in a row open its circuit
+    # for cooldown seconds
+    def __init__(self, hosts, images, placement="least_loaded", acquire_timeout=10, failure_threshold=3, cooldown=30,
+                 health_interval=10, drain_dir=None, ignore_errors=()):
+        if placement not in PLACEMENTS:
+            raise ValueError(f"Unknown placement '{placement}', expected one of {', '.join(PLACEMENTS)}")
+        self.hosts = {host.name: host for host in hosts}
+        self.images = images  # language -> runtime image
+        self.placement = placement
+        self.acquire_timeout = acquire_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.drain_dir = drain_dir
+        self.ignore_errors = ignore_errors  # Errors that aren't the daemon's fault, e.g. a full pool
+
+        self._cond = threading.Condition(threading.RLock())
+        for host in hosts:
+            host.admission = CpuAdmission(host.capacity, acquire_timeout, cond=self._cond)
+        self._stop = threading.Event()
+        self._threads = None
+        self.stats = {"placements": 0, "waits": 0, "rejected": 0, "unplaceable": 0, "wait_seconds_total": 0.0}
+
+    def primary(self):
+        return next(iter(self.hosts.values()))
+
+    def start(self):
+        # Health checks and runtime prefetches, one thread per host so a hung daemon only stalls itself
+        with self._cond:
+            if self._threads is not None:
+                return
+            self._threads = [threading.Thread(target=self._watch, args=(host,), name=f"docker-host-{host.name}",
+                                              daemon=True)
+                             for host in self.hosts.values()]
+        for thread in self._threads:
+            thread.start()
+        for host in self.hosts.values():
+            if host.prefetcher is not None:
+                host.prefetcher.start()
+
+    def shutdown(self):
+        self._stop.set()
+        for host in self.hosts.values():
+            if host.pools is not None:
+                host.pools.shutdown()
+
+    def _watch(self, host):
+        while not self._stop.is_set():
+            self.check(host)
+            self._stop.wait(self.health_interval)
+
+    def check(self, host):
+        if self.drain_dir:
+            self.drain(host.name, os.path.exists(os.path.join(self.drain_dir, host.name)))
+        try:
+            host.client.ping()
+            healthy, error = True, None
+        except Exception as e:
+            healthy, error = False, str(e)
+        # Without a prefetcher nothing else tells us which runtime images the daemon already has
+        images = host.images
+        if healthy and host.prefetcher is None:
+            images = set()
+            for image in set(self.images.values()):
+                try:
+                    host.client.images.get(image)
+                    images.add(image)
+                except Exception:
+                    pass
+        with self._cond:
+            if not healthy:
+                host.stats["health_failures"] += 1
+                host.last_error = error
+            host.healthy = healthy
+            host.images = images
+            self._cond.notify_all()
+
+    def drain(self, name, draining=True):
+        # Draining hosts finish what they are running but get nothing new, and give up their warm sandboxes
+        host = self.hosts[name]
+        with self._cond:
+            if host.draining == draining:
+                return
+            host.draining = draining
+            self._cond.notify_all()
+        if host.pools is not None:
+            host.pools.pause() if draining else host.pools.resume()
+
+    def _candidates(self, language):
+        # (eligible hosts best first, error to raise when there are none)
+        now = time.monotonic()
+        ranked, failed = [], []
+        for host in self.hosts.values():
+            if not host.healthy or host.draining or host.circuit(self.failure_threshold, now) == "open":
+                continue
+            state = host.runtime_state(language, self.images[language])
+            if state == "failed":
+                failed.append(host)
+                continue
+            if self.placement == "capacity":
+                load = host.admission.in_use - host.capacity
+            else:
+                load = host.admission.in_use / host.capacity
+            # Ties go to the host that has taken the fewest runs, so idle hosts share the work
+            ranked.append((state != "ready", load, host.stats["placed"], host))
+        ranked.sort(key=lambda entry: entry[:3])
+        if ranked:
+            return [entry[3] for entry in ranked], None
+        if failed:
+            return [], RuntimeUnavailable(f"The {language} runtime is unavailable: "
+                                          f"{failed[0].prefetcher.errors.get(language)}")
+        return [], NoHostAvailable("No execution host is available, please try again")
+
+    def reserve(self, language, cpus):
+        # (host, CPU reservation) on the best host with room for cpus
+        self.start()
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                hosts, error = self._candidates(language)
+                if error is not None:
+                    self.stats["unplaceable"] += 1
+                    raise error
+                for host in hosts:
+                    reservation = host.admission.try_reserve(cpus)
+                    if reservation is None:
+                        continue
+                    if host.circuit(self.failure_threshold) == "half-open":
+                        host.probing = True
+                    host.stats["placed"] += 1
+                    self.stats["placements"] += 1
+                    if waited:
+                        self.stats["wait_seconds_total"] += time.monotonic() - started
+                    return host, reservation
+                remaining = self.acquire_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.stats["rejected"] += 1
+                    raise CapacityExceeded("Every execution host is at capacity, please try again")
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                # Releases notify, health changes may not, so look again at least every second
+                self._cond.wait(min(remaining, 1.0))
+
+    @contextmanager
+    def place(self, language, cpus):
+        host, reservation = self.reserve(language, cpus)
+        outcome = None
+        try:
+            yield host
+            outcome = True
+        except self.ignore_errors:
+            raise
+        except Exception as e:
+            outcome = False
+            host.last_error = str(e)
+            raise
+        finally:
+            reservation.release()
+            self.record(host, outcome)
+
+    def record(self, host, ok):
+        # ok is None when the run ended for reasons that say nothing about the host
+        with self._cond:
+            host.probing = False
+            if ok:
+                host.failures = 0
+            elif ok is not None:
+                host.failures += 1
+                host.stats["failures"] += 1
+                if host.failures >= self.failure_threshold:
+                    host.open_until = time.monotonic() + self.cooldown
+                    host.stats["trips"] += 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "placement": self.placement,
+                **self.stats,
+                "hosts": {name: host.snapshot(self.failure_threshold) for name, host in self.hosts.items()},
+            }
+
+    def admission_snapshot(self):
+        # Every host's admission added up, the shape a single CpuAdmission snapshot has
+        totals = {"admitted": 0, "capacity": 0.0, "in_use": 0.0}
+        with self._cond:
+            for host in self.hosts.values():
+                data = host.admission.snapshot()
+                for key in totals:
+                    totals[key] += data[key]
+            totals.update({"waits": self.stats["waits"], "rejected": self.stats["rejected"],
+                           "wait_seconds_total": self.stats["wait_seconds_total"]})
+        totals["in_use"] = round(totals["in_use"], 3)
+        return totals
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import posixpath
+import tarfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import ijson
+except ImportError:  # Falls back to parsing the buffered body, the same limits still apply
+    ijson = None
+
+BLOCK = tarfile.BLOCKSIZE
+NUL = b"\0"
+
+
+def execution_key(language, image, entry_file, files):
+    # What decides a run: the language, the image (a tag for build artifacts, the exact image id for
+    # results), the entry point and every file. Order independent, the same project sent in a
+    # different order hits the same entry
+    digest = hashlib.sha256()
+    for part in (language, image, entry_file):
+        digest.update(part.encode('utf-8') + b"\0")
+    for file in sorted(files, key=lambda f: f['name']):
+        digest.update(file['name'].encode('utf-8') + b"\0")
+        digest.update((file['content'] or "").encode('utf-8') + b"\0")
+    return digest.hexdigest()
+
+
+class PayloadError(Exception):
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+class PayloadLimits:
+    def __init__(self, max_files, max_file_bytes, max_total_bytes):
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+
+    @property
+    def max_body_bytes(self):
+        # Room for JSON escaping and the other fields on top of the file contents themselves
+        return 2 * self.max_total_bytes + 64 * 1024
+
+    def check(self, files):
+        # The same limits for a file set that wasn't streamed in, e.g. stored files plus an overlay
+        if len(files) > self.max_files:
+            raise PayloadError(f"Too many files (limit {self.max_files})", 413)
+        total = 0
+        for content in files.values():
+            size = utf8_size(content)
+            if size > self.max_file_bytes:
+                raise PayloadError(f"A file exceeds {self.max_file_bytes} bytes", 413)
+            total += size
+        if total > self.max_total_bytes:
+            raise PayloadError(f"Files exceed {self.max_total_bytes} bytes in total", 413)
+
+
+def normalize_path(name):
+    # Relative POSIX path inside the sandbox working dir, None when the name can't be made one
+    if not isinstance(name, str) or not name or "\0" in name:
+        return None
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if path.startswith("/") or path in (".", "..") or path.startswith("../"):
+        return None
+    return path
+
+
+def utf8_size(text):
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+class FileCollector:
+    # Checks every limit as soon as the file it concerns has been read
+    def __init__(self, limits):
+        self.limits = limits
+        self.files = []
+        self.paths = set()
+        self.total = 0
+
+    def check_content(self, content):
+        if content is None:
+            return 0
+        if not isinstance(content, str):
+            raise PayloadError("File content must be a string")
+        size = utf8_size(content)
+        if size > self.limits.max_file_bytes:
+            raise PayloadError(f"A file exceeds {self.limits.max_file_bytes} bytes", 413)
+        if self.total + size > self.limits.max_total_bytes:
+            raise PayloadError(f"Files exceed {self.limits.max_total_bytes} bytes in total", 413)
+        return size
+
+    def add(self, name, content):
+        if len(self.files) >= self.limits.max_files:
+            raise PayloadError(f"Too many files (limit {self.limits.max_files})", 413)
+        path = normalize_path(name)
+        if path is None:
+            raise PayloadError(f"Invalid file path {name!r}")
+        if path in self.paths:
+            raise PayloadError(f"Duplicate file path '{path}'")
+        self.total += self.check_content(content)
+        self.paths.add(path)
+        self.files.append({"name": path, "content": content or ""})
+
+
+class StreamReader:
+    # ijson probes its input with read(0), which werkzeug's LimitedStream takes for a client disconnect
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size) if size else b""
+
+
+def parse_stream(stream, limits):
+    # Event by event: top-level scalars plus the files list, nothing else is accepted
+    data, collector = {}, FileCollector(limits)
+    current = None
+    try:
+        for prefix, event, value in ijson.parse(StreamReader(stream), use_float=True):
+            if prefix == "":
+                if event not in ("start_map", "map_key", "end_map"):
+                    raise PayloadError("Request body must be a JSON object")
+            elif prefix == "files":
+                if event == "start_array":
+                    data["files"] = collector.files
+                elif event != "end_array":
+                    raise PayloadError("'files' must be a list")
+            elif prefix == "files.item":
+                if event == "start_map":
+                    current = {}
+                elif event == "end_map":
+                    collector.add(current.get("name"), current.get("content"))
+                elif event != "map_key":
+                    raise PayloadError("Each file must be an object")
+            elif prefix in ("files.item.name", "files.item.content"):
+                if event not in ("string", "null"):
+                    raise PayloadError("File name and content must be strings")
+                if prefix == "files.item.content":
+                    collector.check_content(value)
+                current[prefix.rsplit(".", 1)[1]] = value
+            elif prefix.startswith("files.item."):
+                continue  # Other per-file fields (ids, types) aren't needed to run
+            elif "." not in prefix:
+                if event not in ("string", "number", "boolean", "null"):
+                    raise PayloadError(f"'{prefix}' must be a plain value")
+                data[prefix] = value
+    except ijson.JSONError:
+        raise PayloadError("Request body is not valid JSON")
+    return data
+
+
+def parse_buffered(body, limits):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise PayloadError("Request body is not valid JSON")
+    if not isinstance(data, dict):
+        raise PayloadError("Request body must be a JSON object")
+    if "files" in data:
+        if not isinstance(data["files"], list):
+            raise PayloadError("'files' must be a list")
+        collector = FileCollector(limits)
+        for file in data["files"]:
+            if not isinstance(file, dict):
+                raise PayloadError("Each file must be an object")
+            collector.add(file.get("name"), file.get("content"))
+        data["files"] = collector.files
+    return data
+
+
+def read_json_body(request, limits):
+    # Stream the body through the parser instead of buffering it for get_json(), an upload over
+    # a limit is refused as soon as the file crossing it has been read
+    if not request.is_json:
+        raise PayloadError("Request body must be JSON", 415)
+    request.max_content_length = limits.max_body_bytes
+    try:
+        if ijson is not None:
+            return parse_stream(request.stream, limits)
+        return parse_buffered(request.get_data(cache=False), limits)
+    except RequestEntityTooLarge:
+        raise PayloadError(f"Request body exceeds {limits.max_body_bytes} bytes", 413)
+
+
+def tar_stream(files, uid=0):
+    # Tar blocks generated lazily straight into put_archive, only one file is encoded at a time.
+    # Paths are expected to be normalized already. Everything is owned by uid, folders included, so
+    # an unprivileged sandbox user can write next to its files
+    folders = set()
+    for file in files:
+        parent = posixpath.dirname(file["name"])
+        missing = []
+        while parent and parent not in folders:
+            folders.add(parent)
+            missing.append(parent)
+            parent = posixpath.dirname(parent)
+        for folder in reversed(missing):
+            info = tarfile.TarInfo(folder)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.uid = info.gid = uid
+            yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+        data = file["content"].encode("utf-8")
+        info = tarfile.TarInfo(file["name"])
+        info.size = len(data)
+        info.mode = 0o644
+        info.uid = info.gid = uid
+        yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        if data:
+            yield data
+            if len(data) % BLOCK:
+                yield NUL * (BLOCK - len(data) % BLOCK)
+    # End of archive
+    yield NUL * (2 * BLOCK)
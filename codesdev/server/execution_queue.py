@@ -0,0 +1,455 @@
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+TERMINAL_STATES = (DONE, FAILED)
+
+log = logging.getLogger(__name__)
+
+# Result of a job whose worker went away mid-run
+INTERRUPTED = {"error": "Execution was interrupted, please run it again"}
+
+
+class QueueFull(Exception):
+    def __init__(self, msg, retry_after):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, user_id, payload, job_id=None, status=QUEUED, result=None, status_code=None,
+                 created_at=None, started_at=None, finished_at=None, worker_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.user_id = user_id
+        self.payload = payload
+        self.status = status
+        self.result = result
+        self.status_code = status_code
+        self.created_at = created_at or time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.worker_id = worker_id  # Set before the job runs when only that process may run it
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "queued_seconds": None,
+            "run_seconds": None,
+        }
+        if self.started_at:
+            data["queued_seconds"] = round(self.started_at - self.created_at, 4)
+        if self.finished_at and self.started_at:
+            data["run_seconds"] = round(self.finished_at - self.started_at, 4)
+        if self.status in TERMINAL_STATES:
+            data["result"] = self.result
+            data["status_code"] = self.status_code
+        return data
+
+
+# Queue Backends
+# Both expose the same small interface so the workers don't care where jobs live
+class MemoryJobBackend:
+    def __init__(self):
+        self._jobs = {}
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def push(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job.id)
+
+    def pop(self, worker_id=None):
+        with self._lock:
+            while self._pending:
+                job = self._jobs.get(self._pending.popleft())
+                if job and job.status == QUEUED:
+                    job.status = RUNNING
+                    job.started_at = time.time()
+                    return job
+        return None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def finish(self, job_id, status, result, status_code):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.status = status
+                job.result = result
+                job.status_code = status_code
+                job.finished_at = time.time()
+
+    def heartbeat(self, worker_id):
+        pass  # Jobs live and die with this process, nothing can be orphaned
+
+    def expire(self, stale_before, worker_id=None):
+        return 0
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def count_active(self, user_id):
+        with self._lock:
+            return sum(1 for job in self._jobs.values()
+                       if job.user_id == user_id and job.status not in TERMINAL_STATES)
+
+    def prune(self, older_than):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.status in TERMINAL_STATES and job.finished_at < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SQLiteJobBackend:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS execution_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            result TEXT,
+            status_code INTEGER,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            worker_id TEXT,
+            heartbeat_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS ix_execution_jobs_status ON execution_jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS ix_execution_jobs_user ON execution_jobs (user_id, status);
+    """
+
+    def __init__(self, path=":memory:"):
+        # Several gunicorn workers can share one file, WAL lets them read while another claims a job
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+            # Files created before jobs carried a lease
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(execution_jobs)")}
+            for column, kind in (("worker_id", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE execution_jobs ADD COLUMN {column} {kind}")
+
+    def _to_job(self, row):
+        if row is None:
+            return None
+        return Job(
+            user_id=row["user_id"],
+            payload=json.loads(row["payload"]),
+            job_id=row["id"],
+            status=row["status"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            status_code=row["status_code"],
+            created_at=row["created_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+            worker_id=row["worker_id"],
+        )
+
+    def push(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO execution_jobs (id, user_id, status, payload, created_at, worker_id, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.user_id, job.status, json.dumps(job.payload), job.created_at, job.worker_id,
+                 job.created_at if job.worker_id else None)
+            )
+
+    def pop(self, worker_id=None):
+        with self._lock:
+            # Claim the oldest queued job atomically, other processes may share the file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs pinned to another process are left to it
+                row = self._conn.execute(
+                    "SELECT * FROM execution_jobs WHERE status = ? AND (worker_id IS NULL OR worker_id = ?) "
+                    "ORDER BY created_at LIMIT 1", (QUEUED, worker_id)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                started_at = time.time()
+                self._conn.execute(
+                    "UPDATE execution_jobs SET status = ?, started_at = ?, worker_id = ?, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, started_at, worker_id, started_at, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._to_job(row)
+        job.status = RUNNING
+        job.started_at = started_at
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM execution_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def finish(self, job_id, status, result, status_code):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE execution_jobs SET status = ?, result = ?, status_code = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result), status_code, time.time(), job_id)
+            )
+
+    def heartbeat(self, worker_id):
+        # Renews the lease on every job this process is running or has pinned to itself
+        with self._lock:
+            self._conn.execute(
+                "UPDATE execution_jobs SET heartbeat_at = ? WHERE worker_id = ? AND status IN (?, ?)",
+                (time.time(), worker_id, QUEUED, RUNNING)
+            )
+
+    def expire(self, stale_before, worker_id=None):
+        # Fails running (and pinned queued) jobs whose process stopped renewing the lease, a recycled
+        # or killed worker, or all of worker_id's. They are not run again, the program may have been the cause
+        result = json.dumps(INTERRUPTED)
+        with self._lock:
+            if worker_id is None:
+                cursor = self._conn.execute(
+                    "UPDATE execution_jobs SET status = ?, result = ?, status_code = ?, finished_at = ? "
+                    "WHERE (status = ? OR (status = ? AND worker_id IS NOT NULL)) "
+                    "AND COALESCE(heartbeat_at, started_at) < ?",
+                    (FAILED, result, 500, time.time(), RUNNING, QUEUED, stale_before)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE execution_jobs SET status = ?, result = ?, status_code = ?, finished_at = ? "
+                    "WHERE status IN (?, ?) AND worker_id = ?",
+                    (FAILED, result, 500, time.time(), QUEUED, RUNNING, worker_id)
+                )
+            return cursor.rowcount
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM execution_jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+
+    def count_active(self, user_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM execution_jobs WHERE user_id = ? AND status IN (?, ?)",
+                (user_id, QUEUED, RUNNING)
+            ).fetchone()[0]
+
+    def prune(self, older_than):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM execution_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, older_than)
+            )
+
+
+def make_backend(name, sqlite_path=":memory:"):
+    if name == "memory":
+        return MemoryJobBackend()
+    if name == "sqlite":
+        return SQLiteJobBackend(sqlite_path)
+    raise ValueError(f"Unknown execution queue backend '{name}'")
+
+
+class ExecutionQueue:
+    def __init__(self, backend, runner, workers=4, max_depth=64, max_per_user=2, result_ttl=300,
+                 poll_interval=0.5, lease=30):
+        self.backend = backend
+        self.runner = runner
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        # Running jobs are claimed for lease seconds and renewed every third of it, a job whose
+        # claim runs out belonged to a process that died and is failed
+        self.lease = lease
+        self.worker_id = uuid.uuid4().hex[:12]
+
+        self._cond = threading.Condition()       # Stats, and request threads waiting on a job
+        self._work_cond = threading.Condition()  # Idle workers waiting for a submit
+        self._submit_lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+        self._running = 0
+        self._runners = {}  # job id -> runner of a job pinned to this process
+
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_full": 0,
+            "rejected_user_cap": 0,
+            "expired": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+            "run_seconds_max": 0.0,
+        }
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"exec-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._keep_leases, name="exec-lease", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self):
+        self._stop.set()
+        with self._work_cond:
+            self._work_cond.notify_all()
+        # Worker threads die with the process, don't leave their jobs for the lease to run out
+        if self._threads:
+            self.backend.expire(time.time(), worker_id=self.worker_id)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _keep_leases(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                self.backend.heartbeat(self.worker_id)
+                expired = self.backend.expire(time.time() - self.lease)
+            except Exception:
+                log.warning("Execution lease upkeep failed", exc_info=True)
+                continue
+            if expired:
+                with self._cond:
+                    self.stats["expired"] += expired
+                    self._cond.notify_all()
+
+    def _retry_after(self, depth):
+        # Rough drain estimate: queued jobs spread over the workers at the average run time
+        finished = self.stats["completed"] + self.stats["failed"]
+        avg_run = self.stats["run_seconds_total"] / finished if finished else 1.0
+        return max(1, math.ceil((depth + 1) / max(self.workers, 1) * avg_run))
+
+    def submit(self, user_id, payload, runner=None):
+        # A job with its own runner is pinned to this process, only its workers pick it up. That's how
+        # a run streams: the runner passes output to the request thread waiting on it here.
+        # Serialize the admission checks with the push so concurrent submits can't overshoot the caps
+        with self._submit_lock:
+            depth = self.backend.depth()
+            if depth >= self.max_depth:
+                with self._cond:
+                    self.stats["rejected_full"] += 1
+                raise QueueFull("Execution queue is full", self._retry_after(depth))
+
+            if self.max_per_user and self.backend.count_active(user_id) >= self.max_per_user:
+                with self._cond:
+                    self.stats["rejected_user_cap"] += 1
+                raise QueueFull("Too many executions in progress for this user", self._retry_after(0))
+
+            job = Job(user_id, payload, worker_id=self.worker_id if runner else None)
+            if runner:
+                with self._cond:
+                    self._runners[job.id] = runner
+            self.backend.push(job)
+
+        with self._cond:
+            self.stats["submitted"] += 1
+        with self._work_cond:
+            self._work_cond.notify()
+        return job
+
+    def get(self, job_id):
+        return self.backend.get(job_id)
+
+    def wait(self, job_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.backend.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._cond:
+                self._cond.wait(min(remaining, self.poll_interval))
+
+    def _work(self):
+        last_prune = time.monotonic()
+        while not self._stop.is_set():
+            # A backend error (e.g. sqlite "database is locked") must not kill the thread, a claimed
+            # job that couldn't be finished is handed back when its lease runs out
+            try:
+                last_prune = self._work_once(last_prune)
+            except Exception:
+                log.exception("Execution worker iteration failed")
+                self._stop.wait(self.poll_interval)
+
+    def _work_once(self, last_prune):
+        job = self.backend.pop(self.worker_id)
+        if job is None:
+            if time.monotonic() - last_prune > self.result_ttl:
+                self.backend.prune(time.time() - self.result_ttl)
+                last_prune = time.monotonic()
+            with self._work_cond:
+                self._work_cond.wait(self.poll_interval)
+            return last_prune
+
+        with self._cond:
+            self._running += 1
+            runner = self._runners.pop(job.id, self.runner)
+        try:
+            try:
+                result, status_code = runner(job.payload)
+                status = DONE
+            except Exception as e:
+                result, status_code = {"error": f"Execution failed: {str(e)}"}, 500
+                status = FAILED
+            self.backend.finish(job.id, status, result, status_code)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+        run_time = time.time() - job.started_at
+        wait_time = job.started_at - job.created_at
+        with self._cond:
+            self.stats["completed" if status == DONE else "failed"] += 1
+            self.stats["wait_seconds_total"] += wait_time
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], wait_time)
+            self.stats["run_seconds_total"] += run_time
+            self.stats["run_seconds_max"] = max(self.stats["run_seconds_max"], run_time)
+        return last_prune
+
+    def snapshot(self):
+        depth = self.backend.depth()
+        with self._cond:
+            data = dict(self.stats)
+            data.update({
+                "depth": depth,
+                "running": self._running,
+                "workers": self.workers,
+                "max_depth": self.max_depth,
+                "max_per_user": self.max_per_user,
+            })
+        finished = data["completed"] + data["failed"]
+        data["wait_seconds_avg"] = round(data["wait_seconds_total"] / finished, 4) if finished else 0.0
+        data["run_seconds_avg"] = round(data["run_seconds_total"] / finished, 4) if finished else 0.0
+        return data
@@ -0,0 +1,109 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class ExecutorBusy(Exception):
+    def __init__(self, msg, retry_after):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class ExecutorTimeout(Exception):
+    pass
+
+
+def process_pool(max_workers):
+    # forkserver, not fork: the web worker has threads running and forking those copies held locks
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('forkserver'))
+
+
+def thread_pool(name):
+    return lambda max_workers: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+
+class BoundedExecutor:
+    # Runs one class of expensive work on its own pool so it can't take the request threads with it.
+    # At most max_workers run and max_pending wait, anything past that is rejected straight away.
+    def __init__(self, name, factory, max_workers, max_pending, timeout):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._factory = factory
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0,
+            "seconds_total": 0.0, "seconds_max": 0.0,
+        }
+
+    def _pool(self):
+        # Created on first use, process pools must not exist before gunicorn forks its workers
+        if self._executor is None:
+            self._executor = self._factory(self.max_workers)
+        return self._executor
+
+    def _done(self, future, started):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled():
+                return
+            self.stats["completed" if future.exception() is None else "failed"] += 1
+            self.stats["seconds_total"] += elapsed
+            self.stats["seconds_max"] = max(self.stats["seconds_max"], elapsed)
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self.stats["rejected"] += 1
+                raise ExecutorBusy(f"Too many {self.name} operations in progress", retry_after=1)
+            self._in_flight += 1
+            self.stats["submitted"] += 1
+            try:
+                future = self._pool().submit(fn, *args, **kwargs)
+            except BrokenExecutor:
+                # A crashed child poisons the whole process pool, start a fresh one next time
+                self._in_flight -= 1
+                self._executor = None
+                raise
+            except Exception:
+                self._in_flight -= 1
+                raise
+
+        started = time.monotonic()
+        future.add_done_callback(lambda f: self._done(f, started))
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            # Still queued work is dropped, work already running keeps its slot until it finishes
+            future.cancel()
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise ExecutorTimeout(f"{self.name} operation timed out")
+        except BrokenExecutor:
+            with self._lock:
+                self._executor = None
+            raise
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            in_flight = self._in_flight
+        finished = data["completed"] + data["failed"]
+        data.update({
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.max_workers),
+            "seconds_avg": round(data["seconds_total"] / finished, 4) if finished else None,
+        })
+        return data
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,34 @@
+import threading
+
+import docker
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_jwt_extended import JWTManager
+from sqlalchemy.orm import DeclarativeBase
+
+# Define the Declarative Base
+class Base(DeclarativeBase):
+    pass
+
+# Extensions are created unbound and attached to the app in create_app()
+db = SQLAlchemy(model_class=Base)
+migrate = Migrate()
+jwt = JWTManager()
+
+class LazyDockerClient:
+    # Connects to the Docker daemon on first use, so importing or forking the app never does.
+    # factory defaults to docker.from_env, benchmarks pass a fake (see bench/fake_docker.py)
+    def __init__(self, factory=None):
+        self._factory = factory or docker.from_env
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,115 @@
+# File-level operations on the client's folderStructureData tree
+# Nodes look like {id, name, type: 'file' | 'folder', parent, content?, children?}
+
+
+class PatchError(Exception):
+    pass
+
+
+def index_tree(tree):
+    # id -> (node, list that contains it)
+    index = {}
+    stack = [tree]
+    while stack:
+        items = stack.pop()
+        for node in items:
+            index[node['id']] = (node, items)
+            if node.get('type') == 'folder':
+                stack.append(node.setdefault('children', []))
+    return index
+
+
+def _children_of(index, tree, parent_id):
+    if parent_id is None:
+        return tree
+    if parent_id not in index:
+        raise PatchError(f"Parent {parent_id} does not exist")
+    parent, _ = index[parent_id]
+    if parent.get('type') != 'folder':
+        raise PatchError(f"Parent {parent_id} is not a folder")
+    return parent.setdefault('children', [])
+
+
+def _forget(index, node):
+    index.pop(node['id'], None)
+    for child in node.get('children') or []:
+        _forget(index, child)
+
+
+def _is_descendant(node, target_id):
+    for child in node.get('children') or []:
+        if child['id'] == target_id or _is_descendant(child, target_id):
+            return True
+    return False
+
+
+def _is_id(value):
+    return isinstance(value, (int, str)) and not isinstance(value, bool)
+
+
+def apply_ops(tree, ops):
+    index = index_tree(tree)
+
+    for position, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise PatchError(f"Operation {position} must be an object")
+        kind = op.get('op')
+        node_id = op.get('id')
+        if node_id is None:
+            raise PatchError(f"Operation {position} is missing an id")
+        if not _is_id(node_id) or not (op.get('parent') is None or _is_id(op['parent'])):
+            raise PatchError(f"Operation {position} ids must be numbers or strings")
+
+        if kind == 'upsert':
+            if node_id in index:
+                node, _ = index[node_id]
+                if 'content' in op:
+                    if node.get('type') != 'file':
+                        raise PatchError(f"Node {node_id} is not a file")
+                    node['content'] = op['content']
+                if 'name' in op:
+                    node['name'] = op['name']
+                continue
+
+            node_type = op.get('type', 'file')
+            if node_type not in ('file', 'folder') or not op.get('name'):
+                raise PatchError(f"Operation {position} needs a name and a valid type to create node {node_id}")
+            siblings = _children_of(index, tree, op.get('parent'))
+            node = {"id": node_id, "name": op['name'], "type": node_type, "parent": op.get('parent')}
+            if node_type == 'file':
+                node['content'] = op.get('content', "")
+            else:
+                node['children'] = []
+            siblings.append(node)
+            index[node_id] = (node, siblings)
+
+        elif kind == 'rename':
+            if node_id not in index or not op.get('name'):
+                raise PatchError(f"Cannot rename node {node_id}")
+            index[node_id][0]['name'] = op['name']
+
+        elif kind == 'move':
+            if node_id not in index:
+                raise PatchError(f"Cannot move missing node {node_id}")
+            node, siblings = index[node_id]
+            new_parent = op.get('parent')
+            if new_parent == node_id or (new_parent is not None and _is_descendant(node, new_parent)):
+                raise PatchError(f"Cannot move node {node_id} into its own subtree")
+            target = _children_of(index, tree, new_parent)
+            siblings.remove(node)
+            node['parent'] = new_parent
+            target.append(node)
+            index[node_id] = (node, target)
+
+        elif kind == 'delete':
+            if node_id not in index:
+                # Already gone, deletes are idempotent so client retries are harmless
+                continue
+            node, siblings = index[node_id]
+            siblings.remove(node)
+            _forget(index, node)
+
+        else:
+            raise PatchError(f"Unknown operation '{kind}'")
+
+    return tree
@@ -0,0 +1,29 @@
+import os
+
+# Production serving: python app.py is the single process Werkzeug dev server
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5001')
+
+# Requests mostly wait on Postgres and Docker, so threads per worker go further than extra processes
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', (os.cpu_count() or 1) + 1))
+os.environ['WEB_CONCURRENCY'] = str(workers)  # Workers split the host's execution CPU capacity by this
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# SSE streams and ?wait= polls hold a thread for the length of a run
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+reload = os.getenv('GUNICORN_RELOAD', 'false').lower() == 'true'
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Start health checking the Docker hosts and pull and verify the runtime images on each as a worker
+    # boots rather than on its first run, along with the version compactor and the blocklist purger
+    worker.wsgi.extensions['codesdev'].start_background()
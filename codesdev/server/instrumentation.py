@@ -0,0 +1,187 @@
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    # In-process registry rendered in the Prometheus text format. Each gunicorn worker keeps its own
+    # and a scrape reads whichever worker answers it, rates still come out right over time
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}    # name -> (type, help, buckets)
+        self._series = {}  # name -> {labels: value, or [bucket counts..., sum, count] for histograms}
+        self._collectors = []
+
+    def histogram(self, name, help, buckets):
+        self._meta[name] = ("histogram", help, tuple(buckets))
+        self._series[name] = {}
+
+    def counter(self, name, help):
+        self._meta[name] = ("counter", help, None)
+        self._series[name] = {}
+
+    def collector(self, fn):
+        # fn() -> [(name, type, help, {labels tuple: value})], read at scrape time only
+        self._collectors.append(fn)
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name].get(key)
+            if series is None:
+                series = self._series[name][key] = [0] * (len(buckets) + 2)
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[name][key] = self._series[name].get(key, 0) + amount
+
+    def render(self):
+        lines = []
+        with self._lock:
+            snapshot = {name: {key: list(value) if isinstance(value, list) else value
+                               for key, value in series.items()}
+                        for name, series in self._series.items()}
+        for name, series in snapshot.items():
+            kind, help, buckets = self._meta[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, ('le', format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels, ('le', '+Inf'))} {value[-1]}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(value[-2])}")
+                lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                continue
+            for name, kind, help, series in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and "request_stats" in g:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if started and has_app_context() and "request_stats" in g:
+        stats = g.request_stats
+        stats["db_queries"] += 1
+        stats["db_seconds"] += time.perf_counter() - started.pop()
+
+
+def json_logger(name):
+    # One JSON object per line on stderr, next to gunicorn's own logs
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class Instrumentation:
+    # Per-route latency and per-request SQL accounting. Nothing is hooked in unless it is enabled,
+    # so a disabled deployment pays nothing beyond a None check at the execution timing points
+    _listening = False
+
+    def __init__(self, metrics, log_sample_rate=0.0, slow_request_seconds=1.0, logger=None):
+        self.metrics = metrics
+        self.log_sample_rate = log_sample_rate
+        self.slow_request_seconds = slow_request_seconds
+        self.logger = logger or json_logger("codesdev.requests")
+
+        metrics.histogram("http_request_duration_seconds", "Request latency by route", LATENCY_BUCKETS)
+        metrics.histogram("db_queries_per_request", "SQL statements executed per request", QUERY_BUCKETS)
+        metrics.histogram("db_seconds_per_request", "Time spent in SQL per request", LATENCY_BUCKETS)
+        metrics.histogram("execution_phase_seconds", "Time spent in each step of a run", LATENCY_BUCKETS)
+        metrics.histogram("execution_payload_bytes", "File contents placed in the sandbox per run", SIZE_BUCKETS)
+        metrics.histogram("execution_payload_files", "Files placed in the sandbox per run", COUNT_BUCKETS)
+        metrics.counter("execution_runs_total", "Finished runs by outcome")
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        # Engine-wide listeners, they only count statements run inside an instrumented request
+        if not Instrumentation._listening:
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+            Instrumentation._listening = True
+
+    def before_request(self):
+        g.request_stats = {"started": time.perf_counter(), "db_queries": 0, "db_seconds": 0.0}
+
+    def after_request(self, response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats["started"]
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        self.metrics.observe("http_request_duration_seconds", elapsed, method=request.method, route=route,
+                             status=str(response.status_code))
+        self.metrics.observe("db_queries_per_request", stats["db_queries"], route=route)
+        self.metrics.observe("db_seconds_per_request", stats["db_seconds"], route=route)
+
+        # Slow requests are always logged, the rest only at the sample rate
+        if elapsed >= self.slow_request_seconds or (self.log_sample_rate and random.random() < self.log_sample_rate):
+            self.logger.info(json.dumps({
+                "event": "request",
+                "method": request.method,
+                "route": route,
+                "path": request.path,
+                "status": response.status_code,
+                "ms": round(elapsed * 1000, 2),
+                "db_queries": stats["db_queries"],
+                "db_ms": round(stats["db_seconds"] * 1000, 2),
+                "bytes": response.calculate_content_length(),
+                "slow": elapsed >= self.slow_request_seconds,
+            }))
+        return response
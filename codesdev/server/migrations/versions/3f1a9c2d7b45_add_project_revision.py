@@ -0,0 +1,26 @@
+"""Add project revision for optimistic concurrency
+
+Revision ID: 3f1a9c2d7b45
+Revises: c7d0ec70ac20
+Create Date: 2026-10-18 15:02:11.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2d7b45'
+down_revision = 'c7d0ec70ac20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_column('revision')
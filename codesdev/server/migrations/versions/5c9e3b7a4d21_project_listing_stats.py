@@ -0,0 +1,50 @@
+"""Project listing stats
+
+Revision ID: 5c9e3b7a4d21
+Revises: d4a7e1c9b2f8
+Create Date: 2026-10-18 16:48:39.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c9e3b7a4d21'
+down_revision = 'd4a7e1c9b2f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('total_bytes', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Backfill SQL-side from the skeletons and blob sizes, no tree ever comes back to Python
+    op.execute("""
+        UPDATE projects p
+        SET file_count = stats.file_count,
+            total_bytes = stats.total_bytes,
+            updated_at = p.created_at
+        FROM (
+            SELECT p2.id,
+                   COUNT(refs.hash) AS file_count,
+                   COALESCE(SUM(b.size), 0) AS total_bytes
+            FROM projects p2
+            LEFT JOIN LATERAL (
+                SELECT value #>> '{}' AS hash FROM jsonb_path_query(p2.file_tree, 'strict $.**.blob') AS value
+            ) refs ON true
+            LEFT JOIN file_blobs b ON b.hash = refs.hash
+            GROUP BY p2.id
+        ) stats
+        WHERE stats.id = p.id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('total_bytes')
+        batch_op.drop_column('file_count')
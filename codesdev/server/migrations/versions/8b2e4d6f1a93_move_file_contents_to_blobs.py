@@ -0,0 +1,141 @@
+"""Move file contents out of file_tree JSONB into content-addressed blobs
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1a9c2d7b45
+Create Date: 2026-10-18 15:31:47.120934
+
+"""
+import hashlib
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a93'
+down_revision = '3f1a9c2d7b45'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 200
+COMPRESS_MIN_BYTES = 1024
+
+# Self-contained copies of the storage helpers, migrations must not import the app
+blobs_table = sa.table(
+    'file_blobs',
+    sa.column('hash', sa.String),
+    sa.column('data', sa.LargeBinary),
+    sa.column('encoding', sa.String),
+    sa.column('size', sa.Integer),
+)
+
+
+def _strip(items, blobs):
+    skeleton = []
+    for node in items or []:
+        copy = {k: v for k, v in node.items() if k not in ('content', 'children')}
+        if node.get('type') == 'folder':
+            copy['children'] = _strip(node.get('children'), blobs)
+        elif 'content' in node:
+            content = node['content'] or ""
+            digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            blobs[digest] = content
+            copy['blob'] = digest
+        skeleton.append(copy)
+    return skeleton
+
+
+def _fill(items, contents):
+    tree = []
+    for node in items or []:
+        copy = {k: v for k, v in node.items() if k not in ('blob', 'children')}
+        if node.get('type') == 'folder':
+            copy['children'] = _fill(node.get('children'), contents)
+        elif 'blob' in node:
+            copy['content'] = contents.get(node['blob'], "")
+        tree.append(copy)
+    return tree
+
+
+def _insert_blobs(bind, blobs):
+    rows = []
+    for digest, content in blobs.items():
+        raw = content.encode('utf-8')
+        data, encoding = raw, 'identity'
+        if len(raw) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                data, encoding = packed, 'zlib'
+        rows.append({"hash": digest, "data": data, "encoding": encoding, "size": len(raw)})
+    if rows:
+        bind.execute(postgresql.insert(blobs_table).on_conflict_do_nothing(index_elements=['hash']), rows)
+
+
+def _rewrite(bind, table, column, transform):
+    ids = [row[0] for row in bind.execute(sa.text(f"SELECT id FROM {table} ORDER BY id"))]
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        rows = bind.execute(
+            sa.text(f"SELECT id, {column} FROM {table} WHERE id IN :ids").bindparams(sa.bindparam('ids', expanding=True)),
+            {"ids": chunk}
+        ).fetchall()
+        for row_id, tree in rows:
+            bind.execute(
+                sa.text(f"UPDATE {table} SET {column} = CAST(:tree AS JSONB) WHERE id = :id"),
+                {"tree": json.dumps(transform(tree)), "id": row_id}
+            )
+
+
+def upgrade():
+    op.create_table('file_blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('encoding', sa.String(length=10), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+
+    bind = op.get_bind()
+
+    def dehydrate(tree):
+        blobs = {}
+        skeleton = _strip(tree, blobs)
+        _insert_blobs(bind, blobs)
+        return skeleton
+
+    _rewrite(bind, 'projects', 'file_tree', dehydrate)
+    _rewrite(bind, 'versions', 'file_tree_snapshot', dehydrate)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    def rehydrate(tree):
+        hashes = set()
+        stack = [tree or []]
+        while stack:
+            for node in stack.pop():
+                if node.get('blob'):
+                    hashes.add(node['blob'])
+                if node.get('children'):
+                    stack.append(node['children'])
+        contents = {}
+        if hashes:
+            rows = bind.execute(
+                sa.text("SELECT hash, data, encoding FROM file_blobs WHERE hash IN :hashes")
+                .bindparams(sa.bindparam('hashes', expanding=True)),
+                {"hashes": list(hashes)}
+            )
+            for digest, data, encoding in rows:
+                raw = zlib.decompress(data) if encoding == 'zlib' else bytes(data)
+                contents[digest] = raw.decode('utf-8')
+        return _fill(tree, contents)
+
+    _rewrite(bind, 'projects', 'file_tree', rehydrate)
+    _rewrite(bind, 'versions', 'file_tree_snapshot', rehydrate)
+
+    op.drop_table('file_blobs')
@@ -0,0 +1,75 @@
+"""Move custom avatars out of users into the avatar store
+
+Revision ID: a6c3d9e1f5b2
+Revises: e2b8f4c6a1d7
+Create Date: 2026-10-18 18:05:52.734019
+
+"""
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+# Image processing is too involved to copy here, the store module has no app dependencies
+from avatar_store import AvatarStore, LocalAvatarBackend, AvatarError
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3d9e1f5b2'
+down_revision = 'e2b8f4c6a1d7'
+branch_labels = None
+depends_on = None
+
+users_table = sa.table(
+    'users',
+    sa.column('id', sa.Integer),
+    sa.column('avatar_url', sa.Text),
+    sa.column('avatar_file', sa.String),
+)
+
+
+def _store():
+    return AvatarStore(LocalAvatarBackend(current_app.config['AVATAR_DIR']), size=current_app.config['AVATAR_SIZE'])
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_file', sa.String(length=80), nullable=True))
+
+    bind = op.get_bind()
+    store = _store()
+    rows = bind.execute(
+        sa.select(users_table.c.id, users_table.c.avatar_url).where(users_table.c.avatar_url.isnot(None))
+    ).all()
+    for user_id, avatar_url in rows:
+        try:
+            name = store.save(avatar_url)
+        except AvatarError:
+            # Unreadable legacy uploads fall back to the preset avatar
+            name = None
+        bind.execute(users_table.update().where(users_table.c.id == user_id).values(avatar_file=name))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('avatar_url')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_url', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    store = _store()
+    rows = bind.execute(
+        sa.select(users_table.c.id, users_table.c.avatar_file).where(users_table.c.avatar_file.isnot(None))
+    ).all()
+    for user_id, name in rows:
+        try:
+            data = store.backend.get(name)
+        except OSError:
+            continue
+        data_url = "data:image/webp;base64," + base64.b64encode(data).decode('ascii')
+        bind.execute(users_table.update().where(users_table.c.id == user_id).values(avatar_url=data_url))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('avatar_file')
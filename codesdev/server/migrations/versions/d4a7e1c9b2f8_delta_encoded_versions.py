@@ -0,0 +1,36 @@
+"""Delta encoded versions
+
+Revision ID: d4a7e1c9b2f8
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-18 16:12:05.553871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e1c9b2f8'
+down_revision = '8b2e4d6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows hold full snapshots, so they all become keyframes (base_id NULL, depth 0)
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('base_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_versions_base_id'), ['base_id'], unique=False)
+
+
+def downgrade():
+    # Deltas can't be expanded in SQL, refuse rather than leave broken snapshots behind
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT COUNT(*) FROM versions WHERE base_id IS NOT NULL")).scalar():
+        raise RuntimeError("Cannot downgrade while delta-encoded versions exist")
+
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_versions_base_id'))
+        batch_op.drop_column('depth')
+        batch_op.drop_column('base_id')
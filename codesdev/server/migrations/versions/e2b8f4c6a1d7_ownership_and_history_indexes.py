@@ -0,0 +1,37 @@
+"""Ownership and history indexes
+
+Revision ID: e2b8f4c6a1d7
+Revises: 5c9e3b7a4d21
+Create Date: 2026-10-18 17:32:10.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8f4c6a1d7'
+down_revision = '5c9e3b7a4d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so existing deployments keep serving writes while the indexes build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_projects_user_id_created_at', 'projects', ['user_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_versions_project_id_created_at', 'versions', ['project_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_versions_autosave_created_at', 'versions', ['created_at'],
+                        unique=False, postgresql_where=sa.text('label IS NULL'), postgresql_concurrently=True)
+        op.create_index('ix_token_blocklist_created_at', 'token_blocklist', ['created_at'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_token_blocklist_created_at', table_name='token_blocklist', postgresql_concurrently=True)
+        op.drop_index('ix_versions_autosave_created_at', table_name='versions', postgresql_concurrently=True)
+        op.drop_index('ix_versions_project_id_created_at', table_name='versions', postgresql_concurrently=True)
+        op.drop_index('ix_projects_user_id_created_at', table_name='projects', postgresql_concurrently=True)
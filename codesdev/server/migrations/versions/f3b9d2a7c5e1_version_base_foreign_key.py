@@ -0,0 +1,36 @@
+"""Version base foreign key
+
+Revision ID: f3b9d2a7c5e1
+Revises: a6c3d9e1f5b2
+Create Date: 2026-10-18 19:24:37.906152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2a7c5e1'
+down_revision = 'a6c3d9e1f5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Deltas whose base was already compacted away can't be rebuilt, drop them (and anything built on
+    # them) so the constraint can be added
+    bind = op.get_bind()
+    while bind.execute(sa.text(
+        "DELETE FROM versions WHERE base_id IS NOT NULL AND base_id NOT IN (SELECT id FROM versions)"
+    )).rowcount:
+        pass
+
+    # Deferred so deleting a whole chain in one transaction (project deletes) never trips over row order
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_versions_base_id_versions', 'versions', ['base_id'], ['id'],
+                                    deferrable=True, initially='DEFERRED')
+
+
+def downgrade():
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_versions_base_id_versions', type_='foreignkey')
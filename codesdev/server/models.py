@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Optional, List
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import String, Integer, BigInteger, DateTime, ForeignKey, Boolean, LargeBinary, Index, func, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from extensions import db
+
+# Database Models
+class User(db.Model):
+    __tablename__ = 'users'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    username: Mapped[str] = mapped_column(String(80), unique=True, nullable=False)
+    email: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
+    password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    avatar_id: Mapped[Optional[str]] = mapped_column(String(50), default="default")
+    # Custom avatars live in the avatar store, the row only keeps the file name
+    avatar_file: Mapped[Optional[str]] = mapped_column(String(80))
+    
+    # Explicit 2.0 relationship
+    projects: Mapped[List["Project"]] = relationship(back_populates="owner", cascade="all, delete-orphan")
+
+class Project(db.Model):
+    __tablename__ = 'projects'
+    __table_args__ = (
+        # Ownership scoped lookups and the keyset-paginated dashboard listing
+        Index('ix_projects_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    file_tree: Mapped[dict] = mapped_column(JSONB, nullable=False, default=list)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    is_public: Mapped[bool] = mapped_column(Boolean, default=False)
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # Listing stats, maintained on every tree write so the dashboard never reads file_tree
+    file_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    total_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    owner: Mapped["User"] = relationship(back_populates="projects")
+    versions: Mapped[List["Version"]] = relationship(back_populates="project", cascade="all, delete-orphan")
+
+class FileBlob(db.Model):
+    __tablename__ = 'file_blobs'
+    # Content-addressed file contents, shared by every project, version and fork that holds them
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    encoding: Mapped[str] = mapped_column(String(10), nullable=False, default="identity")
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+class TokenBlocklist(db.Model):
+    __tablename__ = 'token_blocklist'
+    __table_args__ = (
+        Index('ix_token_blocklist_created_at', 'created_at'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    jti: Mapped[str] = mapped_column(String(36), nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+class Version(db.Model):
+    __tablename__ = 'versions'
+    __table_args__ = (
+        # Project history, newest first, and the latest version a new delta is based on
+        Index('ix_versions_project_id_created_at', 'project_id', 'created_at', 'id'),
+        # Only unlabeled autosaves are ever compacted, keep checkpoints out of that index
+        Index('ix_versions_autosave_created_at', 'created_at',
+              postgresql_where=text('label IS NULL'), sqlite_where=text('label IS NULL')),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    project_id: Mapped[int] = mapped_column(ForeignKey('projects.id'), nullable=False)
+    file_tree_snapshot: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    label: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, default=None) 
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    # Delta versions point at the version they were diffed against, keyframes have no base
+    base_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey('versions.id', name='fk_versions_base_id_versions', deferrable=True, initially='DEFERRED'),
+        nullable=True, index=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    project: Mapped["Project"] = relationship(back_populates="versions")
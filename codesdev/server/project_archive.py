@@ -0,0 +1,334 @@
+import io
+import itertools
+import posixpath
+import re
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from execution_payload import PayloadError, normalize_path
+from project_storage import content_hash
+
+# Archive formats -> mimetype, the format name doubles as the file extension
+ARCHIVE_FORMATS = {"tar.gz": "application/gzip", "zip": "application/zip"}
+
+# Never imported: VCS metadata, dependency and bytecode dirs, macOS zip droppings
+IGNORED_NAMES = {".git", ".hg", ".svn", "__MACOSX", "node_modules", "__pycache__", ".DS_Store"}
+
+BINARY_SNIFF_BYTES = 8192
+MAX_SKIPPED_LISTED = 100
+
+
+def archive_name(name):
+    # Project name -> safe file and top level folder name
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "-", name or "").strip(".-")
+    return slug[:100] or "project"
+
+
+def decode_text(data):
+    # File contents are stored as text, so anything with NUL bytes or that isn't UTF-8 is binary
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class ChunkSink:
+    # Write-only file object the archive writers write into, drained into the response between entries
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_archive(entries, fmt, mtime):
+    # entries yields (path, content), content None for folders. One entry is encoded at a time, the
+    # archive is never held in memory as a whole
+    sink = ChunkSink()
+    if fmt == "zip":
+        # Not seekable, so zipfile writes data descriptors after each entry instead of seeking back
+        archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+        date_time = time.gmtime(max(mtime, 315532800))[:6]  # Zip dates start in 1980
+        for path, content in entries:
+            if content is None:
+                info = zipfile.ZipInfo(path + "/", date_time)
+                info.external_attr = (0o40755 << 16) | 0x10
+                archive.writestr(info, b"")
+            else:
+                info = zipfile.ZipInfo(path, date_time)
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, content.encode("utf-8"))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    else:
+        archive = tarfile.open(fileobj=sink, mode="w|gz", format=tarfile.PAX_FORMAT)
+        for path, content in entries:
+            info = tarfile.TarInfo(path)
+            info.mtime = mtime
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                archive.addfile(info)
+            else:
+                data = content.encode("utf-8")
+                info.size = len(data)
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    archive.close()
+    yield sink.drain()
+
+
+class PrefixedStream:
+    # The bytes read to sniff the format, then the rest of the stream
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        if self.head:
+            if size is None or size < 0:
+                data, self.head = self.head + self.stream.read(), b""
+                return data
+            data, self.head = self.head[:size], self.head[size:]
+            return data
+        return self.stream.read(size)
+
+
+def read_head(stream, size=512):
+    # A streamed or chunked body can hand back less than asked for on any read, keep going until the
+    # sniff has its bytes or the body ends
+    head = b""
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def sniff_format(head):
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if head.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ")) or head[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def expanded_bytes(limit):
+    # Every entry's size counts, skipped ones included: even a member that is never used has to be
+    # decompressed to get past it in a tar stream. Call with each size, raises once past limit
+    total = 0
+
+    def count(size):
+        nonlocal total
+        total += max(size, 0)
+        if total > limit:
+            raise PayloadError(f"Archive expands to more than {limit} bytes", 413)
+    return count
+
+
+def tar_entries(stream, limits):
+    # (name, data or None for folders, reason it was skipped or None), straight off the stream
+    count = expanded_bytes(limits.max_total_bytes)
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as archive:
+            for member in archive:
+                count(member.size)
+                if member.isdir():
+                    yield member.name, None, None
+                elif not member.isfile():
+                    yield member.name, b"", "not a regular file"
+                elif member.size > limits.max_file_bytes:
+                    yield member.name, b"", "too large"
+                else:
+                    yield member.name, archive.extractfile(member).read(), None
+    except (tarfile.TarError, EOFError, OSError) as e:
+        raise PayloadError(f"Archive is not a valid tar file: {e}")
+
+
+def zip_entries(stream, limits, spool_bytes):
+    # Zip keeps its index at the end, so the upload is spooled (in memory up to spool_bytes) first
+    count = expanded_bytes(limits.max_total_bytes)
+    max_file_bytes = limits.max_file_bytes
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes) as spool:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            with zipfile.ZipFile(spool) as archive:
+                for info in archive.infolist():
+                    count(info.file_size)
+                    mode = info.external_attr >> 16
+                    if info.is_dir():
+                        yield info.filename, None, None
+                    elif mode and (mode & 0o170000) not in (0, 0o100000):
+                        yield info.filename, b"", "not a regular file"
+                    elif info.flag_bits & 0x1:
+                        yield info.filename, b"", "encrypted"
+                    elif info.file_size > max_file_bytes:
+                        yield info.filename, b"", "too large"
+                    else:
+                        # Headers can lie about sizes, never read more than the limit allows
+                        with archive.open(info) as member:
+                            data = member.read(max_file_bytes + 1)
+                        count(len(data) - info.file_size)
+                        if len(data) > max_file_bytes:
+                            yield info.filename, b"", "too large"
+                        else:
+                            yield info.filename, data, None
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, OSError, NotImplementedError) as e:
+            raise PayloadError(f"Archive is not a valid zip file: {e}")
+
+
+class TreeBuilder:
+    # Builds a stored skeleton (file nodes carry blob hashes) as archive entries arrive. Contents are
+    # handed to flush({hash: content}) every batch_bytes, so only one batch is held at a time
+    def __init__(self, limits, flush, batch_bytes=4 * 1024 * 1024):
+        self.limits = limits
+        self.flush = flush
+        self.batch_bytes = batch_bytes
+        self.tree = []
+        self.folders = {"": (None, self.tree)}  # path -> (node id, children)
+        self.names = {}                          # folder path -> lower cased names in it
+        self.ids = itertools.count(1)
+        self.files = 0
+        self.total = 0
+        self.skipped = []
+        self.skipped_count = 0
+        self._pending = {}
+        self._pending_bytes = 0
+
+    def skip(self, path, reason):
+        self.skipped_count += 1
+        if len(self.skipped) < MAX_SKIPPED_LISTED:
+            self.skipped.append({"path": path, "reason": reason})
+
+    def _claim(self, parent, name):
+        # Names are unique per folder regardless of case, same rule as the editor
+        taken = self.names.setdefault(parent, set())
+        if name.lower() in taken:
+            return False
+        taken.add(name.lower())
+        return True
+
+    def folder(self, path):
+        # Children list of the folder at path, created along with its parents. None if a file is in the way
+        if path in self.folders:
+            return self.folders[path][1]
+        parent, name = posixpath.split(path)
+        children = self.folder(parent)
+        if children is None or not self._claim(parent, name):
+            return None
+        node = {"id": next(self.ids), "name": name, "type": "folder", "parent": self.folders[parent][0], "children": []}
+        children.append(node)
+        self.folders[path] = (node["id"], node["children"])
+        return node["children"]
+
+    def add(self, name, data, reason=None):
+        if name and posixpath.normpath(name) == ".":
+            return  # The root itself, tar -C dir . lists it
+        path = normalize_path(name.rstrip("/")) if name else None
+        # Unlike a run's file list, an archive naming a parent dir anywhere is not to be trusted
+        if path is None or ".." in name.replace("\\", "/").split("/"):
+            self.skip(name, "unsafe path")
+            return
+        if IGNORED_NAMES.intersection(path.split("/")):
+            return
+        if reason:
+            self.skip(path, reason)
+            return
+        if data is None:
+            if self.folder(path) is None:
+                self.skip(path, "name conflict")
+            return
+
+        content = decode_text(data)
+        if content is None:
+            self.skip(path, "binary")
+            return
+        if self.files >= self.limits.max_files:
+            raise PayloadError(f"Too many files (limit {self.limits.max_files})", 413)
+        if self.total + len(data) > self.limits.max_total_bytes:
+            raise PayloadError(f"Files exceed {self.limits.max_total_bytes} bytes in total", 413)
+
+        parent, file_name = posixpath.split(path)
+        children = self.folder(parent)
+        if children is None or path in self.folders or not self._claim(parent, file_name):
+            self.skip(path, "name conflict")
+            return
+        digest = content_hash(content)
+        children.append({"id": next(self.ids), "name": file_name, "type": "file",
+                         "parent": self.folders[parent][0], "blob": digest})
+        self.files += 1
+        self.total += len(data)
+        if digest not in self._pending:
+            self._pending[digest] = content
+            self._pending_bytes += len(data)
+        if self._pending_bytes >= self.batch_bytes:
+            self.finish()
+
+    def finish(self):
+        if self._pending:
+            self.flush(self._pending)
+            self._pending = {}
+            self._pending_bytes = 0
+
+    def unwrap(self):
+        # Archives that hold everything in one top level folder (GitHub downloads, our own exports)
+        # import as that folder's contents, the folder name is returned as a project name
+        if len(self.tree) != 1 or self.tree[0]["type"] != "folder":
+            return None
+        root = self.tree[0]
+        self.tree = root["children"]
+        for node in self.tree:
+            node["parent"] = None
+        return root["name"]
+
+
+def import_archive(stream, limits, flush, spool_bytes=8 * 1024 * 1024, batch_bytes=4 * 1024 * 1024):
+    # tar (plain, gz, bz2, xz) or zip, told apart by their first bytes. Returns the TreeBuilder
+    try:
+        head = read_head(stream)
+        fmt = sniff_format(head)
+        if fmt is None:
+            raise PayloadError("Upload a .tar.gz, .tar or .zip archive", 415)
+        stream = PrefixedStream(head, stream)
+        if fmt == "zip":
+            entries = zip_entries(stream, limits, spool_bytes)
+        else:
+            entries = tar_entries(stream, limits)
+
+        builder = TreeBuilder(limits, flush, batch_bytes)
+        # Folders, skipped and ignored entries are cheap but not free, cap everything the archive lists
+        max_entries = 10 * limits.max_files
+        for count, (name, data, reason) in enumerate(entries, 1):
+            if count > max_entries:
+                raise PayloadError(f"Archive has more than {max_entries} entries", 413)
+            builder.add(name, data, reason)
+        builder.finish()
+        return builder
+    except RequestEntityTooLarge:
+        raise PayloadError("Upload exceeds the archive size limit", 413)
@@ -0,0 +1,257 @@
+import hashlib
+import zlib
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Project trees are stored as a "skeleton": the usual folderStructureData shape, except that
+# file nodes carry a "blob" hash instead of their "content". Contents live once per hash in file_blobs.
+
+
+class TreeError(ValueError):
+    pass
+
+
+class MissingBlob(LookupError):
+    # A skeleton references a hash whose row is gone. Never hand such a file out as empty, the next
+    # save would store the empty content over it
+    def __init__(self, hashes):
+        self.hashes = sorted(hashes)
+        super().__init__(f"File contents are missing for {len(self.hashes)} blob(s)")
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def dehydrate(tree, own_blobs=frozenset()):
+    # Returns (skeleton, {hash: content}) without touching the input tree. Trees come straight from
+    # request bodies, anything that isn't the folderStructureData shape raises TreeError. Hashes only
+    # ever come from content_hash, a node may keep a blob it carries only if it's in own_blobs (the
+    # stored tree being edited), otherwise anyone could link in another user's file by its hash
+    blobs = {}
+    ids = set()
+
+    def strip(items):
+        if not isinstance(items, list):
+            raise TreeError("file_tree and folder children must be lists")
+        skeleton = []
+        for node in items:
+            if not isinstance(node, dict):
+                raise TreeError("file_tree nodes must be objects")
+            if node.get('type') not in ('file', 'folder') or not isinstance(node.get('name'), str):
+                raise TreeError("file_tree nodes need a name and a type of 'file' or 'folder'")
+            node_id = node.get('id')
+            if not isinstance(node_id, (int, str)) or isinstance(node_id, bool):
+                raise TreeError(f"'{node['name']}' needs an id that is a number or a string")
+            if node_id in ids:
+                raise TreeError(f"Node id {node_id} is used more than once")
+            ids.add(node_id)
+            if node['type'] == 'file' and not isinstance(node.get('content', ""), (str, type(None))):
+                raise TreeError(f"Content of '{node['name']}' must be a string")
+            copy = {key: value for key, value in node.items() if key not in ('content', 'children', 'blob')}
+            if node.get('type') == 'folder':
+                copy['children'] = strip(node.get('children') or [])
+            elif 'content' in node:
+                content = node['content'] or ""
+                digest = content_hash(content)
+                blobs[digest] = content
+                copy['blob'] = digest
+            elif isinstance(node.get('blob'), str) and node['blob'] in own_blobs:
+                copy['blob'] = node['blob']
+            skeleton.append(copy)
+        return skeleton
+
+    return strip(tree), blobs
+
+
+def count_blobs(skeleton):
+    # hash -> number of file nodes using it
+    counts = {}
+    stack = [skeleton or []]
+    while stack:
+        for node in stack.pop():
+            if node.get('blob'):
+                counts[node['blob']] = counts.get(node['blob'], 0) + 1
+            if node.get('children'):
+                stack.append(node['children'])
+    return counts
+
+
+def collect_hashes(skeleton, into=None):
+    hashes = set() if into is None else into
+    stack = [skeleton or []]
+    while stack:
+        for node in stack.pop():
+            if node.get('blob'):
+                hashes.add(node['blob'])
+            if node.get('children'):
+                stack.append(node['children'])
+    return hashes
+
+
+def file_paths(skeleton):
+    # path -> hash (None for files stored without content), folder names joined with "/"
+    paths = {}
+    stack = [("", skeleton or [])]
+    while stack:
+        prefix, items = stack.pop()
+        for node in items:
+            path = prefix + str(node.get('name', ''))
+            if node.get('type') == 'folder':
+                stack.append((path + "/", node.get('children') or []))
+            else:
+                paths.setdefault(path, node.get('blob'))
+    return paths
+
+
+def tree_entries(skeleton):
+    # [(path, hash or None, is folder)] depth first in tree order, a repeated path keeps its first node
+    entries, seen = [], set()
+    stack = [("", iter(skeleton or []))]
+    while stack:
+        prefix, nodes = stack[-1]
+        node = next(nodes, None)
+        if node is None:
+            stack.pop()
+            continue
+        path = prefix + str(node.get('name', ''))
+        if path in seen:
+            continue
+        seen.add(path)
+        if node.get('type') == 'folder':
+            entries.append((path, None, True))
+            stack.append((path + "/", iter(node.get('children') or [])))
+        else:
+            entries.append((path, node.get('blob'), False))
+    return entries
+
+
+def hydrate(skeleton, contents):
+    missing = collect_hashes(skeleton) - contents.keys()
+    if missing:
+        raise MissingBlob(missing)
+
+    def fill(items):
+        tree = []
+        for node in items or []:
+            copy = {key: value for key, value in node.items() if key not in ('blob', 'children')}
+            if node.get('type') == 'folder':
+                copy['children'] = fill(node.get('children'))
+            elif 'blob' in node:
+                copy['content'] = contents[node['blob']]
+            tree.append(copy)
+        return tree
+
+    return fill(skeleton)
+
+
+def encode_blob(content, compress_min_bytes):
+    raw = content.encode('utf-8')
+    if compress_min_bytes and len(raw) >= compress_min_bytes:
+        packed = zlib.compress(raw, 6)
+        # Only keep the compressed form when it actually saves space
+        if len(packed) < len(raw):
+            return packed, 'zlib', len(raw)
+    return raw, 'identity', len(raw)
+
+
+def decode_blob(data, encoding):
+    raw = zlib.decompress(data) if encoding == 'zlib' else bytes(data)
+    return raw.decode('utf-8')
+
+
+class ProjectStorage:
+    def __init__(self, db, blob_model, compress_min_bytes=1024):
+        self.db = db
+        self.blob_model = blob_model
+        self.compress_min_bytes = compress_min_bytes
+
+    def _insert(self):
+        # Concurrent saves of the same content race on the primary key, let the database dedupe and
+        # still refresh created_at so the row counts as freshly claimed
+        dialect = self.db.session.get_bind().dialect.name
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        return insert(self.blob_model.__table__).on_conflict_do_update(
+            index_elements=['hash'], set_={'created_at': func.now()}
+        )
+
+    def put_blobs(self, blobs):
+        if not blobs:
+            return
+        Blob = self.blob_model
+        # Reused blobs get their created_at touched instead of being skipped: purge-blobs leaves recent
+        # rows alone, and the row lock makes a concurrent purge wait for this save and re-check the
+        # row. A hash the purge already removed is not returned here and gets inserted again below
+        existing = set(self.db.session.scalars(
+            update(Blob).where(Blob.hash.in_(list(blobs))).values(created_at=func.now())
+            .returning(Blob.hash).execution_options(synchronize_session=False)
+        ))
+        rows = []
+        for digest, content in blobs.items():
+            if digest in existing:
+                continue
+            data, encoding, size = encode_blob(content, self.compress_min_bytes)
+            rows.append({"hash": digest, "data": data, "encoding": encoding, "size": size})
+        if rows:
+            self.db.session.execute(self._insert(), rows)
+
+    def store_tree(self, tree, own_blobs=frozenset()):
+        skeleton, blobs = dehydrate(tree, own_blobs)
+        self.put_blobs(blobs)
+        return skeleton
+
+    def fetch_contents(self, hashes):
+        if not hashes:
+            return {}
+        Blob = self.blob_model
+        rows = self.db.session.execute(
+            select(Blob.hash, Blob.data, Blob.encoding).where(Blob.hash.in_(list(hashes)))
+        )
+        return {row.hash: decode_blob(row.data, row.encoding) for row in rows}
+
+    def load_tree(self, skeleton):
+        return hydrate(skeleton, self.fetch_contents(collect_hashes(skeleton)))
+
+    def fetch_all(self, hashes):
+        # fetch_contents, but every hash must resolve
+        contents = self.fetch_contents(hashes)
+        missing = set(hashes) - contents.keys()
+        if missing:
+            raise MissingBlob(missing)
+        return contents
+
+    def load_files(self, skeleton):
+        # Flat path -> content view of a tree, what an execution sandbox gets
+        paths = file_paths(skeleton)
+        contents = self.fetch_all({digest for digest in paths.values() if digest})
+        return {path: contents[digest] if digest else "" for path, digest in paths.items()}
+
+    def iter_tree(self, skeleton, batch_size=200):
+        # (path, content) in tree order with None for folders, contents fetched batch_size files at a
+        # time so exporting a large project never holds all of it
+        entries = tree_entries(skeleton)
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            contents = self.fetch_all({digest for _, digest, _ in batch if digest})
+            for path, digest, is_folder in batch:
+                yield path, None if is_folder else contents[digest] if digest else ""
+
+    def tree_stats(self, skeleton):
+        # (file count, total content bytes) for the listing, sizes come from the blob rows
+        counts = count_blobs(skeleton)
+        if not counts:
+            return 0, 0
+        Blob = self.blob_model
+        sizes = dict(self.db.session.execute(
+            select(Blob.hash, Blob.size).where(Blob.hash.in_(list(counts)))
+        ).all())
+        return sum(counts.values()), sum(sizes.get(digest, 0) * n for digest, n in counts.items())
+
+    def load_trees(self, skeletons):
+        # One blob query for many trees (project listings)
+        hashes = set()
+        for skeleton in skeletons:
+            collect_hashes(skeleton, hashes)
+        contents = self.fetch_contents(hashes)
+        return [hydrate(skeleton, contents) for skeleton in skeletons]
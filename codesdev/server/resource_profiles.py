@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+from docker.types import DriverConfig, Mount
+
+# Sandboxes run as nobody, so nothing a run does can outlive the reset of a pooled container
+SANDBOX_UID = 65534
+# Sandbox limits every language starts from, runtimes override what they need (see runtimes.RUNTIMES)
+DEFAULT_PROFILE = {
+    "cpus": 0.5,                  # CPU quota in cores, also what a run reserves from the host's capacity
+    "cpu_shares": 512,            # Relative weight when runs compete for the same cores (docker default 1024)
+    "memory": "128m",             # Hard limit, swap disabled
+    "pids": 64,                   # Processes and threads, stops fork bombs
+    "tmpfs": "64m",               # In-memory /tmp
+    "workdir": "64m",             # In-memory /app, the project files and build output
+    "compile_timeout": 10,        # Seconds, compiled languages only
+    "run_timeout": 5,             # Seconds, counted from the end of the compile phase
+    "output_bytes": 1024 * 1024,  # stdout + stderr kept (or streamed) per run
+}
+
+
+def resolve_profile(*layers):
+    # Later layers win: defaults, then config, then the language's own overrides
+    profile = dict(DEFAULT_PROFILE)
+    for layer in layers:
+        unknown = set(layer or {}) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError(f"Unknown resource setting(s): {', '.join(sorted(unknown))}")
+        profile.update(layer or {})
+    return profile
+
+
+def container_limits(profile):
+    # docker SDK containers.create() keyword arguments for a profile
+    return {
+        "nano_cpus": int(profile["cpus"] * 1e9),
+        "cpu_shares": profile["cpu_shares"],
+        "mem_limit": profile["memory"],
+        "memswap_limit": profile["memory"],
+        "pids_limit": profile["pids"],
+        # Pooled sandboxes serve many users, so the root filesystem is read-only and only /app and /tmp
+        # (both wiped between runs) can be written to, by an unprivileged user without capabilities
+        "read_only": True,
+        "user": f"{SANDBOX_UID}:{SANDBOX_UID}",
+        "cap_drop": ["ALL"],
+        "security_opt": ["no-new-privileges"],
+        "environment": {"HOME": "/tmp"},
+        "tmpfs": {"/tmp": f"rw,exec,nosuid,size={profile['tmpfs']}"},
+        # docker cp can't write into tmpfs mounts but can into volumes, so /app is an anonymous volume
+        # kept in memory and owned by the sandbox user. Removed along with the container (remove(v=True))
+        "mounts": [Mount("/app", None, type="volume", driver_config=DriverConfig("local", {
+            "type": "tmpfs", "device": "tmpfs",
+            "o": f"size={profile['workdir']},uid={SANDBOX_UID},gid={SANDBOX_UID},mode=0755",
+        }))],
+    }
+
+
+class CapacityExceeded(Exception):
+    pass
+
+
+class CpuAdmission:
+    # Runs reserve their profile's CPU quota before starting, so the sum of running quotas never
+    # exceeds what the host (or this worker's share of it) actually has. Admissions for several hosts
+    # can share one condition, so a release on any of them wakes a scheduler waiting on all of them
+    def __init__(self, capacity, acquire_timeout=10, cond=None):
+        self.capacity = capacity
+        self.acquire_timeout = acquire_timeout
+        self._in_use = 0.0
+        self._cond = cond or threading.Condition()
+        self.stats = {"admitted": 0, "waits": 0, "rejected": 0, "wait_seconds_total": 0.0}
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def try_reserve(self, cpus):
+        # A profile bigger than the whole capacity still runs, alone
+        cpus = min(cpus, self.capacity)
+        with self._cond:
+            if self._in_use + cpus > self.capacity + 1e-9:
+                return None
+            self._in_use += cpus
+            self.stats["admitted"] += 1
+        return Reservation(self, cpus)
+
+    def reserve(self, cpus):
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                reservation = self.try_reserve(cpus)
+                if reservation is not None:
+                    break
+                remaining = self.acquire_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.stats["rejected"] += 1
+                    raise CapacityExceeded("The execution host is at capacity, please try again")
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.stats["wait_seconds_total"] += time.monotonic() - started
+        return reservation
+
+    def _release(self, cpus):
+        with self._cond:
+            self._in_use = max(0.0, self._in_use - cpus)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            data = dict(self.stats)
+            data.update({"capacity": self.capacity, "in_use": round(self._in_use, 3)})
+        return data
+
+
+class Reservation:
+    def __init__(self, admission, cpus):
+        self.admission = admission
+        self.cpus = cpus
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.admission._release(self.cpus)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def default_capacity(host_cpus=None):
+    # Every gunicorn worker admits runs on its own, so each gets an equal share of the cores
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    return max(0.5, (host_cpus or os.cpu_count() or 1) / workers)
+
+
+class OutputBudget:
+    # One per run and shared by its phases, so compiler noise counts against the same cap as program output
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.truncated = False
+
+    def take(self, chunk):
+        if self.truncated or not chunk:
+            return b""
+        room = self.max_bytes - self.used
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+        self.used += len(chunk)
+        return chunk
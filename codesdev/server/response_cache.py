@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    # Serialized response bodies (or other values, given their size) keyed by resource, each stored
+    # with the version it was built from. A lookup with a different version is a miss, so a stale entry is never served even
+    # when another worker made the change and this worker's invalidate() never ran.
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, body, size), least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key, version, body, size=None):
+        size = len(body) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (version, body, size)
+            self._total += size
+            self.stats["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._total > self.max_bytes):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._total -= evicted
+                self.stats["evictions"] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[2]
+        return entry is not None
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._drop(key):
+                    self.stats["invalidations"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data.update({"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes})
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 3) if lookups else None
+        return data
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def result_size(result):
+    # Output text plus a little for the rest of the dict
+    return len(result.get("output") or "") + 64
+
+
+class ImageDigests:
+    # Image tag -> image id, resolved again after ttl seconds so results from before a re-pull of
+    # the same tag stop matching. resolve(image) returns the id, failures disable caching for the run
+    def __init__(self, resolve, ttl=60):
+        self.resolve = resolve
+        self.ttl = ttl
+        self._ids = {}  # image -> (id, resolved at)
+        self._lock = threading.Lock()
+
+    def get(self, image):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._ids.get(image)
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0]
+        try:
+            image_id = self.resolve(image)
+        except Exception:
+            return None
+        with self._lock:
+            self._ids[image] = (image_id, now)
+        return image_id
+
+
+class ResultCache:
+    # Outputs of runs that exited cleanly, so rerunning unchanged code (a demo, a popular public
+    # project) is a lookup instead of a container. Entries expire after ttl seconds
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (result, size, expires at), least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._drop(key)
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, result):
+        size = result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (result, size, time.monotonic() + self.ttl)
+            self._total += size
+            self.stats["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._total > self.max_bytes):
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._total -= evicted
+                self.stats["evictions"] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[1]
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data.update({"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes,
+                         "ttl": self.ttl})
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 3) if lookups else None
+        return data
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import delete, text
+
+
+class MemoryRevocationBackend:
+    # Bounded in-process store, jti -> (revoked, expires_at)
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, jti):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            revoked, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[jti]
+                return None
+            self._entries.move_to_end(jti)
+            return revoked
+
+    def set(self, jti, revoked, ttl):
+        with self._lock:
+            self._entries[jti] = (revoked, time.monotonic() + ttl)
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RevocationCache:
+    def __init__(self, backend, max_ttl, negative_ttl=30):
+        self.backend = backend
+        self.max_ttl = max_ttl              # Never cache past the longest possible token lifetime
+        self.negative_ttl = negative_ttl    # How long another worker's logout can go unnoticed here
+        self.stats = {"hits": 0, "misses": 0, "revocations": 0}
+        self._lock = threading.Lock()
+
+    def _ttl(self, exp):
+        # Entries are useless once the token itself has expired
+        remaining = self.max_ttl if exp is None else exp - time.time()
+        return max(0, min(remaining, self.max_ttl))
+
+    def is_revoked(self, jti, exp, loader):
+        cached = self.backend.get(jti)
+        if cached is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return cached
+
+        with self._lock:
+            self.stats["misses"] += 1
+        revoked = loader(jti)
+        ttl = self._ttl(exp) if revoked else min(self._ttl(exp), self.negative_ttl)
+        if ttl > 0:
+            self.backend.set(jti, revoked, ttl)
+        return revoked
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            self.stats["revocations"] += 1
+        self.backend.set(jti, True, self._ttl(exp) or 1)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 3) if lookups else None
+        if hasattr(self.backend, "size"):
+            data["entries"] = self.backend.size()
+        return data
+
+
+class BlocklistPurger:
+    # Drops token_blocklist rows for tokens that have expired anyway, the table used to grow forever
+    LOCK_KEY = 7_240_114  # Arbitrary advisory lock id, one purger at a time across workers
+
+    def __init__(self, app, db, blocklist_model, max_token_lifetime, interval=3600):
+        self.app = app
+        self.db = db
+        self.blocklist_model = blocklist_model
+        self.max_token_lifetime = max_token_lifetime
+        self.interval = interval
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_run = None
+        self.last_deleted = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="blocklist-purger", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception as e:
+                self.app.logger.warning(f"Token blocklist purge failed: {e}")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        session = self.db.session
+        if session.get_bind().dialect.name == 'postgresql':
+            if not session.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": self.LOCK_KEY}):
+                return 0
+        TokenBlocklist = self.blocklist_model
+        cutoff = datetime.utcnow() - self.max_token_lifetime
+        result = session.execute(delete(TokenBlocklist).where(TokenBlocklist.created_at < cutoff))
+        session.commit()
+        self.last_deleted = result.rowcount
+        self.last_run = time.time()
+        return self.last_deleted
@@ -0,0 +1,305 @@
+import os
+import posixpath
+import string
+import threading
+import time
+
+# Values a command template may reference, filled in per run from the resolved entry file
+PLACEHOLDERS = {"entry", "entry_dir", "entry_stem"}
+
+# Compile steps write into /app/build so the artifacts can be cached, make sure it exists first
+BUILD_DIR_WRAPPER = ["sh", "-c", 'mkdir -p build && exec "$@"', "sh"]
+
+IMAGE_CONTEXT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime_images")
+
+
+class RuntimeConfigError(ValueError):
+    pass
+
+
+class EntryPointError(ValueError):
+    pass
+
+
+class RuntimeUnavailable(Exception):
+    pass
+
+
+class CommandTemplate:
+    # An argv with its placeholder slots found once, rendering only formats those slots.
+    # Arguments are never joined into a shell string, so file names can't inject commands
+    def __init__(self, argv):
+        if isinstance(argv, str) or not argv:
+            raise RuntimeConfigError(f"Commands must be non-empty argv lists, got {argv!r}")
+        self.argv = tuple(argv)
+        self.slots = []
+        for index, part in enumerate(self.argv):
+            names = {name for _, name, _, _ in string.Formatter().parse(part) if name is not None}
+            if names - PLACEHOLDERS:
+                raise RuntimeConfigError(f"Unknown placeholder(s) {sorted(names - PLACEHOLDERS)} in {list(argv)}")
+            if names:
+                self.slots.append(index)
+
+    def render(self, values):
+        argv = list(self.argv)
+        for index in self.slots:
+            argv[index] = argv[index].format(**values)
+        return argv
+
+
+class Runtime:
+    def __init__(self, name, image, extensions, run, compile=None, entry_points=(), version=None,
+                 resources=None, build_context=None):
+        if not name or not name.isidentifier():
+            raise RuntimeConfigError(f"Invalid runtime name {name!r}")
+        if ":" not in image.rsplit("/", 1)[-1] or image.endswith(":latest"):
+            raise RuntimeConfigError(f"{name}: image '{image}' must be pinned to a tag")
+        if not extensions or any(not ext.startswith(".") or ext != ext.lower() for ext in extensions):
+            raise RuntimeConfigError(f"{name}: extensions must be lower case and start with '.'")
+
+        self.name = name
+        self.image = image
+        self.extensions = tuple(extensions)
+        self.run = CommandTemplate(run)
+        self.compile = CommandTemplate(BUILD_DIR_WRAPPER + list(compile)) if compile else None
+        self.entry_points = tuple(entry_points)
+        self.version = CommandTemplate(version or [run[0], "--version"])
+        self.resources = resources or {}
+        self.build_context = build_context  # Directory under runtime_images/ for images we build ourselves
+
+    @property
+    def compiled(self):
+        return self.compile is not None
+
+    def handles(self, path):
+        return path.lower().endswith(self.extensions)
+
+    def resolve_entry(self, entry_file, paths):
+        # Exact project path first, then a file with that name anywhere in the project (the editor
+        # sends bare file names), then the language's conventional entry points
+        if entry_file:
+            if entry_file in paths:
+                entry = entry_file
+            else:
+                matches = [path for path in paths if posixpath.basename(path) == entry_file]
+                if len(matches) > 1:
+                    raise EntryPointError(f"'{entry_file}' matches {len(matches)} files, send its full path")
+                if not matches:
+                    raise EntryPointError(f"Entry file '{entry_file}' is not in the project")
+                entry = matches[0]
+        else:
+            candidates = [path for path in self.entry_points if path in paths]
+            if not candidates:
+                candidates = [path for path in paths if self.handles(path)]
+            if len(candidates) != 1:
+                raise EntryPointError(f"No entry file given and no single {self.name} entry point found")
+            entry = candidates[0]
+
+        if not self.handles(entry):
+            raise EntryPointError(f"'{entry}' is not a {self.name} file ({', '.join(self.extensions)})")
+        return entry
+
+    def phases(self, entry, cached=False):
+        # [(phase, argv)], compiled runtimes skip straight to running when the build is cached
+        values = {
+            "entry": entry,
+            "entry_dir": posixpath.dirname(entry) or ".",
+            "entry_stem": posixpath.splitext(posixpath.basename(entry))[0],
+        }
+        phases = []
+        if self.compiled and not cached:
+            phases.append(("compile", self.compile.render(values)))
+        phases.append(("run", self.run.render(values)))
+        return phases
+
+
+class RuntimeRegistry:
+    def __init__(self, runtimes):
+        self.runtimes = {}
+        self._by_extension = {}
+        for runtime in runtimes:
+            if runtime.name in self.runtimes:
+                raise RuntimeConfigError(f"Runtime '{runtime.name}' is registered twice")
+            for ext in runtime.extensions:
+                if ext in self._by_extension:
+                    raise RuntimeConfigError(f"'{ext}' is claimed by both {self._by_extension[ext].name} and {runtime.name}")
+                self._by_extension[ext] = runtime
+            self.runtimes[runtime.name] = runtime
+
+    def __contains__(self, name):
+        return name in self.runtimes
+
+    def __getitem__(self, name):
+        return self.runtimes[name]
+
+    def items(self):
+        return self.runtimes.items()
+
+    def for_file(self, path):
+        return self._by_extension.get(posixpath.splitext(path)[1].lower())
+
+
+RUNTIMES = RuntimeRegistry([
+    Runtime(
+        "python", "python:3.12-slim", (".py",),
+        run=["python", "{entry}"],
+        entry_points=("main.py", "app.py"),
+    ),
+    Runtime(
+        "javascript", "node:20-slim", (".js", ".mjs", ".cjs"),
+        run=["node", "{entry}"],
+        entry_points=("index.js", "main.js"),
+        resources={"memory": "192m"},
+    ),
+    Runtime(
+        # esbuild is baked into the image and strips types in milliseconds, unlike a cold tsc or
+        # ts-node. It bundles the project's imports, type errors are left to the editor
+        "typescript", "codesdev-runtime-typescript:20-esbuild0.25", (".ts", ".mts", ".cts", ".tsx"),
+        compile=["esbuild", "{entry}", "--bundle", "--platform=node", "--format=cjs", "--log-level=warning",
+                 "--outfile=build/app.js"],
+        run=["node", "build/app.js"],
+        entry_points=("index.ts", "main.ts"),
+        version=["esbuild", "--version"],
+        resources={"memory": "192m", "compile_timeout": 10},
+        build_context="typescript",
+    ),
+    Runtime(
+        "ruby", "ruby:3.2-slim", (".rb",),
+        run=["ruby", "{entry}"],
+        entry_points=("main.rb",),
+    ),
+    Runtime(
+        "go", "golang:1.22-alpine", (".go",),
+        compile=["go", "build", "-o", "build/app", "{entry}"],
+        run=["./build/app"],
+        entry_points=("main.go",),
+        version=["go", "version"],
+        resources={"cpus": 1.0, "memory": "512m", "pids": 128, "tmpfs": "256m", "compile_timeout": 30},
+    ),
+    Runtime(
+        "c", "gcc:13", (".c",),
+        compile=["gcc", "{entry}", "-o", "build/app"],
+        run=["./build/app"],
+        entry_points=("main.c",),
+        version=["gcc", "--version"],
+        resources={"memory": "256m", "compile_timeout": 15},
+    ),
+    Runtime(
+        "cpp", "gcc:13", (".cpp", ".cc", ".cxx"),
+        compile=["g++", "{entry}", "-o", "build/app"],
+        run=["./build/app"],
+        entry_points=("main.cpp",),
+        version=["g++", "--version"],
+        resources={"cpus": 1.0, "memory": "256m", "compile_timeout": 20},
+    ),
+    Runtime(
+        "java", "eclipse-temurin:21-jdk", (".java",),
+        compile=["javac", "-d", "build", "-sourcepath", "{entry_dir}", "{entry}"],
+        run=["java", "-cp", "build", "{entry_stem}"],
+        entry_points=("Main.java",),
+        version=["javac", "-version"],
+        resources={"cpus": 1.0, "memory": "512m", "pids": 256, "compile_timeout": 20, "run_timeout": 10},
+    ),
+])
+
+
+class RuntimePrefetcher:
+    # Pulls (or builds) every runtime image in the background at startup and runs each runtime's
+    # version command once, so neither a docker pull nor a broken toolchain lands on a user's run.
+    # verify(runtime) runs the command and returns (exit_code, output). A runtime that failed is
+    # prepared again once retry_after seconds have passed, a registry hiccup or a daemon still
+    # starting at boot shouldn't take a language down until the worker restarts
+    def __init__(self, client, registry, verify, retry_after=30):
+        self.client = client
+        self.registry = registry
+        self.verify = verify
+        self.retry_after = retry_after
+        self.status = {name: "pending" for name, _ in registry.items()}
+        self.errors = {}
+        self.seconds = {}
+        self.failed_at = {}
+        self._ready = {name: threading.Event() for name, _ in registry.items()}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.prefetch, name="runtime-prefetch", daemon=True)
+        self._thread.start()
+
+    def prefetch(self):
+        images = {}
+        for name, runtime in self.registry.items():
+            self._prepare(name, runtime, images)
+
+    def _prepare(self, name, runtime, images):
+        started = time.monotonic()
+        try:
+            # Languages sharing an image only pull it once
+            if runtime.image not in images:
+                images[runtime.image] = self._ensure_image(runtime)
+            if images[runtime.image] is not None:
+                raise images[runtime.image]
+            exit_code, output = self.verify(runtime)
+            if exit_code != 0:
+                raise RuntimeUnavailable(f"'{' '.join(runtime.version.argv)}' exited with {exit_code}: "
+                                         f"{(output or b'').decode('utf-8', errors='replace').strip()[:200]}")
+            self.status[name] = "ready"
+        except Exception as e:
+            self.status[name] = "failed"
+            self.errors[name] = str(e)
+            self.failed_at[name] = time.monotonic()
+        self.seconds[name] = round(time.monotonic() - started, 3)
+        self._ready[name].set()
+
+    def _retry(self, name):
+        # Back to pending and prepared again in the background, once per retry_after
+        with self._lock:
+            if self.status[name] != "failed" or time.monotonic() - self.failed_at[name] < self.retry_after:
+                return
+            self.status[name] = "pending"
+            self._ready[name].clear()
+        threading.Thread(target=self._prepare, args=(name, self.registry[name], {}), name=f"runtime-retry-{name}",
+                         daemon=True).start()
+
+    def state(self, name):
+        # "pending", "ready" or "failed", what the scheduler places runs by. Asking is what retries
+        # a failed runtime, hosts it failed on are skipped so wait() would never get to
+        self._retry(name)
+        return self.status[name]
+
+    def _ensure_image(self, runtime):
+        # Returns the error instead of raising so every runtime on a broken image reports it
+        try:
+            self.client.images.get(runtime.image)
+            return None
+        except Exception:
+            pass
+        try:
+            if runtime.build_context:
+                self.client.images.build(path=os.path.join(IMAGE_CONTEXT_DIR, runtime.build_context),
+                                         tag=runtime.image, rm=True, pull=True)
+            else:
+                self.client.images.pull(runtime.image)
+            return None
+        except Exception as e:
+            return RuntimeUnavailable(f"Could not prepare image '{runtime.image}': {e}")
+
+    def wait(self, name, timeout):
+        # Runs for a runtime that is still being prepared wait a little instead of failing outright.
+        # Workers normally start prefetching at boot, anything else starts it on its first run
+        self.start()
+        self._retry(name)
+        if not self._ready[name].wait(timeout):
+            raise RuntimeUnavailable(f"The {name} runtime is still being prepared, please try again")
+        if self.status[name] != "ready":
+            raise RuntimeUnavailable(f"The {name} runtime is unavailable: {self.errors.get(name)}")
+
+    def snapshot(self):
+        return {
+            name: {"image": runtime.image, "status": self.status[name], "error": self.errors.get(name),
+                   "seconds": self.seconds.get(name)}
+            for name, runtime in self.registry.items()
+        }
@@ -0,0 +1,281 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class Sandbox:
+    def __init__(self, container, image):
+        self.container = container
+        self.image = image
+        self.uses = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class SandboxPool:
+    # Idle keep-alive command, works on both debian (coreutils) and alpine (busybox) images
+    IDLE_COMMAND = ["sh", "-c", "while true; do sleep 3600; done"]
+
+    # Kill anything a previous run left behind and wipe everything the sandbox user can write to, the
+    # root filesystem is read-only (see resource_profiles.container_limits)
+    RESET_COMMAND = ["sh", "-c", "kill -9 -1 2>/dev/null; rm -rf " + " ".join(
+        f"{d}/* {d}/.[!.]* {d}/..?*" for d in ("/app", "/tmp", "/dev/shm", "/dev/mqueue"))]
+
+    def __init__(self, client, image, min_size=0, max_size=4, idle_ttl=300, max_uses=50,
+                 acquire_timeout=10, container_options=None, labels=None):
+        self.client = client
+        self.image = image
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.container_options = container_options or {}  # Resource limits, fixed once the container exists
+        self.labels = labels or {}
+
+        self._idle = deque()
+        self._total = 0
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "created": 0,
+            "recycled": 0,
+            "evicted": 0,
+            "health_failures": 0,
+        }
+
+    def _create(self):
+        container = self.client.containers.create(
+            image=self.image,
+            command=self.IDLE_COMMAND,
+            working_dir="/app",
+            network_disabled=True,
+            tty=False,
+            labels=self.labels,
+            **self.container_options
+        )
+        container.start()
+        return Sandbox(container, self.image)
+
+    def _destroy(self, sandbox):
+        try:
+            sandbox.container.remove(v=True, force=True)
+        except Exception:
+            pass
+
+    def _is_healthy(self, sandbox):
+        try:
+            sandbox.container.reload()
+            return sandbox.container.status == "running"
+        except Exception:
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    sandbox = self._idle.pop()
+                    self.stats["hits"] += 1
+                    break
+
+                if self._total < self.max_size:
+                    # Reserve the slot before releasing the lock to create the container
+                    self._total += 1
+                    self.stats["misses"] += 1
+                    sandbox = None
+                    break
+
+                remaining = self.acquire_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise PoolExhausted(f"No sandbox available for {self.image}")
+
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - started
+            if waited:
+                self.stats["wait_seconds_total"] += wait_time
+                self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], wait_time)
+
+        if sandbox is not None:
+            return sandbox
+
+        try:
+            sandbox = self._create()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.stats["created"] += 1
+        return sandbox
+
+    def release(self, sandbox, recycle=False):
+        sandbox.uses += 1
+        sandbox.last_used = time.monotonic()
+
+        # Dirty sandboxes (timeouts, crashes, worn out) are replaced instead of reset
+        if not recycle and sandbox.uses < self.max_uses:
+            try:
+                exit_code, _ = sandbox.container.exec_run(self.RESET_COMMAND, workdir="/")
+                recycle = exit_code != 0
+            except Exception:
+                recycle = True
+
+        if recycle:
+            self._destroy(sandbox)
+            with self._cond:
+                self._total -= 1
+                self.stats["recycled"] += 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append(sandbox)
+            self._cond.notify()
+
+    def maintain(self):
+        now = time.monotonic()
+
+        # Evict sandboxes idle past the TTL, always keeping min_size warm
+        with self._cond:
+            candidates = list(self._idle)
+            self._idle.clear()
+
+        keep, drop = [], []
+        evicted = unhealthy = 0
+        for sandbox in candidates:
+            expired = now - sandbox.last_used > self.idle_ttl
+            if expired and len(candidates) - len(drop) > self.min_size:
+                drop.append(sandbox)
+                evicted += 1
+            elif not self._is_healthy(sandbox):
+                drop.append(sandbox)
+                unhealthy += 1
+            else:
+                keep.append(sandbox)
+
+        for sandbox in drop:
+            self._destroy(sandbox)
+
+        with self._cond:
+            self.stats["evicted"] += evicted
+            self.stats["health_failures"] += unhealthy
+            self._total -= len(drop)
+            self._idle.extendleft(reversed(keep))
+            missing = max(0, min(self.min_size, self.max_size) - self._total)
+            self._total += missing
+            self._cond.notify_all()
+
+        # Top the pool back up to min_size
+        for _ in range(missing):
+            try:
+                sandbox = self._create()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                continue
+            with self._cond:
+                self.stats["created"] += 1
+                self._idle.append(sandbox)
+                self._cond.notify()
+
+    def drain(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+        for sandbox in idle:
+            self._destroy(sandbox)
+
+    def snapshot(self):
+        with self._cond:
+            data = dict(self.stats)
+            data.update({
+                "image": self.image,
+                "idle": len(self._idle),
+                "total": self._total,
+                "in_use": self._total - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / lookups, 3) if lookups else None
+        data["wait_seconds_avg"] = round(data["wait_seconds_total"] / data["waits"], 4) if data["waits"] else 0.0
+        return data
+
+
+class SandboxPoolManager:
+    def __init__(self, client, specs, maintain_interval=30, **pool_options):
+        # Label containers per process so we only ever clean up our own sandboxes
+        self.instance_id = uuid.uuid4().hex[:12]
+        labels = {"codesdev.sandbox": "1", "codesdev.pool": self.instance_id}
+
+        # One pool per spec (name -> image and container options). Limits are set when a container
+        # is created, so languages sharing an image but not a resource profile can't share a pool
+        self.pools = {
+            name: SandboxPool(client, spec["image"], container_options=spec.get("container_options"),
+                              labels=labels, **pool_options)
+            for name, spec in sorted(specs.items())
+        }
+        self.maintain_interval = maintain_interval
+        self.paused = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, name):
+        return self.pools[name]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sandbox-pool", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for pool in self.pools.values():
+                try:
+                    # A paused manager (its host is draining) lets idle sandboxes go instead of topping up
+                    if self.paused:
+                        pool.drain()
+                    else:
+                        pool.maintain()
+                except Exception:
+                    pass
+            self._stop.wait(self.maintain_interval)
+
+    def pause(self):
+        self.paused = True
+        for pool in self.pools.values():
+            pool.drain()
+
+    def resume(self):
+        self.paused = False
+
+    def shutdown(self):
+        self._stop.set()
+        for pool in self.pools.values():
+            pool.drain()
+
+    def snapshot(self):
+        return {name: pool.snapshot() for name, pool in self.pools.items()}
@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("JWT_SECRET_KEY", "test-" + "x" * 32)
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("CORS_ORIGIN", "http://localhost")
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    # Only for the SQLite stand-in, Postgres keeps real JSONB columns
+    return "JSON"
+
+
+@pytest.fixture
+def app():
+    from app import create_app
+    from extensions import db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "test.sqlite"),
+            "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30, "check_same_thread": False}},
+            "EXEC_QUEUE_SQLITE_PATH": ":memory:",
+            "AVATAR_DIR": os.path.join(tmp, "avatars"),
+            "BUILD_CACHE_DIR": os.path.join(tmp, "build-cache"),
+            "RUNTIME_PREFETCH": False,
+        })
+        with app.app_context():
+            db.create_all()
+        yield app
+        with app.app_context():
+            db.engine.dispose()
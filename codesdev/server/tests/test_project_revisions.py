@@ -0,0 +1,75 @@
+from app import apply_project_patch, apply_project_update, project_etag
+from extensions import db
+from models import Project, User
+
+
+def tree(content):
+    return [{"id": 1, "name": "main.py", "type": "file", "parent": None, "content": content}]
+
+
+def make_project(app):
+    with app.app_context():
+        user = User(username="ada", email="ada@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        project = Project(name="race", user_id=user.id, file_tree=[], revision=0)
+        db.session.add(project)
+        db.session.commit()
+        return project.id
+
+
+def etag(project_id):
+    row = db.session.get(Project, project_id)
+    return project_etag(row, True)
+
+
+def test_put_racing_a_patch_ends_with_distinct_revisions(app):
+    project_id = make_project(app)
+
+    with app.app_context():
+        # The PUT loads the project at revision 0...
+        put_project = db.session.get(Project, project_id)
+        assert put_project.revision == 0
+
+        # ...a PATCH based on revision 0 commits in between...
+        with app.app_context():
+            patch_project = db.session.get(Project, project_id)
+            body, status = apply_project_patch(patch_project, {
+                "base_revision": 0,
+                "ops": [{"op": "upsert", "id": 1, "name": "main.py", "content": "print('patch')"}],
+            })
+            assert status == 200
+            db.session.commit()
+            patch_revision, patch_etag = body["revision"], etag(project_id)
+
+        # ...then the PUT writes its tree on top
+        body, status = apply_project_update(put_project, {"file_tree": tree("print('put')")})
+        assert status == 200
+        db.session.commit()
+        put_revision, put_etag = body["revision"], etag(project_id)
+
+    assert patch_revision == 1
+    assert put_revision == 2
+    assert patch_etag != put_etag
+
+
+def test_patch_after_a_racing_put_conflicts(app):
+    project_id = make_project(app)
+
+    with app.app_context():
+        patch_project = db.session.get(Project, project_id)
+
+        with app.app_context():
+            put_project = db.session.get(Project, project_id)
+            body, status = apply_project_update(put_project, {"file_tree": tree("print('put')")})
+            db.session.commit()
+            assert (status, body["revision"]) == (200, 1)
+
+        # The PATCH still holds revision 0, its conditional write misses instead of reusing revision 1
+        body, status = apply_project_patch(patch_project, {
+            "base_revision": 0,
+            "ops": [{"op": "upsert", "id": 1, "name": "main.py", "content": "print('patch')"}],
+        })
+        db.session.rollback()
+        assert status == 409
+        assert body["revision"] == 1
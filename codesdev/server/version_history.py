@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, text, exists, or_, and_
+from sqlalchemy.orm import aliased
+
+# Versions are stored as keyframes (a full skeleton, base_id = None) or as deltas against the
+# project's previous version. Deltas flatten the tree into one entry per node so that only the
+# nodes that changed between checkpoints are written:
+#   {"upsert": [{...node fields, "_p": structural parent id, "_i": position}], "delete": [ids]}
+
+
+def flatten(skeleton):
+    # Returns {id: entry} or None when ids aren't unique (such trees are always stored as keyframes)
+    flat = {}
+    stack = [(None, skeleton or [])]
+    while stack:
+        parent_id, items = stack.pop()
+        for position, node in enumerate(items):
+            if node['id'] in flat:
+                return None
+            entry = {key: value for key, value in node.items() if key != 'children'}
+            entry['_p'] = parent_id
+            entry['_i'] = position
+            flat[node['id']] = entry
+            if node.get('type') == 'folder':
+                stack.append((node['id'], node.get('children') or []))
+    return flat
+
+
+def unflatten(flat):
+    children = {}
+    for entry in flat.values():
+        children.setdefault(entry['_p'], []).append(entry)
+
+    def build(parent_id):
+        nodes = []
+        for entry in sorted(children.get(parent_id, []), key=lambda e: e['_i']):
+            node = {key: value for key, value in entry.items() if key not in ('_p', '_i')}
+            if node.get('type') == 'folder':
+                node['children'] = build(node['id'])
+            nodes.append(node)
+        return nodes
+
+    return build(None)
+
+
+def diff(old_flat, new_flat):
+    return {
+        "upsert": [entry for node_id, entry in new_flat.items() if old_flat.get(node_id) != entry],
+        "delete": [node_id for node_id in old_flat if node_id not in new_flat],
+    }
+
+
+def apply_delta(flat, delta):
+    flat = dict(flat)
+    for node_id in delta.get('delete', []):
+        flat.pop(node_id, None)
+    for entry in delta.get('upsert', []):
+        flat[entry['id']] = entry
+    return flat
+
+
+class VersionStore:
+    def __init__(self, db, version_model, keyframe_interval=20, cache_size=256):
+        self.db = db
+        self.version_model = version_model
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+
+        # version id -> flattened skeleton, versions never change once written
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "keyframes": 0, "deltas": 0}
+
+    def _cache_get(self, version_id):
+        with self._lock:
+            flat = self._cache.get(version_id)
+            if flat is None:
+                self.stats["misses"] += 1
+                return None
+            self._cache.move_to_end(version_id)
+            self.stats["hits"] += 1
+            return flat
+
+    def _cache_put(self, version_id, flat):
+        with self._lock:
+            self._cache[version_id] = flat
+            self._cache.move_to_end(version_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _flat(self, version):
+        cached = self._cache_get(version.id)
+        if cached is not None:
+            return cached
+
+        # Walk back to the nearest keyframe (or cached version), then replay the deltas forward
+        Version = self.version_model
+        chain = [version]
+        base = None
+        while chain[-1].base_id is not None:
+            base = self._cache_get(chain[-1].base_id)
+            if base is not None:
+                break
+            chain.append(self.db.session.get(Version, chain[-1].base_id))
+
+        if base is None:
+            keyframe = chain.pop()
+            base = flatten(keyframe.file_tree_snapshot)
+            if base is None:
+                return None
+            self._cache_put(keyframe.id, base)
+
+        for link in reversed(chain):
+            base = apply_delta(base, link.file_tree_snapshot)
+            self._cache_put(link.id, base)
+        return base
+
+    def snapshot(self, version):
+        # Full skeleton for a version, keyframes are returned as stored
+        if version.base_id is None:
+            return version.file_tree_snapshot
+        return unflatten(self._flat(version))
+
+    def create(self, project_id, skeleton, label=None):
+        Version = self.version_model
+        previous = self.db.session.scalar(
+            select(Version)
+            .where(Version.project_id == project_id)
+            .order_by(Version.created_at.desc(), Version.id.desc())
+            .limit(1)
+        )
+
+        # A keyframe every keyframe_interval versions bounds how many deltas a rebuild replays
+        new_flat = flatten(skeleton)
+        keyframe = previous is None or new_flat is None or previous.depth + 1 >= self.keyframe_interval
+        previous_flat = None if keyframe else self._flat(previous)
+        if previous_flat is None:
+            keyframe = True
+
+        if keyframe:
+            version = Version(project_id=project_id, file_tree_snapshot=skeleton, label=label, base_id=None, depth=0)
+            self.stats["keyframes"] += 1
+        else:
+            version = Version(
+                project_id=project_id,
+                file_tree_snapshot=diff(previous_flat, new_flat),
+                label=label,
+                base_id=previous.id,
+                depth=previous.depth + 1
+            )
+            self.stats["deltas"] += 1
+
+        self.db.session.add(version)
+        self.db.session.flush()
+        if new_flat is not None:
+            self._cache_put(version.id, new_flat)
+        return version
+
+    def compact(self, cutoff):
+        # Delete unlabeled autosaves older than the cutoff, turning any surviving version that
+        # depends on a deleted one into a keyframe first so its chain stays intact. A project's latest
+        # version is never deleted, it's the one a concurrent create diffs against. Should a create
+        # still land on a doomed base, the base_id foreign key fails one of the two transactions
+        Version = self.version_model
+        newer = aliased(Version)
+        has_newer = exists().where(
+            newer.project_id == Version.project_id,
+            or_(newer.created_at > Version.created_at,
+                and_(newer.created_at == Version.created_at, newer.id > Version.id))
+        )
+        doomed = set(self.db.session.scalars(
+            select(Version.id).where(Version.label == None, Version.created_at < cutoff, has_newer)
+        ))
+        if not doomed:
+            return 0
+
+        dependents = self.db.session.scalars(
+            select(Version).where(Version.base_id.in_(doomed), Version.id.not_in(doomed))
+        ).all()
+        # Later versions keep their old depth, which only makes their next keyframe come sooner
+        for version in dependents:
+            version.file_tree_snapshot = unflatten(self._flat(version))
+            version.base_id = None
+            version.depth = 0
+
+        self.db.session.execute(delete(Version).where(Version.id.in_(doomed)))
+        self.db.session.commit()
+
+        with self._lock:
+            for version_id in doomed:
+                self._cache.pop(version_id, None)
+        return len(doomed)
+
+    def snapshot_stats(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["cached"] = len(self._cache)
+        return data
+
+
+class VersionCompactor:
+    # Runs VersionStore.compact in the background so autosaves don't pay for the cleanup
+    LOCK_KEY = 7_240_113  # Arbitrary advisory lock id, one compactor at a time across workers
+
+    def __init__(self, app, store, interval=600, retention_hours=24):
+        self.app = app
+        self.store = store
+        self.interval = interval
+        self.retention_hours = retention_hours
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_run = None
+        self.last_deleted = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="version-compactor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception as e:
+                self.app.logger.warning(f"Version compaction failed: {e}")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        session = self.store.db.session
+        if session.get_bind().dialect.name == 'postgresql':
+            if not session.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": self.LOCK_KEY}):
+                return 0
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        self.last_deleted = self.store.compact(cutoff)
+        self.last_run = time.time()
+        return self.last_deleted